@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Throughput benchmarks for the dataset generator and uploader hot paths.
+
+Run from the repo root:
+
+    python scripts/bench.py --out bench_before.json
+    python scripts/bench.py --compare bench_before.json --threshold 0.10
+
+Each benchmark reports the median and best seconds per operation over
+--repeat rounds. With --compare, any benchmark whose median got slower by
+more than --threshold (a fraction) is listed and the exit code is 1.
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import generate_dataset as gen
+import upload_mlflow_datasets as up
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+TOOL_SCHEMA_DIR = REPO_ROOT / "ToolSchema"
+
+# name -> (ops per round, zero-arg callable running one round)
+Benchmark = Tuple[int, Callable[[], None]]
+
+
+class _StubDataset:
+    def __init__(self, dataset_id: str) -> None:
+        self.dataset_id = dataset_id
+        self.records = 0
+
+    def merge_records(self, batch: List[Dict[str, object]]) -> None:
+        self.records += len(batch)
+
+
+class _StubClient:
+    """Minimal in-memory stand-in for MlflowClient's dataset API."""
+
+    def __init__(self) -> None:
+        self.datasets: Dict[str, _StubDataset] = {}
+        self.names: Dict[str, str] = {}
+
+    def search_datasets(self, experiment_ids, filter_string: str, max_results: int):
+        name = filter_string.split("'", 1)[1].rsplit("'", 1)[0]
+        dataset_id = self.names.get(name)
+        return [self.datasets[dataset_id]] if dataset_id is not None else []
+
+    def get_dataset(self, dataset_id: str) -> _StubDataset:
+        return self.datasets[dataset_id]
+
+    def delete_dataset(self, dataset_id: str) -> None:
+        self.datasets.pop(dataset_id)
+        self.names = {k: v for k, v in self.names.items() if v != dataset_id}
+
+    def create_dataset(self, name: str, experiment_id: str, tags: Dict[str, object]) -> _StubDataset:
+        ds = _StubDataset(f"stub-{len(self.datasets)}")
+        self.datasets[ds.dataset_id] = ds
+        self.names[name] = ds.dataset_id
+        return ds
+
+
+def _sample_contexts(schemas: gen.ToolSchemaSet, n: int) -> List[Dict[str, Any]]:
+    rng = random.Random(7)
+    contexts = []
+    for bucket in gen.plan_buckets(n):
+        sample = gen.generate_sample(rng, schemas.tools_payload, schemas.context_validators, schemas.action_plans, bucket)
+        user = sample["messages"][1]["content"]
+        contexts.append(json.loads(user.split("SENSOR_CONTEXT=", 1)[1]))
+    return contexts
+
+
+def build_benchmarks(samples: int, workdir: Path) -> Dict[str, Benchmark]:
+    schemas = gen.load_tool_schema_set(str(TOOL_SCHEMA_DIR))
+    context_tools = {t["function"]["name"]: t["function"]["parameters"] for t in gen.load_json(str(TOOL_SCHEMA_DIR / "Context_tool_schema.json"))}
+    contexts = _sample_contexts(schemas, 500)
+    context_items = [(name, params) for ctx in contexts for name, params in ctx.items()]
+    bucket_list = gen.plan_buckets(samples)
+    random.Random(3).shuffle(bucket_list)
+
+    rng = random.Random(11)
+    generated = [
+        gen.generate_sample(rng, schemas.tools_payload, schemas.context_validators, schemas.action_plans, bucket)
+        for bucket in bucket_list[:500]
+    ]
+    encoder = gen.SampleLineEncoder(schemas.tools_payload)
+
+    dataset_file = workdir / "bench.jsonl"
+    with gen.open_jsonl_writer(str(dataset_file)) as f:
+        gen.write_samples(f, random.Random(5), schemas, bucket_list, None, 30)
+    records_in = [json.loads(line) for line in dataset_file.read_text(encoding="utf-8").splitlines()[:500]]
+
+    def bench_generate_sample() -> None:
+        r = random.Random(1)
+        for bucket in bucket_list[:500]:
+            gen.generate_sample(r, schemas.tools_payload, schemas.context_validators, schemas.action_plans, bucket)
+
+    def bench_validate_value() -> None:
+        for name, params in context_items:
+            gen.validate_value(params, context_tools[name], name)
+
+    def bench_compiled_validators() -> None:
+        validators = schemas.context_validators
+        for name, params in context_items:
+            validators[name](params, name)
+
+    def bench_decide_primary_risk() -> None:
+        for ctx in contexts:
+            gen.decide_primary_risk(ctx)
+
+    def bench_json_dumps_one_line() -> None:
+        for sample in generated:
+            gen.json_dumps_one_line(sample)
+
+    def bench_sample_line_encoder() -> None:
+        for sample in generated:
+            encoder.encode(sample)
+
+    def bench_build_dataset_record() -> None:
+        for sample in records_in:
+            up.build_dataset_record(sample, include_tools=True)
+
+    def bench_e2e_generate() -> None:
+        with gen.open_jsonl_writer(str(workdir / "e2e.jsonl")) as f:
+            gen.write_samples(f, random.Random(9), schemas, bucket_list, None, 30)
+
+    def bench_e2e_generate_vectorized() -> None:
+        with gen.open_jsonl_writer(str(workdir / "e2e_vectorized.jsonl")) as f:
+            gen.write_samples(f, random.Random(9), schemas, bucket_list, None, 30, engine="vectorized")
+
+    def bench_e2e_register() -> None:
+        up.register_evaluation_dataset(
+            client=_StubClient(),
+            experiment_id="bench",
+            name_prefix="bench",
+            dataset_file=dataset_file,
+            batch_size=200,
+            include_tools=True,
+            if_exists="error",
+            fingerprints=up.FingerprintCache(None),
+        )
+
+    benchmarks: Dict[str, Benchmark] = {
+        "micro.generate_sample": (500, bench_generate_sample),
+        "micro.validate_value": (len(context_items), bench_validate_value),
+        "micro.compiled_validators": (len(context_items), bench_compiled_validators),
+        "micro.decide_primary_risk": (len(contexts), bench_decide_primary_risk),
+        "micro.json_dumps_one_line": (len(generated), bench_json_dumps_one_line),
+        "micro.sample_line_encoder": (len(generated), bench_sample_line_encoder),
+        "micro.build_dataset_record": (len(records_in), bench_build_dataset_record),
+        "e2e.generate_file": (samples, bench_e2e_generate),
+        "e2e.register_dataset": (samples, bench_e2e_register),
+    }
+    try:
+        gen.require_numpy()
+    except RuntimeError:
+        pass
+    else:
+        benchmarks["e2e.generate_file_vectorized"] = (samples, bench_e2e_generate_vectorized)
+    return benchmarks
+
+
+def run_benchmark(ops: int, fn: Callable[[], None], repeat: int) -> Dict[str, float]:
+    fn()  # warm-up
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        rounds.append(time.perf_counter() - started)
+    median = statistics.median(rounds) / ops
+    return {
+        "ops": ops,
+        "median_s_per_op": median,
+        "best_s_per_op": min(rounds) / ops,
+        "ops_per_s": 1.0 / median if median > 0 else 0.0,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    regressions = []
+    for name, result in current["benchmarks"].items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if base is None or base["median_s_per_op"] <= 0:
+            continue
+        change = result["median_s_per_op"] / base["median_s_per_op"] - 1.0
+        result["change_vs_baseline"] = round(change, 4)
+        if change > threshold:
+            regressions.append({"benchmark": name, "change": round(change, 4)})
+    return regressions
+
+
+def main() -> int:
+    p = argparse.ArgumentParser()
+    p.add_argument("--samples", type=int, default=2000, help="Samples per end-to-end benchmark")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--filter", default="", help="Only run benchmarks whose name contains this substring")
+    p.add_argument("--out", default="", help="Write results JSON here (default: stdout)")
+    p.add_argument("--compare", default="", help="Baseline results JSON from an earlier run")
+    p.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown vs --compare before failing")
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="aegis-bench-") as tmp:
+        benchmarks = build_benchmarks(args.samples, Path(tmp))
+        results: Dict[str, Any] = {}
+        for name, (ops, fn) in benchmarks.items():
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = run_benchmark(ops, fn, args.repeat)
+            print(f"{name:32s} {results[name]['ops_per_s']:>12.1f} ops/s", file=sys.stderr)
+
+    report: Dict[str, Any] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "samples": args.samples,
+        "repeat": args.repeat,
+        "benchmarks": results,
+    }
+
+    regressions: Optional[List[Dict[str, Any]]] = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report["regressions"] = regressions
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as out:
+            out.write(text + "\n")
+    else:
+        print(text)
+
+    if regressions:
+        for r in regressions:
+            print(f"REGRESSION: {r['benchmark']} is {r['change'] * 100:.1f}% slower", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
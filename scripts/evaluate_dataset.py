@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""Score a function-calling model against generated eval splits, offline.
+
+Each line's developer and user messages (and its tools) go to a predictor;
+the reply is compared with the line's assistant message:
+
+- call decision: did the model call a tool when one was expected, and stay
+  quiet when none was (accuracy, precision, recall)
+- tool names: the predicted set of tool names equals the expected one
+- arguments: per-argument agreement on calls matched by tool name, plus
+  whether each predicted call validates against the action tool schemas
+- exact match: same calls with the same arguments, in any order
+
+Predictors (pick one):
+
+    --http-url http://localhost:8000/v1/chat/completions   POST {"model", "messages", "tools"}
+    --callable mypkg.predict:predict                         predict(messages, tools) -> message
+    --replay preds/{split}.jsonl                             one recorded reply per dataset line
+
+A reply is an assistant message ({"content": ..., "tool_calls": [...]}) or a
+chat completion response whose choices[0].message is one. HTTP and callable
+predictions run in a thread pool with at most --concurrency requests in
+flight; lines are streamed and metrics are aggregated as they arrive, overall
+and per bucket / primary risk type (from the lines' "structured" field when
+generated with --structured, else from the <file>.labels sidecar).
+
+    python scripts/evaluate_dataset.py DataSet/eval_a.jsonl DataSet/eval_b.jsonl --replay preds/{split}.jsonl
+
+Prints a JSON report.
+"""
+import argparse
+import functools
+import importlib
+import json
+import os
+import sys
+import time
+import urllib.request
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import generate_dataset as gen
+import upload_mlflow_datasets as up
+
+
+MAX_EXAMPLES = 20
+UNKNOWN_LABEL = "unknown"
+
+# (messages sent to the model, tools) -> assistant message or chat completion response
+Predictor = Callable[[List[Dict[str, Any]], Optional[List[Dict[str, Any]]]], Any]
+
+# (tool name, arguments); arguments is None when they are not a JSON object
+ToolCall = Tuple[str, Optional[Dict[str, Any]]]
+
+
+def response_message(reply: Any) -> Dict[str, Any]:
+    """The assistant message in a predictor reply: a message, a chat completion, or plain text."""
+    if isinstance(reply, str):
+        return {"content": reply}
+    if not isinstance(reply, dict):
+        raise ValueError(f"reply is {type(reply).__name__}, expected an object")
+    choices = reply.get("choices")
+    if isinstance(choices, list) and choices and isinstance(choices[0], dict):
+        message = choices[0].get("message")
+        if isinstance(message, dict):
+            return message
+    return reply
+
+
+def tool_calls_of(message: Optional[Dict[str, Any]]) -> List[ToolCall]:
+    calls: List[ToolCall] = []
+    raw_calls = message.get("tool_calls") if message is not None else None
+    if not isinstance(raw_calls, list):
+        return calls
+    for call in raw_calls:
+        if not isinstance(call, dict):
+            continue
+        fn = call.get("function", call)  # accept bare {"name", "arguments"} calls too
+        if not isinstance(fn, dict) or not isinstance(fn.get("name"), str):
+            continue
+        args = fn.get("arguments", {})
+        if isinstance(args, str):
+            # OpenAI-style payloads carry arguments as a JSON string
+            try:
+                args = json.loads(args) if args.strip() else {}
+            except ValueError:
+                args = None
+        calls.append((fn["name"], args if isinstance(args, dict) else None))
+    return calls
+
+
+@dataclass
+class Score:
+    expected_call: bool
+    predicted_call: bool
+    names_exact: bool
+    exact: bool
+    expected_calls: int
+    predicted_calls: int
+    matched_calls: int  # predicted calls paired with an expected call of the same name
+    schema_valid_calls: int
+    args_total: int  # argument keys on either side of the matched calls
+    args_matched: int
+
+
+def score_prediction(schemas: gen.ToolSchemaSet, expected: List[ToolCall], predicted: List[ToolCall]) -> Score:
+    schema_valid = 0
+    for name, args in predicted:
+        validate = schemas.action_validators.get(name)
+        if validate is None or args is None:
+            continue
+        try:
+            validate(args, "action:" + name)
+        except gen.SchemaError:
+            continue
+        schema_valid += 1
+
+    unmatched = list(expected)
+    matched = args_total = args_matched = 0
+    all_args_equal = True
+    for name, args in predicted:
+        j = next((j for j, (expected_name, _) in enumerate(unmatched) if expected_name == name), None)
+        if j is None:
+            continue
+        _, expected_args = unmatched.pop(j)
+        matched += 1
+        got = args or {}
+        want = expected_args or {}
+        keys = set(got) | set(want)
+        equal = sum(1 for k in keys if k in got and k in want and got[k] == want[k])
+        args_total += len(keys)
+        args_matched += equal
+        all_args_equal = all_args_equal and args is not None and equal == len(keys)
+
+    names_exact = Counter(name for name, _ in expected) == Counter(name for name, _ in predicted)
+    return Score(
+        expected_call=bool(expected),
+        predicted_call=bool(predicted),
+        names_exact=names_exact,
+        exact=names_exact and all_args_equal,
+        expected_calls=len(expected),
+        predicted_calls=len(predicted),
+        matched_calls=matched,
+        schema_valid_calls=schema_valid,
+        args_total=args_total,
+        args_matched=args_matched,
+    )
+
+
+def _ratio(num: int, den: int) -> Optional[float]:
+    return round(num / den, 4) if den else None
+
+
+@dataclass
+class EvalMetrics:
+    records: int = 0
+    errors: int = 0  # predictor failures, scored as an empty reply
+    call_tp: int = 0
+    call_fp: int = 0
+    call_fn: int = 0
+    call_tn: int = 0
+    names_exact: int = 0
+    exact: int = 0
+    expected_calls: int = 0
+    predicted_calls: int = 0
+    matched_calls: int = 0
+    schema_valid_calls: int = 0
+    args_total: int = 0
+    args_matched: int = 0
+    latency_ms: gen.QuantileSketch = field(default_factory=gen.QuantileSketch)
+
+    def add(self, score: Score, latency_ms: Optional[float], error: bool) -> None:
+        self.records += 1
+        self.errors += error
+        if score.expected_call:
+            if score.predicted_call:
+                self.call_tp += 1
+            else:
+                self.call_fn += 1
+        elif score.predicted_call:
+            self.call_fp += 1
+        else:
+            self.call_tn += 1
+        self.names_exact += score.names_exact
+        self.exact += score.exact
+        self.expected_calls += score.expected_calls
+        self.predicted_calls += score.predicted_calls
+        self.matched_calls += score.matched_calls
+        self.schema_valid_calls += score.schema_valid_calls
+        self.args_total += score.args_total
+        self.args_matched += score.args_matched
+        if latency_ms is not None:
+            self.latency_ms.add(latency_ms)
+
+    def to_json(self) -> Dict[str, Any]:
+        report: Dict[str, Any] = {
+            "records": self.records,
+            "errors": self.errors,
+            "call_decision": {
+                "accuracy": _ratio(self.call_tp + self.call_tn, self.records),
+                "precision": _ratio(self.call_tp, self.call_tp + self.call_fp),
+                "recall": _ratio(self.call_tp, self.call_tp + self.call_fn),
+                "tp": self.call_tp,
+                "fp": self.call_fp,
+                "fn": self.call_fn,
+                "tn": self.call_tn,
+            },
+            "tool_name_exact": _ratio(self.names_exact, self.records),
+            "exact_match": _ratio(self.exact, self.records),
+            "calls": {
+                "expected": self.expected_calls,
+                "predicted": self.predicted_calls,
+                "matched": self.matched_calls,
+                "precision": _ratio(self.matched_calls, self.predicted_calls),
+                "recall": _ratio(self.matched_calls, self.expected_calls),
+                "schema_valid": _ratio(self.schema_valid_calls, self.predicted_calls),
+            },
+            "argument_accuracy": _ratio(self.args_matched, self.args_total),
+        }
+        if self.latency_ms.count:
+            report["latency_ms"] = self.latency_ms.to_json()
+        return report
+
+
+@dataclass
+class EvalRecord:
+    line: int
+    messages: List[Dict[str, Any]]  # everything before the expected assistant reply
+    tools: Optional[List[Dict[str, Any]]]
+    expected: List[ToolCall]
+    bucket: str
+    risk_type: str
+
+
+def iter_eval_records(path: Path, limit: Optional[int]) -> Iterator[EvalRecord]:
+    """Stream a split's lines with their expected calls and bucket / risk labels."""
+    tools_dictionary = up.tools_dictionary_for(path)
+    labels_path = Path(str(path) + gen.LABELS_SUFFIX)
+    labels_file = labels_path.open("r", encoding="utf-8") if labels_path.is_file() else None
+    try:
+        with up.open_decoded(path) as f:
+            line_no = 0
+            for raw in f:
+                if not raw.strip():
+                    continue
+                if limit is not None and line_no >= limit:
+                    return
+                labels = labels_file.readline().rstrip("\n").split("\t") if labels_file is not None else []
+                sample = up.json_loads(raw)
+                messages = sample.get("messages") if isinstance(sample, dict) else None
+                if not isinstance(messages, list) or len(messages) < 2:
+                    raise ValueError(f"{path}:{line_no + 1}: record has no messages")
+                last = messages[-1]
+                expected_message = last if isinstance(last, dict) and last.get("role") == "assistant" else None
+                tools = sample.get("tools")
+                tools_ref = sample.get("tools_ref")
+                if tools is None and isinstance(tools_ref, str):
+                    tools = tools_dictionary.resolve(tools_ref)
+
+                bucket = labels[0] if len(labels) == len(gen.LABEL_FIELDS) else UNKNOWN_LABEL
+                risk_type = labels[1] if len(labels) == len(gen.LABEL_FIELDS) else UNKNOWN_LABEL
+                structured = sample.get(gen.STRUCTURED_FIELD)
+                if isinstance(structured, dict):
+                    bucket = str(structured.get("bucket", bucket))
+                    decision = structured.get("risk_decision")
+                    risk_type = str(decision.get("risk_type")) if isinstance(decision, dict) else gen.LABEL_NONE
+
+                yield EvalRecord(
+                    line=line_no,
+                    messages=messages[:-1] if expected_message is not None else messages,
+                    tools=tools,
+                    expected=tool_calls_of(expected_message),
+                    bucket=bucket,
+                    risk_type=risk_type,
+                )
+                line_no += 1
+    finally:
+        if labels_file is not None:
+            labels_file.close()
+
+
+# (assistant message or None on failure, latency in ms or None for replayed replies, error message)
+Prediction = Tuple[Optional[Dict[str, Any]], Optional[float], Optional[str]]
+
+
+def _timed_predict(predictor: Predictor, record: EvalRecord) -> Prediction:
+    started = time.perf_counter()
+    try:
+        message = response_message(predictor(record.messages, record.tools))
+    except Exception as e:  # a failing request is scored, not fatal
+        return None, (time.perf_counter() - started) * 1000, f"{type(e).__name__}: {e}"
+    return message, (time.perf_counter() - started) * 1000, None
+
+
+def predict_concurrently(
+    pool: ThreadPoolExecutor, predictor: Predictor, records: Iterator[EvalRecord], window: int
+) -> Iterator[Tuple[EvalRecord, Prediction]]:
+    """Predict with at most `window` requests submitted ahead and yield results in line order."""
+    pending: Deque[Tuple[EvalRecord, "Future[Prediction]"]] = deque()
+    for record in records:
+        pending.append((record, pool.submit(_timed_predict, predictor, record)))
+        if len(pending) >= window:
+            record, fut = pending.popleft()
+            yield record, fut.result()
+    while pending:
+        record, fut = pending.popleft()
+        yield record, fut.result()
+
+
+def replay_predictions(path: Path, records: Iterator[EvalRecord]) -> Iterator[Tuple[EvalRecord, Prediction]]:
+    """Pair each record with the reply on the same (non-empty) line of a recorded predictions file."""
+    with up.open_decoded(path) as f:
+        replies = (raw for raw in f if raw.strip())
+        for record in records:
+            raw = next(replies, None)
+            if raw is None:
+                yield record, (None, None, f"{path} has no prediction for line {record.line + 1}")
+                continue
+            try:
+                yield record, (response_message(up.json_loads(raw)), None, None)
+            except ValueError as e:
+                yield record, (None, None, f"{path}:{record.line + 1}: {e}")
+
+
+class HttpPredictor:
+    """POSTs {"model", "messages", "tools"} as JSON and returns the decoded response."""
+
+    def __init__(self, url: str, model: str, timeout: float) -> None:
+        self.url = url
+        self.model = model
+        self.timeout = timeout
+
+    def __call__(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]]) -> Any:
+        body: Dict[str, Any] = {"model": self.model, "messages": messages}
+        if tools is not None:
+            body["tools"] = tools
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(body, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.load(response)
+
+
+def load_callable(spec: str) -> Predictor:
+    """module:function -> the function; modules are importable from the working directory."""
+    module_name, sep, attr = spec.partition(":")
+    if not sep or not module_name or not attr:
+        raise ValueError(f"--callable {spec!r}: expected module:function")
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    fn = getattr(importlib.import_module(module_name), attr, None)
+    if not callable(fn):
+        raise ValueError(f"--callable {spec!r}: {attr} is not a callable in {module_name}")
+    return fn
+
+
+def evaluate_file(
+    schemas: gen.ToolSchemaSet,
+    path: Path,
+    predictions: Callable[[Iterator[EvalRecord]], Iterator[Tuple[EvalRecord, Prediction]]],
+    *,
+    limit: Optional[int],
+    max_examples: int,
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    overall = EvalMetrics()
+    by_bucket: Dict[str, EvalMetrics] = {}
+    by_risk_type: Dict[str, EvalMetrics] = {}
+    errors: List[Dict[str, Any]] = []
+    for record, (message, latency_ms, error) in predictions(iter_eval_records(path, limit)):
+        score = score_prediction(schemas, record.expected, tool_calls_of(message))
+        failed = error is not None
+        overall.add(score, latency_ms, failed)
+        by_bucket.setdefault(record.bucket, EvalMetrics()).add(score, latency_ms, failed)
+        by_risk_type.setdefault(record.risk_type, EvalMetrics()).add(score, latency_ms, failed)
+        if failed and len(errors) < max_examples:
+            errors.append({"line": record.line + 1, "message": error})
+    elapsed = time.perf_counter() - started
+
+    result: Dict[str, Any] = {"file": str(path), "split": up.split_name(path)}
+    result.update(overall.to_json())
+    result["by_bucket"] = {name: by_bucket[name].to_json() for name in sorted(by_bucket)}
+    result["by_risk_type"] = {name: by_risk_type[name].to_json() for name in sorted(by_risk_type)}
+    result["error_examples"] = errors
+    result["elapsed_s"] = round(elapsed, 3)
+    result["records_per_s"] = round(overall.records / elapsed, 1) if elapsed > 0 else 0.0
+    return result
+
+
+def main() -> int:
+    repo_root = Path(__file__).resolve().parent.parent
+    p = argparse.ArgumentParser()
+    p.add_argument("files", nargs="+", help="Eval JSONL files (.jsonl, .jsonl.gz, .jsonl.zst)")
+    predictor_group = p.add_mutually_exclusive_group(required=True)
+    predictor_group.add_argument("--http-url", default="", help="Chat endpoint to POST each request to")
+    predictor_group.add_argument("--callable", default="", help="module:function called as fn(messages, tools)")
+    predictor_group.add_argument(
+        "--replay", default="", help="Recorded replies, one JSON per dataset line; {split} is replaced per file"
+    )
+    p.add_argument("--model", default="", help="Model name sent with --http-url requests")
+    p.add_argument("--timeout", type=float, default=60.0, help="Seconds per --http-url request")
+    p.add_argument("--concurrency", type=int, default=8, help="Predictions in flight at once")
+    p.add_argument("--limit", type=int, default=0, help="Only score the first N lines of each file (0 = all)")
+    p.add_argument("--tool-schema-dir", default=str(repo_root / "ToolSchema"))
+    p.add_argument("--max-examples", type=int, default=MAX_EXAMPLES, help="Predictor errors kept per file")
+    args = p.parse_args()
+
+    if args.concurrency < 1:
+        p.error("--concurrency must be >= 1")
+    if args.limit < 0:
+        p.error("--limit must be >= 0")
+    paths = [Path(f) for f in args.files]
+    for path in paths:
+        if not path.is_file():
+            p.error(f"not a file: {path}")
+        if up.compression_of(path) == "zstd":
+            try:
+                gen.require_zstandard()
+            except RuntimeError as e:
+                p.error(str(e))
+    if args.replay and len(paths) > 1 and "{split}" not in args.replay:
+        p.error("--replay needs a {split} placeholder when scoring more than one file")
+
+    predictor: Optional[Predictor] = None
+    if args.http_url:
+        predictor = HttpPredictor(args.http_url, args.model, args.timeout)
+    elif args.callable:
+        try:
+            predictor = load_callable(args.callable)
+        except (ImportError, ValueError) as e:
+            p.error(str(e))
+
+    schemas = gen.load_tool_schema_set(args.tool_schema_dir)
+    limit = args.limit or None
+    results = []
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for path in paths:
+            if predictor is not None:
+                predictions = functools.partial(predict_concurrently, pool, predictor, window=args.concurrency)
+            else:
+                replay_path = Path(args.replay.replace("{split}", up.split_name(path)))
+                if not replay_path.is_file():
+                    p.error(f"--replay: not a file: {replay_path}")
+                predictions = functools.partial(replay_predictions, replay_path)
+            results.append(evaluate_file(schemas, path, predictions, limit=limit, max_examples=args.max_examples))
+
+    print(json.dumps({"results": results}, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,11 +1,24 @@
 #!/usr/bin/env python3
 import argparse
+import bisect
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
 import json
+import math
 import os
 import random
 import re
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+import shutil
+import sys
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
 
 
 JSONType = Any
@@ -20,6 +33,162 @@ def json_dumps_one_line(obj: Any) -> str:
     return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
 
 
+COMPRESSION_SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def require_zstandard():
+    try:
+        import zstandard  # type: ignore
+    except ImportError as e:
+        raise RuntimeError("zstd compression requires the zstandard package. Install first: pip install zstandard") from e
+    return zstandard
+
+
+@contextmanager
+def open_jsonl_writer(path: str, compress: str = "none", append: bool = False) -> Iterator[BinaryIO]:
+    """Open a buffered binary writer for a JSONL file, optionally compressed.
+
+    gzip output uses mtime=0 and no embedded filename so identical content
+    always produces identical bytes. Compressed streams can be concatenated,
+    so append=True adds a new gzip member / zstd frame after the existing data.
+    """
+    with open(path, "ab" if append else "wb") as raw:
+        if compress == "none":
+            stream = raw
+        elif compress == "gzip":
+            stream = gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0)
+        elif compress == "zstd":
+            stream = require_zstandard().ZstdCompressor().stream_writer(raw, closefd=False, write_return_read=True)
+        else:
+            raise ValueError(compress)
+        with io.BufferedWriter(stream, WRITE_BUFFER_SIZE) as f:
+            yield f
+
+
+@contextmanager
+def open_jsonl_reader(path: str, compress: str = "none") -> Iterator[BinaryIO]:
+    """Open a buffered binary reader for a JSONL file written by open_jsonl_writer."""
+    with open(path, "rb") as raw:
+        if compress == "none":
+            stream = raw
+        elif compress == "gzip":
+            stream = gzip.GzipFile(mode="rb", fileobj=raw)
+        elif compress == "zstd":
+            stream = require_zstandard().ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=False)
+        else:
+            raise ValueError(compress)
+        with io.BufferedReader(stream, WRITE_BUFFER_SIZE) as f:
+            yield f
+
+
+# <split>.jsonl[.gz|.zst] + INDEX_SUFFIX: line offsets for random access
+INDEX_SUFFIX = ".idx"
+INDEX_FLUSH_ENTRIES = 65536
+
+
+class LineIndexWriter:
+    """Writes a JSONL line index: little-endian uint64 offsets, 0 then the end of every line.
+
+    Line i spans [offsets[i], offsets[i + 1]) of the uncompressed JSONL, so an
+    index of n lines holds n + 1 entries, the last one being the data size.
+    New lines only add entries, so an index grows by appending like its file.
+    """
+
+    def __init__(self, f: BinaryIO, append: bool) -> None:
+        self._f = f
+        self._ends = array("Q")
+        # added to every end from add(); --extend and later shards continue after earlier lines
+        self.base = 0
+        if not append:
+            self._ends.append(0)
+
+    def add(self, end: int) -> None:
+        self._ends.append(self.base + end)
+        if len(self._ends) >= INDEX_FLUSH_ENTRIES:
+            self._flush()
+
+    def append_from(self, path: str, base: int) -> None:
+        """Append another index's lines, shifted to start at byte `base`."""
+        ends = array("Q")
+        with open(path, "rb") as f:
+            ends.frombytes(f.read())
+        if sys.byteorder == "big":
+            ends.byteswap()
+        self._flush()
+        self._ends.extend(base + end for end in ends[1:])
+
+    def _flush(self) -> None:
+        if sys.byteorder == "big":
+            self._ends.byteswap()
+        self._f.write(self._ends.tobytes())
+        del self._ends[:]
+
+    def close(self) -> None:
+        self._flush()
+
+
+@contextmanager
+def open_line_index_writer(path: str, append: bool = False) -> Iterator[LineIndexWriter]:
+    with open(path, "ab" if append else "wb") as f:
+        writer = LineIndexWriter(f, append)
+        yield writer
+        writer.close()
+
+
+_SAMPLE_KEYS = ("metadata", "tools", "messages")
+
+TOOLS_DICTIONARY_FILE = "tools.json"
+
+
+def tools_ref_for(tools_payload: List[Dict[str, Any]]) -> str:
+    return hashlib.sha256(json_dumps_one_line(tools_payload).encode("utf-8")).hexdigest()
+
+
+def write_tools_dictionary(path: str, tools_payload: List[Dict[str, Any]]) -> str:
+    # tools.json maps content hash -> tools array; existing entries are kept so
+    # files generated against older schemas still resolve.
+    tools: Dict[str, Any] = load_json(path) if os.path.exists(path) else {}
+    ref = tools_ref_for(tools_payload)
+    tools[ref] = tools_payload
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json_dumps_one_line(tools) + "\n")
+    return ref
+
+
+class SampleLineEncoder:
+    """JSONL encoder for samples that share one tools payload.
+
+    The tools array is serialized once and spliced into each line; the result
+    is byte-identical to json_dumps_one_line(sample). With tools_ref set, the
+    array is replaced by a "tools_ref" key pointing into tools.json.
+    """
+
+    def __init__(self, tools_payload: List[Dict[str, Any]], *, tools_ref: Optional[str] = None) -> None:
+        self._tools = tools_payload
+        self._tools_json = json_dumps_one_line(tools_payload)
+        if tools_ref is None:
+            self._tools_field = ',"tools":' + self._tools_json
+        else:
+            self._tools_field = ',"tools_ref":' + json_dumps_one_line(tools_ref)
+
+    def bytes_saved_per_line(self) -> int:
+        return len((',"tools":' + self._tools_json).encode("utf-8")) - len(self._tools_field.encode("utf-8"))
+
+    def encode(self, sample: Dict[str, Any]) -> str:
+        if sample.get("tools") is not self._tools or tuple(sample) != _SAMPLE_KEYS:
+            return json_dumps_one_line(sample)
+        return (
+            '{"metadata":'
+            + json_dumps_one_line(sample["metadata"])
+            + self._tools_field
+            + ',"messages":'
+            + json_dumps_one_line(sample["messages"])
+            + "}"
+        )
+
+
 class SchemaError(ValueError):
     pass
 
@@ -104,6 +273,127 @@ def validate_value(value: Any, schema: Dict[str, Any], path: str) -> None:
     raise SchemaError(f"{path}: unknown schema type {t}")
 
 
+Validator = Callable[[Any, str], None]
+
+
+class _SchemaViolation(Exception):
+    # Raised by compiled checks; path segments are collected while unwinding
+    # so nothing is formatted unless validation actually fails.
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+        self.message = message
+        self.segments: List[str] = []
+
+    def render(self, path: str) -> str:
+        return f"{path}{''.join(reversed(self.segments))}: {self.message}"
+
+
+def _compile_node(schema: Dict[str, Any]) -> Callable[[Any], None]:
+    t = schema.get("type")
+    if t == "OBJECT":
+        props: Dict[str, Callable[[Any], None]] = {k: _compile_node(v) for k, v in schema.get("properties", {}).items()}
+        required: Tuple[str, ...] = tuple(schema.get("required", []))
+        closed = schema.get("additionalProperties", True) is False
+
+        def check_object(value: Any) -> None:
+            if not isinstance(value, dict):
+                raise _SchemaViolation("expected OBJECT")
+            for k in required:
+                if k not in value:
+                    raise _SchemaViolation(f"missing required '{k}'")
+            if closed:
+                extra = [k for k in value if k not in props]
+                if extra:
+                    raise _SchemaViolation(f"additionalProperties=false, extra keys {extra}")
+            for k, v in value.items():
+                check = props.get(k)
+                if check is None:
+                    continue
+                try:
+                    check(v)
+                except _SchemaViolation as e:
+                    e.segments.append(f".{k}")
+                    raise
+
+        return check_object
+
+    if t == "ARRAY":
+        item_schema = schema.get("items")
+        check_item = _compile_node(item_schema) if item_schema is not None else None
+
+        def check_array(value: Any) -> None:
+            if not isinstance(value, list):
+                raise _SchemaViolation("expected ARRAY")
+            if check_item is None:
+                return
+            for i, item in enumerate(value):
+                try:
+                    check_item(item)
+                except _SchemaViolation as e:
+                    e.segments.append(f"[{i}]")
+                    raise
+
+        return check_array
+
+    if t == "STRING":
+        enum_list = schema.get("enum")
+        enum: Optional[FrozenSet[str]] = frozenset(enum_list) if enum_list is not None else None
+        pattern_src = schema.get("pattern")
+        pattern = re.compile(pattern_src) if pattern_src is not None else None
+
+        def check_string(value: Any) -> None:
+            if not isinstance(value, str):
+                raise _SchemaViolation("expected STRING")
+            if enum is not None and value not in enum:
+                raise _SchemaViolation(f"value '{value}' not in enum {enum_list}")
+            if pattern is not None and pattern.match(value) is None:
+                raise _SchemaViolation(f"value '{value}' does not match pattern")
+
+        return check_string
+
+    if t == "BOOLEAN":
+
+        def check_boolean(value: Any) -> None:
+            if not isinstance(value, bool):
+                raise _SchemaViolation("expected BOOLEAN")
+
+        return check_boolean
+
+    if t in ("INTEGER", "NUMBER"):
+        minimum = schema.get("minimum")
+        maximum = schema.get("maximum")
+        accepted = int if t == "INTEGER" else (int, float)
+
+        def check_numeric(value: Any) -> None:
+            if not isinstance(value, accepted) or isinstance(value, bool):
+                raise _SchemaViolation(f"expected {t}")
+            if minimum is not None and value < minimum:
+                raise _SchemaViolation(f"{value} < minimum {minimum}")
+            if maximum is not None and value > maximum:
+                raise _SchemaViolation(f"{value} > maximum {maximum}")
+
+        return check_numeric
+
+    raise SchemaError(f"unknown schema type {t}")
+
+
+def compile_schema(schema: Dict[str, Any]) -> Validator:
+    """Compile a tool schema once into a validator equivalent to validate_value."""
+    check = _compile_node(schema)
+
+    def validate(value: Any, path: str) -> None:
+        try:
+            check(value)
+        except _SchemaViolation as e:
+            raise SchemaError(e.render(path)) from None
+
+    return validate
+
+
+def compile_tool_validators(schemas: Dict[str, Dict[str, Any]]) -> Dict[str, Validator]:
+    return {name: compile_schema(fn["parameters"]) for name, fn in schemas.items()}
+
+
 @dataclass(frozen=True)
 class RiskDecision:
     risk_type: str  # one of priority list
@@ -132,20 +422,36 @@ def confidence_to_tier(conf: float) -> str:
     return "none"
 
 
+CONFIDENCE_TIERS = ("full", "warning", "low", "none")
+
+# Generated confidences are always rounded to hundredths; index by round(conf * 100).
+_TIER_BY_HUNDREDTH: Tuple[str, ...] = tuple(confidence_to_tier(i / 100) for i in range(101))
+
+
+def tier_for_confidence(conf: float) -> str:
+    i = int(round(conf * 100))
+    if 0 <= i <= 100 and i / 100 == conf:
+        return _TIER_BY_HUNDREDTH[i]
+    return confidence_to_tier(conf)
+
+
 def choose_user_format(rng: random.Random) -> str:
     return "sensor_only" if rng.random() < 0.5 else "inquiry_plus_sensor"
 
 
+CONFIDENCE_RANGES: Dict[str, Tuple[float, float]] = {
+    "full": (0.9, 1.0),
+    "warning": (0.75, 0.89),
+    "low": (0.65, 0.74),
+    "none": (0.3, 0.64),
+}
+
+
 def pick_confidence(rng: random.Random, tier: str) -> float:
-    if tier == "full":
-        return round(rng.uniform(0.9, 1.0), 2)
-    if tier == "warning":
-        return round(rng.uniform(0.75, 0.89), 2)
-    if tier == "low":
-        return round(rng.uniform(0.65, 0.74), 2)
-    if tier == "none":
-        return round(rng.uniform(0.3, 0.64), 2)
-    raise ValueError(tier)
+    if tier not in CONFIDENCE_RANGES:
+        raise ValueError(tier)
+    lo, hi = CONFIDENCE_RANGES[tier]
+    return round(rng.uniform(lo, hi), 2)
 
 
 def clamp01(x: float) -> float:
@@ -214,10 +520,15 @@ def gen_environment_hazards_context(rng: random.Random, severity: str, conf: flo
     return {"hazards": hazards, "confidence": conf}
 
 
+WEATHER_CHOICES = ["clear", "rain", "snow", "fog", "unknown"]
+ROAD_CONDITION_CHOICES = ["dry", "wet", "icy", "unknown"]
+VISIBILITY_CHOICES = ["good", "moderate", "poor", "unknown"]
+
+
 def gen_driving_environment(rng: random.Random) -> Dict[str, Any]:
-    weather = rng.choice(["clear", "rain", "snow", "fog", "unknown"])
-    road_condition = rng.choice(["dry", "wet", "icy", "unknown"])
-    visibility_level = rng.choice(["good", "moderate", "poor", "unknown"])
+    weather = rng.choice(WEATHER_CHOICES)
+    road_condition = rng.choice(ROAD_CONDITION_CHOICES)
+    visibility_level = rng.choice(VISIBILITY_CHOICES)
     return {"weather": weather, "road_condition": road_condition, "visibility_level": visibility_level}
 
 
@@ -231,165 +542,265 @@ def gen_sensor_health(rng: random.Random, ok: bool) -> Dict[str, Any]:
     return {"overall_ok": bool(overall_ok), "camera_ok": bool(camera_ok), "model_ok": bool(model_ok)}
 
 
+@dataclass(frozen=True)
+class Pick:
+    """An argument value drawn per sample with rng.choice(options)."""
+
+    options: Tuple[Any, ...]
+
+
+@dataclass(frozen=True)
+class CallTemplate:
+    name: str
+    args: Tuple[Tuple[str, Any], ...]  # (key, constant or Pick) in output key order
+
+    def render(self, rng: random.Random) -> Dict[str, Any]:
+        return {k: rng.choice(v.options) if isinstance(v, Pick) else v for k, v in self.args}
+
+    def expansions(self) -> Iterator[Dict[str, Any]]:
+        keys = [k for k, _ in self.args]
+        choices = [v.options if isinstance(v, Pick) else (v,) for _, v in self.args]
+        for values in itertools.product(*choices):
+            yield dict(zip(keys, values))
+
+
+def _call(name: str, **args: Any) -> CallTemplate:
+    return CallTemplate(name, tuple(args.items()))
+
+
+ActionPlan = Tuple[CallTemplate, ...]
+
+
+@dataclass(frozen=True)
+class RiskRule:
+    risk_type: str
+    context_tool: str
+    priority: int  # index in PRIORITY_ORDER; lower wins
+    is_active: Callable[[Dict[str, Any]], bool]
+    confidence: Callable[[Dict[str, Any]], float]
+    # action calls for (tier, level); empty when no action applies
+    plan: Callable[[str, Optional[str]], ActionPlan]
+    # context "level" values an active context can have; (None,) when the plan ignores level
+    levels: Tuple[Optional[str], ...] = (None,)
+
+
+def _reported_confidence(c: Dict[str, Any]) -> float:
+    return float(c.get("confidence", 1.0))
+
+
+def _fixed_confidence(c: Dict[str, Any]) -> float:
+    # no confidence in schema; default to 1.0
+    return 1.0
+
+
+def _forward_collision_plan(tier: str, level: Optional[str]) -> ActionPlan:
+    if tier == "full" and level == "high":
+        return (
+            _call("pre_tension_safety_belts", enabled=True, level="high"),
+            _call("trigger_hud_warning", message=Pick(("전방 충돌 위험! 즉시 감속하세요", "전방 위험! 제동 준비", "전방 추돌 위험")), level="danger"),
+        )
+    if tier in ("full", "warning"):
+        severity = "danger" if level == "high" else "warning"
+        return (_call("trigger_hud_warning", message=Pick(("전방 위험. 감속하세요", "전방 충돌 위험 감지", "전방 상황 주의")), level=severity),)
+    if tier == "low":
+        return (_call("trigger_cluster_visual_warning", message=Pick(("전방 상황 주의", "전방 위험 가능성")), level="info"),)
+    return ()
+
+
+def _vehicle_intrusion_plan(tier: str, level: Optional[str]) -> ActionPlan:
+    if tier == "full" and level in ("high", "critical"):
+        return (
+            _call("request_safe_mode", enabled=True, reason="vehicle_system_intrusion"),
+            _call("log_safety_event", event_type="vehicle_system_intrusion", message="intrusion suspected", level="danger"),
+        )
+    if tier in ("warning", "full"):
+        return (_call("log_safety_event", event_type="vehicle_system_intrusion", message="intrusion suspected", level="warning"),)
+    if tier == "low":
+        return (_call("log_safety_event", event_type="vehicle_system_intrusion", message="intrusion low confidence", level="info"),)
+    return ()
+
+
+def _blind_spot_plan(tier: str, level: Optional[str]) -> ActionPlan:
+    if tier in ("full", "warning"):
+        vib_level = "high" if (tier == "full" and level == "high") else "mid"
+        return (
+            _call("trigger_steering_vibration", level=vib_level, duration_ms=Pick((800, 1200, 1500, 2000))),
+            _call("trigger_hud_warning", message=Pick(("사각지대 차량 감지", "사각지대 위험. 차선 변경 주의")), level="warning"),
+        )
+    if tier == "low":
+        return (_call("trigger_steering_vibration", level="low", duration_ms=Pick((600, 800, 1000))),)
+    return ()
+
+
+def _lane_departure_plan(tier: str, level: Optional[str]) -> ActionPlan:
+    if tier in ("full", "warning"):
+        return (_call("trigger_steering_vibration", level="mid" if tier == "warning" else "high", duration_ms=Pick((600, 900, 1200))),)
+    if tier == "low":
+        return (_call("trigger_steering_vibration", level="low", duration_ms=Pick((500, 700, 900))),)
+    return ()
+
+
+def _drowsiness_plan(tier: str, level: Optional[str]) -> ActionPlan:
+    if tier == "full":
+        return (
+            _call("trigger_drowsiness_alert_sound", enabled=True, level="high"),
+            _call("trigger_rest_recommendation", reason=Pick(("졸음 감지", "주의력 저하", "운전 피로 누적")), level="high"),
+        )
+    if tier == "warning":
+        return (_call("trigger_drowsiness_alert_sound", enabled=True, level="mid"),)
+    if tier == "low":
+        return (_call("trigger_drowsiness_alert_sound", enabled=True, level="low"),)
+    return ()
+
+
+def _ev_battery_plan(tier: str, level: Optional[str]) -> ActionPlan:
+    if level == "critical":
+        return (
+            _call("trigger_cluster_visual_warning", message="배터리 열 상태 위험", level="danger"),
+            _call("request_safe_mode", enabled=True, reason="ev_battery_thermal_critical"),
+        )
+    return (_call("trigger_cluster_visual_warning", message="배터리 온도 상승", level="warning"),)
+
+
+def _environmental_hazards_plan(tier: str, level: Optional[str]) -> ActionPlan:
+    if tier in ("full", "warning"):
+        return (_call("activate_hazard_warning_signals", enabled=True, duration_ms=Pick((2000, 3000, 5000, 8000))),)
+    if tier == "low":
+        return (_call("trigger_navigation_notification", message="전방 환경 위험 가능성", level="info"),)
+    return ()
+
+
+def _has_actionable_hazard(c: Dict[str, Any]) -> bool:
+    hazards = c.get("hazards", [])
+    return isinstance(hazards, list) and any(h.get("severity") in ("mid", "high") for h in hazards if isinstance(h, dict))
+
+
+# One rule per context tool, kept in PRIORITY_ORDER so the first active rule is the primary risk.
+RISK_RULES: Tuple[RiskRule, ...] = tuple(
+    sorted(
+        (
+            RiskRule(
+                risk_type="forward_collision",
+                context_tool="get_forward_collision_risk",
+                priority=PRIORITY_ORDER.index("forward_collision"),
+                # treat mid/high as actionable risk
+                is_active=lambda c: c.get("level") in ("mid", "high"),
+                confidence=_reported_confidence,
+                plan=_forward_collision_plan,
+                levels=("mid", "high"),
+            ),
+            RiskRule(
+                risk_type="vehicle_intrusion",
+                context_tool="get_vehicle_system_intrusion_status",
+                priority=PRIORITY_ORDER.index("vehicle_intrusion"),
+                is_active=lambda c: c.get("value") is True and c.get("level") in ("high", "critical", "mid"),
+                confidence=_reported_confidence,
+                plan=_vehicle_intrusion_plan,
+                levels=("high", "critical", "mid"),
+            ),
+            RiskRule(
+                risk_type="blind_spot",
+                context_tool="get_blind_spot_collision_risk",
+                priority=PRIORITY_ORDER.index("blind_spot"),
+                is_active=lambda c: c.get("value") is True and c.get("level") in ("mid", "high"),
+                confidence=_reported_confidence,
+                plan=_blind_spot_plan,
+                levels=("mid", "high"),
+            ),
+            RiskRule(
+                risk_type="lane_departure",
+                context_tool="get_lane_departure_status",
+                priority=PRIORITY_ORDER.index("lane_departure"),
+                is_active=lambda c: c.get("value") is True,
+                confidence=_reported_confidence,
+                plan=_lane_departure_plan,
+            ),
+            RiskRule(
+                risk_type="drowsiness",
+                context_tool="get_driver_drowsiness_status",
+                priority=PRIORITY_ORDER.index("drowsiness"),
+                is_active=lambda c: c.get("value") is True,
+                confidence=_reported_confidence,
+                plan=_drowsiness_plan,
+            ),
+            RiskRule(
+                risk_type="ev_battery_critical",
+                context_tool="get_ev_battery_thermal_status",
+                priority=PRIORITY_ORDER.index("ev_battery_critical"),
+                is_active=lambda c: c.get("level") in ("hot", "critical"),
+                confidence=_fixed_confidence,
+                plan=_ev_battery_plan,
+                levels=("hot", "critical"),
+            ),
+            RiskRule(
+                risk_type="environmental_hazards",
+                context_tool="get_external_environmental_hazards",
+                priority=PRIORITY_ORDER.index("environmental_hazards"),
+                is_active=_has_actionable_hazard,
+                confidence=_reported_confidence,
+                plan=_environmental_hazards_plan,
+            ),
+        ),
+        key=lambda r: r.priority,
+    )
+)
+
+RISK_RULES_BY_TOOL: Dict[str, RiskRule] = {r.context_tool: r for r in RISK_RULES}
+RISK_RULES_BY_TYPE: Dict[str, RiskRule] = {r.risk_type: r for r in RISK_RULES}
+
+
+PlanKey = Tuple[str, str, Optional[str]]  # (risk_type, tier, level)
+
+
+def compile_action_plans(action_validators: Dict[str, Validator]) -> Dict[PlanKey, ActionPlan]:
+    """Precompute every (risk, tier, level) plan, validating each possible argument dict once."""
+    plans: Dict[PlanKey, ActionPlan] = {}
+    for rule in RISK_RULES:
+        for tier in CONFIDENCE_TIERS:
+            for level in rule.levels:
+                # enforce max 2 tool calls
+                plan = rule.plan(tier, level)[:2]
+                for call in plan:
+                    validate = action_validators[call.name]
+                    for args in call.expansions():
+                        # validate against action schema params
+                        validate(args, "action:" + call.name)
+                plans[(rule.risk_type, tier, level)] = plan
+    return plans
+
+
 def decide_primary_risk(sensor_context: Dict[str, Any]) -> Optional[RiskDecision]:
-    candidates: List[Tuple[int, RiskDecision]] = []
-
-    if "get_forward_collision_risk" in sensor_context:
-        c = sensor_context["get_forward_collision_risk"]
-        conf = float(c.get("confidence", 1.0))
-        tier = confidence_to_tier(conf)
-        # treat mid/high as actionable risk
-        if c.get("level") in ("mid", "high"):
-            candidates.append((0, RiskDecision("forward_collision", conf, tier)))
-
-    if "get_vehicle_system_intrusion_status" in sensor_context:
-        c = sensor_context["get_vehicle_system_intrusion_status"]
-        conf = float(c.get("confidence", 1.0))
-        tier = confidence_to_tier(conf)
-        if c.get("value") is True and c.get("level") in ("high", "critical", "mid"):
-            candidates.append((1, RiskDecision("vehicle_intrusion", conf, tier)))
-
-    if "get_blind_spot_collision_risk" in sensor_context:
-        c = sensor_context["get_blind_spot_collision_risk"]
-        conf = float(c.get("confidence", 1.0))
-        tier = confidence_to_tier(conf)
-        if c.get("value") is True and c.get("level") in ("mid", "high"):
-            candidates.append((2, RiskDecision("blind_spot", conf, tier)))
-
-    if "get_lane_departure_status" in sensor_context:
-        c = sensor_context["get_lane_departure_status"]
-        conf = float(c.get("confidence", 1.0))
-        tier = confidence_to_tier(conf)
-        if c.get("value") is True:
-            candidates.append((3, RiskDecision("lane_departure", conf, tier)))
-
-    if "get_driver_drowsiness_status" in sensor_context:
-        c = sensor_context["get_driver_drowsiness_status"]
-        conf = float(c.get("confidence", 1.0))
-        tier = confidence_to_tier(conf)
-        if c.get("value") is True:
-            candidates.append((4, RiskDecision("drowsiness", conf, tier)))
-
-    if "get_ev_battery_thermal_status" in sensor_context:
-        c = sensor_context["get_ev_battery_thermal_status"]
-        level = c.get("level")
-        # no confidence in schema; default to 1.0
-        conf = 1.0
-        tier = confidence_to_tier(conf)
-        if level in ("hot", "critical"):
-            candidates.append((5, RiskDecision("ev_battery_critical", conf, tier)))
-
-    if "get_external_environmental_hazards" in sensor_context:
-        c = sensor_context["get_external_environmental_hazards"]
-        conf = float(c.get("confidence", 1.0))
-        tier = confidence_to_tier(conf)
-        hazards = c.get("hazards", [])
-        if isinstance(hazards, list) and any(h.get("severity") in ("mid", "high") for h in hazards if isinstance(h, dict)):
-            candidates.append((6, RiskDecision("environmental_hazards", conf, tier)))
-
-    if not candidates:
-        return None
-    candidates.sort(key=lambda x: x[0])
-    return candidates[0][1]
+    for rule in RISK_RULES:
+        c = sensor_context.get(rule.context_tool)
+        if c is not None and rule.is_active(c):
+            conf = rule.confidence(c)
+            return RiskDecision(rule.risk_type, conf, tier_for_confidence(conf))
+    return None
+
+
+def decide_many(contexts: Iterable[Dict[str, Any]]) -> List[Optional[RiskDecision]]:
+    decide = decide_primary_risk
+    return [decide(c) for c in contexts]
 
 
 def build_tool_calls(
     rng: random.Random,
-    action_schemas: Dict[str, Dict[str, Any]],
+    action_plans: Dict[PlanKey, ActionPlan],
     decision: RiskDecision,
     sensor_context: Dict[str, Any],
 ) -> List[Dict[str, Any]]:
-    tool_calls: List[Dict[str, Any]] = []
-
-    def add_call(name: str, args: Dict[str, Any]) -> None:
-        # validate against action schema params
-        schema = action_schemas[name]["parameters"]
-        validate_value(args, schema, f"action:{name}")
-        tool_calls.append({"function": {"name": name, "arguments": args}})
-
-    tier = decision.tier
-    rt = decision.risk_type
-
-    if rt == "forward_collision":
-        level = sensor_context["get_forward_collision_risk"]["level"]
-        if tier == "full" and level == "high":
-            add_call("pre_tension_safety_belts", {"enabled": True, "level": "high"})
-            add_call("trigger_hud_warning", {"message": rng.choice(["전방 충돌 위험! 즉시 감속하세요", "전방 위험! 제동 준비", "전방 추돌 위험"]), "level": "danger"})
-        elif tier in ("full", "warning"):
-            severity = "danger" if level == "high" else "warning"
-            add_call("trigger_hud_warning", {"message": rng.choice(["전방 위험. 감속하세요", "전방 충돌 위험 감지", "전방 상황 주의"]), "level": severity})
-        elif tier == "low":
-            add_call("trigger_cluster_visual_warning", {"message": rng.choice(["전방 상황 주의", "전방 위험 가능성" ]), "level": "info"})
-        else:
-            return []
-
-    elif rt == "vehicle_intrusion":
-        ctx = sensor_context["get_vehicle_system_intrusion_status"]
-        lvl = ctx["level"]
-        if tier == "full" and lvl in ("high", "critical"):
-            add_call("request_safe_mode", {"enabled": True, "reason": "vehicle_system_intrusion"})
-            add_call("log_safety_event", {"event_type": "vehicle_system_intrusion", "message": "intrusion suspected", "level": "danger"})
-        elif tier in ("warning", "full"):
-            add_call("log_safety_event", {"event_type": "vehicle_system_intrusion", "message": "intrusion suspected", "level": "warning"})
-        elif tier == "low":
-            add_call("log_safety_event", {"event_type": "vehicle_system_intrusion", "message": "intrusion low confidence", "level": "info"})
-        else:
-            return []
-
-    elif rt == "blind_spot":
-        ctx = sensor_context["get_blind_spot_collision_risk"]
-        lvl = ctx["level"]
-        if tier in ("full", "warning"):
-            vib_level = "high" if (tier == "full" and lvl == "high") else "mid"
-            add_call("trigger_steering_vibration", {"level": vib_level, "duration_ms": rng.choice([800, 1200, 1500, 2000])})
-            add_call("trigger_hud_warning", {"message": rng.choice(["사각지대 차량 감지", "사각지대 위험. 차선 변경 주의"]), "level": "warning"})
-        elif tier == "low":
-            add_call("trigger_steering_vibration", {"level": "low", "duration_ms": rng.choice([600, 800, 1000])})
-        else:
-            return []
+    rule = RISK_RULES_BY_TYPE[decision.risk_type]
+    level = sensor_context[rule.context_tool].get("level") if rule.levels != (None,) else None
+    # constant args were validated by compile_action_plans; only Pick fields vary here
+    return [{"function": {"name": call.name, "arguments": call.render(rng)}} for call in action_plans[(decision.risk_type, decision.tier, level)]]
 
-    elif rt == "lane_departure":
-        if tier in ("full", "warning"):
-            add_call("trigger_steering_vibration", {"level": "mid" if tier == "warning" else "high", "duration_ms": rng.choice([600, 900, 1200])})
-        elif tier == "low":
-            add_call("trigger_steering_vibration", {"level": "low", "duration_ms": rng.choice([500, 700, 900])})
-        else:
-            return []
-
-    elif rt == "drowsiness":
-        if tier == "full":
-            add_call("trigger_drowsiness_alert_sound", {"enabled": True, "level": "high"})
-            add_call("trigger_rest_recommendation", {"reason": rng.choice(["졸음 감지", "주의력 저하", "운전 피로 누적"]), "level": "high"})
-        elif tier == "warning":
-            add_call("trigger_drowsiness_alert_sound", {"enabled": True, "level": "mid"})
-        elif tier == "low":
-            add_call("trigger_drowsiness_alert_sound", {"enabled": True, "level": "low"})
-        else:
-            return []
 
-    elif rt == "ev_battery_critical":
-        level = sensor_context["get_ev_battery_thermal_status"]["level"]
-        if level == "critical":
-            add_call("trigger_cluster_visual_warning", {"message": "배터리 열 상태 위험", "level": "danger"})
-            add_call("request_safe_mode", {"enabled": True, "reason": "ev_battery_thermal_critical"})
-        else:
-            add_call("trigger_cluster_visual_warning", {"message": "배터리 온도 상승", "level": "warning"})
-
-    elif rt == "environmental_hazards":
-        if tier in ("full", "warning"):
-            add_call("activate_hazard_warning_signals", {"enabled": True, "duration_ms": rng.choice([2000, 3000, 5000, 8000])})
-        elif tier == "low":
-            add_call("trigger_navigation_notification", {"message": "전방 환경 위험 가능성", "level": "info"})
-        else:
-            return []
-
-    # enforce max 2 tool calls
-    return tool_calls[:2]
+SENSOR_CONTEXT_MARKER = "SENSOR_CONTEXT="
 
 
 def build_user_message(rng: random.Random, fmt: str, inquiry: str, sensor_context: Dict[str, Any]) -> str:
     sensor_json = json_dumps_one_line(sensor_context)
-    sensor_part = f"[Sensor Context] SENSOR_CONTEXT={sensor_json}"
+    sensor_part = f"[Sensor Context] {SENSOR_CONTEXT_MARKER}{sensor_json}"
     if fmt == "sensor_only":
         return sensor_part
     return f"[User Inquiry] {inquiry}\\n{sensor_part}"
@@ -434,14 +845,204 @@ def build_general_conversation_reply(rng: random.Random) -> str:
     )
 
 
+ACTION_RISK_TYPES = [
+    "forward_collision",
+    "vehicle_intrusion",
+    "blind_spot",
+    "lane_departure",
+    "drowsiness",
+    "ev_battery_critical",
+    "environmental_hazards",
+]
+ACTION_RISK_WEIGHTS = [0.22, 0.14, 0.14, 0.14, 0.16, 0.1, 0.1]
+
+ACTION_TIERS = ["full", "warning", "low"]
+ACTION_TIER_WEIGHTS = [0.45, 0.4, 0.15]
+
+
+def add_primary_risk_context(
+    rng: random.Random,
+    sensor_context: Dict[str, Any],
+    primary: str,
+    tier: str,
+    conf: float,
+) -> str:
+    """Add the context for an action bucket's primary risk; returns the user inquiry."""
+    if primary == "forward_collision":
+        sensor_context["get_forward_collision_risk"] = gen_forward_collision_context(rng, desired=rng.choice(["mid", "high"]), conf=conf)
+        return rng.choice(["앞차와 너무 가까워요", "전방 위험 경고가 필요해요", "전방 추돌 위험이 있는지 확인해줘"])
+    if primary == "vehicle_intrusion":
+        sensor_context["get_vehicle_system_intrusion_status"] = gen_intrusion_context(rng, level=rng.choice(["mid", "high", "critical"]), conf=conf)
+        return rng.choice(["차량 시스템에 이상이 있는 것 같아요", "보안 침입 경고가 필요해요", "네트워크 침입 가능성이 있나요?"])
+    if primary == "blind_spot":
+        sensor_context["get_blind_spot_collision_risk"] = gen_blind_spot_context(rng, level=rng.choice(["mid", "high"]), conf=conf)
+        return rng.choice(["차선 변경하려는데 옆이 위험해요", "사각지대에 차량이 있나요?", "옆 차가 너무 가까워요"])
+    if primary == "lane_departure":
+        sensor_context["get_lane_departure_status"] = gen_lane_departure_context(rng, value=True, conf=conf)
+        return rng.choice(["차선 이탈 경고 해줘", "차선에서 벗어나는 것 같아", "차선 유지가 어려워"])
+    if primary == "drowsiness":
+        sensor_context["get_driver_drowsiness_status"] = gen_drowsiness_context(rng, value=True, conf=conf)
+        return rng.choice(["졸음이 오는 것 같아", "졸음 경고 좀 해줘", "집중이 잘 안 돼"])
+    if primary == "ev_battery_critical":
+        # no confidence field; map from level
+        level = rng.choice(["hot", "critical"]) if tier != "low" else "hot"
+        sensor_context["get_ev_battery_thermal_status"] = gen_ev_battery_context(rng, level=level)
+        return rng.choice(["배터리 온도가 높은가요?", "배터리 열 상태가 위험해요", "배터리 경고가 떠요"])
+    severity = rng.choice(["mid", "high"])
+    sensor_context["get_external_environmental_hazards"] = gen_environment_hazards_context(rng, severity=severity, conf=conf, count=rng.choice([1, 2, 3]))
+    return rng.choice(["전방 도로에 장애물이 있어요", "낙하물 위험이 있나요?", "공사 구간이 감지됐나요?"])
+
+
+def add_multi_action_extras(rng: random.Random, sensor_context: Dict[str, Any], primary: str) -> None:
+    # add 1-2 additional contexts, lower-priority or noise, to create combined context
+    extra_count = rng.choice([1, 2])
+    extra_pool = [
+        "lane_departure",
+        "drowsiness",
+        "blind_spot",
+        "vehicle_intrusion",
+        "environmental_hazards",
+    ]
+    rng.shuffle(extra_pool)
+    for extra in extra_pool[:extra_count]:
+        if extra == primary:
+            continue
+        extra_tier = rng.choices(["full", "warning", "low", "none"], weights=[0.2, 0.35, 0.25, 0.2], k=1)[0]
+        extra_conf = pick_confidence(rng, extra_tier)
+        if extra == "lane_departure" and "get_lane_departure_status" not in sensor_context:
+            sensor_context["get_lane_departure_status"] = gen_lane_departure_context(rng, value=rng.random() < 0.7, conf=extra_conf)
+        elif extra == "drowsiness" and "get_driver_drowsiness_status" not in sensor_context:
+            sensor_context["get_driver_drowsiness_status"] = gen_drowsiness_context(rng, value=rng.random() < 0.6, conf=extra_conf)
+        elif extra == "blind_spot" and "get_blind_spot_collision_risk" not in sensor_context:
+            sensor_context["get_blind_spot_collision_risk"] = gen_blind_spot_context(rng, level=rng.choice(["low", "mid", "high"]), conf=extra_conf)
+        elif extra == "vehicle_intrusion" and "get_vehicle_system_intrusion_status" not in sensor_context:
+            sensor_context["get_vehicle_system_intrusion_status"] = gen_intrusion_context(rng, level=rng.choice(["low", "mid", "high", "critical"]), conf=extra_conf)
+        elif extra == "environmental_hazards" and "get_external_environmental_hazards" not in sensor_context:
+            sensor_context["get_external_environmental_hazards"] = gen_environment_hazards_context(rng, severity=rng.choice(["low", "mid", "high"]), conf=extra_conf, count=rng.choice([1, 2]))
+
+
+def add_no_action_context(rng: random.Random, sensor_context: Dict[str, Any]) -> str:
+    # Ensure low-risk contexts
+    if rng.random() < 0.6:
+        sensor_context["get_forward_collision_risk"] = gen_forward_collision_context(rng, desired="low", conf=round(rng.uniform(0.85, 1.0), 2))
+    if rng.random() < 0.5:
+        sensor_context["get_lane_departure_status"] = gen_lane_departure_context(rng, value=False, conf=round(rng.uniform(0.8, 1.0), 2))
+    if rng.random() < 0.4:
+        sensor_context["get_driver_drowsiness_status"] = gen_drowsiness_context(rng, value=False, conf=round(rng.uniform(0.8, 1.0), 2))
+    return rng.choice(["현재 위험이 있는지 알려줘", "지금 상태 괜찮아?", "경고가 필요한 상황인가?"])
+
+
+def add_low_confidence_context(rng: random.Random, sensor_context: Dict[str, Any]) -> str:
+    target = rng.choice(["forward_collision", "blind_spot", "lane_departure", "drowsiness", "vehicle_intrusion", "environmental_hazards"])
+    conf = pick_confidence(rng, "none")
+    if target == "forward_collision":
+        sensor_context["get_forward_collision_risk"] = gen_forward_collision_context(rng, desired=rng.choice(["mid", "high"]), conf=conf)
+        return rng.choice(["전방이 위험한가요?", "앞차랑 가까운 것 같은데 확실해?", "전방 위험 판단해줘"])
+    if target == "blind_spot":
+        sensor_context["get_blind_spot_collision_risk"] = gen_blind_spot_context(rng, level=rng.choice(["mid", "high"]), conf=conf)
+        return rng.choice(["사각지대에 차량이 있는지 애매해요", "옆차가 있는지 잘 모르겠어", "차선 변경해도 될까?"])
+    if target == "lane_departure":
+        sensor_context["get_lane_departure_status"] = gen_lane_departure_context(rng, value=rng.random() < 0.7, conf=conf)
+        return rng.choice(["차선 이탈인가요?", "차선이 잘 안 보여요", "차선 유지 상태가 불확실해"])
+    if target == "drowsiness":
+        sensor_context["get_driver_drowsiness_status"] = gen_drowsiness_context(rng, value=rng.random() < 0.7, conf=conf)
+        return rng.choice(["졸음 상태인지 애매해요", "졸음 감지가 불확실해", "졸음 경고가 필요한가?"])
+    if target == "vehicle_intrusion":
+        sensor_context["get_vehicle_system_intrusion_status"] = gen_intrusion_context(rng, level=rng.choice(["mid", "high"]), conf=conf)
+        return rng.choice(["시스템 침입 경고가 맞나요?", "보안 위험이 있는지 확실치 않아", "네트워크 이상이 있나요?"])
+    sensor_context["get_external_environmental_hazards"] = gen_environment_hazards_context(rng, severity=rng.choice(["mid", "high"]), conf=conf, count=rng.choice([1, 2]))
+    return rng.choice(["전방 장애물 감지가 불확실해요", "도로 상황이 애매해", "환경 위험이 있는지 알려줘"])
+
+
+def add_general_conversation_context(rng: random.Random, sensor_context: Dict[str, Any]) -> str:
+    if rng.random() < 0.5:
+        sensor_context["get_forward_collision_risk"] = gen_forward_collision_context(rng, desired="low", conf=round(rng.uniform(0.8, 1.0), 2))
+    return rng.choice(["오늘 운전 팁 알려줘", "지금 내 차 상태 어때?", "피곤할 때 운전은 어떻게 해야 해?"])
+
+
+def perturb_eval_b_context(rng: random.Random, sensor_context: Dict[str, Any]) -> None:
+    if rng.random() < 0.6:
+        sensor_context["get_sensor_health_status"] = gen_sensor_health(rng, ok=False)
+    if rng.random() < 0.5:
+        sensor_context["get_driving_environment"] = {"weather": rng.choice(["rain", "snow", "fog"]), "road_condition": rng.choice(["wet", "icy"]), "visibility_level": rng.choice(["moderate", "poor"])}
+
+
+def validate_sensor_context(context_validators: Dict[str, Validator], sensor_context: Dict[str, Any]) -> None:
+    for tool_name, params in sensor_context.items():
+        validate = context_validators.get(tool_name)
+        if validate is None:
+            raise SchemaError(f"Unknown context tool '{tool_name}'")
+        validate(params, "context:" + tool_name)
+
+
+def build_assistant_message(
+    rng: random.Random,
+    action_plans: Dict[PlanKey, ActionPlan],
+    bucket: str,
+    decision: Optional[RiskDecision],
+    sensor_context: Dict[str, Any],
+) -> Dict[str, Any]:
+    if bucket in ("single_action", "multi_action") and decision is not None and decision.tier != "none":
+        tool_calls = build_tool_calls(rng, action_plans, decision, sensor_context)
+        # If we somehow produced 0 tool_calls, treat as normal
+        if tool_calls:
+            return {"role": "assistant", "content": "", "tool_calls": tool_calls}
+        return {"role": "assistant", "content": build_normal_reply(rng)}
+    if bucket == "low_confidence":
+        hint = decision.risk_type if decision is not None else "위험"
+        return {"role": "assistant", "content": build_clarification_reply(rng, hint)}
+    if bucket == "general_conversation":
+        return {"role": "assistant", "content": build_general_conversation_reply(rng)}
+    return {"role": "assistant", "content": build_normal_reply(rng)}
+
+
+def assemble_sample(
+    tools_payload: List[Dict[str, Any]],
+    for_eval: Optional[str],
+    developer_message: str,
+    user_message: str,
+    assistant: Dict[str, Any],
+) -> Dict[str, Any]:
+    sample = {
+        "metadata": "eval" if for_eval else "train",
+        "tools": tools_payload,
+        "messages": [
+            {"role": "developer", "content": developer_message},
+            {"role": "user", "content": user_message},
+            assistant,
+        ],
+    }
+
+    if set(sample.keys()) != {"metadata", "tools", "messages"}:
+        raise SchemaError("Top-level keys mismatch")
+
+    return sample
+
+
 def generate_sample(
     rng: random.Random,
     tools_payload: List[Dict[str, Any]],
-    context_schemas: Dict[str, Dict[str, Any]],
-    action_schemas: Dict[str, Dict[str, Any]],
+    context_validators: Dict[str, Validator],
+    action_plans: Dict[PlanKey, ActionPlan],
     bucket: str,
     for_eval: Optional[str] = None,
+    validate: bool = True,
 ) -> Dict[str, Any]:
+    return generate_labeled_sample(
+        rng, tools_payload, context_validators, action_plans, bucket, for_eval, validate
+    )[0]
+
+
+def generate_labeled_sample(
+    rng: random.Random,
+    tools_payload: List[Dict[str, Any]],
+    context_validators: Dict[str, Validator],
+    action_plans: Dict[PlanKey, ActionPlan],
+    bucket: str,
+    for_eval: Optional[str] = None,
+    validate: bool = True,
+) -> Tuple[Dict[str, Any], Optional[RiskDecision], Dict[str, Any]]:
+    """generate_sample that also returns the primary risk decision and the sensor context it was built from."""
     fmt = choose_user_format(rng)
 
     sensor_context: Dict[str, Any] = {}
@@ -455,173 +1056,304 @@ def generate_sample(
     inquiry = ""
 
     if bucket in ("single_action", "multi_action"):
-        risk_choices = [
-            "forward_collision",
-            "vehicle_intrusion",
-            "blind_spot",
-            "lane_departure",
-            "drowsiness",
-            "ev_battery_critical",
-            "environmental_hazards",
-        ]
-        weights = [0.22, 0.14, 0.14, 0.14, 0.16, 0.1, 0.1]
-        primary = rng.choices(risk_choices, weights=weights, k=1)[0]
+        primary = rng.choices(ACTION_RISK_TYPES, weights=ACTION_RISK_WEIGHTS, k=1)[0]
 
-        tier = rng.choices(["full", "warning", "low"], weights=[0.45, 0.4, 0.15], k=1)[0]
+        tier = rng.choices(ACTION_TIERS, weights=ACTION_TIER_WEIGHTS, k=1)[0]
         conf = pick_confidence(rng, tier)
 
-        if primary == "forward_collision":
-            sensor_context["get_forward_collision_risk"] = gen_forward_collision_context(rng, desired=rng.choice(["mid", "high"]), conf=conf)
-            inquiry = rng.choice(["앞차와 너무 가까워요", "전방 위험 경고가 필요해요", "전방 추돌 위험이 있는지 확인해줘"])
-        elif primary == "vehicle_intrusion":
-            sensor_context["get_vehicle_system_intrusion_status"] = gen_intrusion_context(rng, level=rng.choice(["mid", "high", "critical"]), conf=conf)
-            inquiry = rng.choice(["차량 시스템에 이상이 있는 것 같아요", "보안 침입 경고가 필요해요", "네트워크 침입 가능성이 있나요?"])
-        elif primary == "blind_spot":
-            sensor_context["get_blind_spot_collision_risk"] = gen_blind_spot_context(rng, level=rng.choice(["mid", "high"]), conf=conf)
-            inquiry = rng.choice(["차선 변경하려는데 옆이 위험해요", "사각지대에 차량이 있나요?", "옆 차가 너무 가까워요"])
-        elif primary == "lane_departure":
-            sensor_context["get_lane_departure_status"] = gen_lane_departure_context(rng, value=True, conf=conf)
-            inquiry = rng.choice(["차선 이탈 경고 해줘", "차선에서 벗어나는 것 같아", "차선 유지가 어려워"])
-        elif primary == "drowsiness":
-            sensor_context["get_driver_drowsiness_status"] = gen_drowsiness_context(rng, value=True, conf=conf)
-            inquiry = rng.choice(["졸음이 오는 것 같아", "졸음 경고 좀 해줘", "집중이 잘 안 돼"])
-        elif primary == "ev_battery_critical":
-            # no confidence field; map from level
-            level = rng.choice(["hot", "critical"]) if tier != "low" else "hot"
-            sensor_context["get_ev_battery_thermal_status"] = gen_ev_battery_context(rng, level=level)
-            inquiry = rng.choice(["배터리 온도가 높은가요?", "배터리 열 상태가 위험해요", "배터리 경고가 떠요"])
-        else:
-            severity = rng.choice(["mid", "high"])
-            sensor_context["get_external_environmental_hazards"] = gen_environment_hazards_context(rng, severity=severity, conf=conf, count=rng.choice([1, 2, 3]))
-            inquiry = rng.choice(["전방 도로에 장애물이 있어요", "낙하물 위험이 있나요?", "공사 구간이 감지됐나요?"])
+        inquiry = add_primary_risk_context(rng, sensor_context, primary, tier, conf)
 
         if bucket == "multi_action":
-            # add 1-2 additional contexts, lower-priority or noise, to create combined context
-            extra_count = rng.choice([1, 2])
-            extra_pool = [
-                "lane_departure",
-                "drowsiness",
-                "blind_spot",
-                "vehicle_intrusion",
-                "environmental_hazards",
-            ]
-            rng.shuffle(extra_pool)
-            for extra in extra_pool[:extra_count]:
-                if extra == primary:
-                    continue
-                extra_tier = rng.choices(["full", "warning", "low", "none"], weights=[0.2, 0.35, 0.25, 0.2], k=1)[0]
-                extra_conf = pick_confidence(rng, extra_tier)
-                if extra == "lane_departure" and "get_lane_departure_status" not in sensor_context:
-                    sensor_context["get_lane_departure_status"] = gen_lane_departure_context(rng, value=rng.random() < 0.7, conf=extra_conf)
-                elif extra == "drowsiness" and "get_driver_drowsiness_status" not in sensor_context:
-                    sensor_context["get_driver_drowsiness_status"] = gen_drowsiness_context(rng, value=rng.random() < 0.6, conf=extra_conf)
-                elif extra == "blind_spot" and "get_blind_spot_collision_risk" not in sensor_context:
-                    sensor_context["get_blind_spot_collision_risk"] = gen_blind_spot_context(rng, level=rng.choice(["low", "mid", "high"]), conf=extra_conf)
-                elif extra == "vehicle_intrusion" and "get_vehicle_system_intrusion_status" not in sensor_context:
-                    sensor_context["get_vehicle_system_intrusion_status"] = gen_intrusion_context(rng, level=rng.choice(["low", "mid", "high", "critical"]), conf=extra_conf)
-                elif extra == "environmental_hazards" and "get_external_environmental_hazards" not in sensor_context:
-                    sensor_context["get_external_environmental_hazards"] = gen_environment_hazards_context(rng, severity=rng.choice(["low", "mid", "high"]), conf=extra_conf, count=rng.choice([1, 2]))
+            add_multi_action_extras(rng, sensor_context, primary)
 
     elif bucket == "no_action":
-        # Ensure low-risk contexts
-        if rng.random() < 0.6:
-            sensor_context["get_forward_collision_risk"] = gen_forward_collision_context(rng, desired="low", conf=round(rng.uniform(0.85, 1.0), 2))
-        if rng.random() < 0.5:
-            sensor_context["get_lane_departure_status"] = gen_lane_departure_context(rng, value=False, conf=round(rng.uniform(0.8, 1.0), 2))
-        if rng.random() < 0.4:
-            sensor_context["get_driver_drowsiness_status"] = gen_drowsiness_context(rng, value=False, conf=round(rng.uniform(0.8, 1.0), 2))
-        inquiry = rng.choice(["현재 위험이 있는지 알려줘", "지금 상태 괜찮아?", "경고가 필요한 상황인가?"])
+        inquiry = add_no_action_context(rng, sensor_context)
 
     elif bucket == "low_confidence":
-        target = rng.choice(["forward_collision", "blind_spot", "lane_departure", "drowsiness", "vehicle_intrusion", "environmental_hazards"])
-        conf = pick_confidence(rng, "none")
-        if target == "forward_collision":
-            sensor_context["get_forward_collision_risk"] = gen_forward_collision_context(rng, desired=rng.choice(["mid", "high"]), conf=conf)
-            inquiry = rng.choice(["전방이 위험한가요?", "앞차랑 가까운 것 같은데 확실해?", "전방 위험 판단해줘"])
-        elif target == "blind_spot":
-            sensor_context["get_blind_spot_collision_risk"] = gen_blind_spot_context(rng, level=rng.choice(["mid", "high"]), conf=conf)
-            inquiry = rng.choice(["사각지대에 차량이 있는지 애매해요", "옆차가 있는지 잘 모르겠어", "차선 변경해도 될까?"])
-        elif target == "lane_departure":
-            sensor_context["get_lane_departure_status"] = gen_lane_departure_context(rng, value=rng.random() < 0.7, conf=conf)
-            inquiry = rng.choice(["차선 이탈인가요?", "차선이 잘 안 보여요", "차선 유지 상태가 불확실해"])
-        elif target == "drowsiness":
-            sensor_context["get_driver_drowsiness_status"] = gen_drowsiness_context(rng, value=rng.random() < 0.7, conf=conf)
-            inquiry = rng.choice(["졸음 상태인지 애매해요", "졸음 감지가 불확실해", "졸음 경고가 필요한가?"])
-        elif target == "vehicle_intrusion":
-            sensor_context["get_vehicle_system_intrusion_status"] = gen_intrusion_context(rng, level=rng.choice(["mid", "high"]), conf=conf)
-            inquiry = rng.choice(["시스템 침입 경고가 맞나요?", "보안 위험이 있는지 확실치 않아", "네트워크 이상이 있나요?"])
-        else:
-            sensor_context["get_external_environmental_hazards"] = gen_environment_hazards_context(rng, severity=rng.choice(["mid", "high"]), conf=conf, count=rng.choice([1, 2]))
-            inquiry = rng.choice(["전방 장애물 감지가 불확실해요", "도로 상황이 애매해", "환경 위험이 있는지 알려줘"])
+        inquiry = add_low_confidence_context(rng, sensor_context)
 
     elif bucket == "general_conversation":
-        if rng.random() < 0.5:
-            sensor_context["get_forward_collision_risk"] = gen_forward_collision_context(rng, desired="low", conf=round(rng.uniform(0.8, 1.0), 2))
-        inquiry = rng.choice(["오늘 운전 팁 알려줘", "지금 내 차 상태 어때?", "피곤할 때 운전은 어떻게 해야 해?"])
+        inquiry = add_general_conversation_context(rng, sensor_context)
 
     if for_eval == "eval_b":
-        if rng.random() < 0.6:
-            sensor_context["get_sensor_health_status"] = gen_sensor_health(rng, ok=False)
-        if rng.random() < 0.5:
-            sensor_context["get_driving_environment"] = {"weather": rng.choice(["rain", "snow", "fog"]), "road_condition": rng.choice(["wet", "icy"]), "visibility_level": rng.choice(["moderate", "poor"])}
+        perturb_eval_b_context(rng, sensor_context)
 
-    for tool_name, params in sensor_context.items():
-        if tool_name not in context_schemas:
-            raise SchemaError(f"Unknown context tool '{tool_name}'")
-        validate_value(params, context_schemas[tool_name]["parameters"], f"context:{tool_name}")
+    if validate:
+        validate_sensor_context(context_validators, sensor_context)
 
     user_message = build_user_message(rng, fmt, inquiry, sensor_context)
 
     developer_message = build_developer_message(rng)
 
-    assistant: Dict[str, Any]
-
     decision = decide_primary_risk(sensor_context)
 
-    if bucket in ("single_action", "multi_action") and decision is not None and decision.tier != "none":
-        tool_calls = build_tool_calls(rng, action_schemas, decision, sensor_context)
-        # If we somehow produced 0 tool_calls, treat as normal
-        if tool_calls:
-            assistant = {"role": "assistant", "content": "", "tool_calls": tool_calls}
+    assistant = build_assistant_message(rng, action_plans, bucket, decision, sensor_context)
+
+    return assemble_sample(tools_payload, for_eval, developer_message, user_message, assistant), decision, sensor_context
+
+
+class _ExtremeRandom(random.Random):
+    """random.Random that answers every draw with the low or high end of its range.
+
+    side=0/1 pins every draw to one end; side=None picks an end per draw, so
+    different fields land on different extremes.
+    """
+
+    def __init__(self, seed: int, side: Optional[int] = None) -> None:
+        super().__init__(seed)
+        self._side = side
+
+    def _high(self) -> bool:
+        if self._side is not None:
+            return self._side == 1
+        return super().random() < 0.5
+
+    def random(self) -> float:
+        return 1.0 - 2.0**-53 if self._high() else 0.0
+
+    def uniform(self, a: float, b: float) -> float:
+        return b if self._high() else a
+
+    def choice(self, seq):
+        return seq[-1] if self._high() else seq[0]
+
+    def choices(self, population, weights=None, *, cum_weights=None, k: int = 1):
+        return [self.choice(population) for _ in range(k)]
+
+    def shuffle(self, x: List[Any]) -> None:
+        if self._high():
+            x.reverse()
+
+
+SELF_TEST_ROUNDS = 64
+
+
+def self_test_generators(schemas: "ToolSchemaSet", rounds: int = SELF_TEST_ROUNDS) -> int:
+    """Run generate_sample for every bucket and split at its draw extremes, fully validated.
+
+    Returns the number of samples checked. Raises SchemaError naming the
+    first bucket/split whose generators leave the schema.
+    """
+    checked = 0
+    for for_eval in (None, "eval_a", "eval_b"):
+        for bucket, _ in BUCKETS:
+            rngs: List[random.Random] = [_ExtremeRandom(0, side=0), _ExtremeRandom(0, side=1)]
+            rngs += [_ExtremeRandom(i) for i in range(rounds)]
+            rngs += [random.Random(i) for i in range(rounds)]
+            for rng in rngs:
+                try:
+                    generate_sample(rng, schemas.tools_payload, schemas.context_validators, schemas.action_plans, bucket, for_eval)
+                except SchemaError as e:
+                    raise SchemaError(f"self-test bucket={bucket} split={for_eval or 'train'}: {e}") from None
+                checked += 1
+    return checked
+
+
+# (bucket, sample, primary risk decision, sensor context) as yielded by the sample generators
+GeneratedSample = Tuple[str, Dict[str, Any], Optional[RiskDecision], Dict[str, Any]]
+
+
+VECTOR_BLOCK_SIZE = 4096
+
+# uniforms pre-drawn per sample for the branch-specific draws of the vectorized engine
+_STREAM_WIDTH = 48
+
+
+def require_numpy():
+    try:
+        import numpy  # type: ignore
+    except ImportError as e:
+        raise RuntimeError("The vectorized engine requires numpy. Install first: pip install numpy") from e
+    return numpy
+
+
+class _UniformStream:
+    """random.Random stand-in serving a pre-drawn row of uniforms.
+
+    Lets the vectorized engine reuse the context/message helpers unchanged;
+    a row that runs out continues from the block generator's overflow stream.
+    """
+
+    __slots__ = ("random",)
+
+    def __init__(self, values: List[float], overflow: Iterator[float]) -> None:
+        # random() is a C-level iterator step, not a Python method call
+        self.random: Callable[[], float] = itertools.chain(values, overflow).__next__
+
+    def uniform(self, a: float, b: float) -> float:
+        return a + (b - a) * self.random()
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+    def choices(self, population, weights=None, *, k: int = 1):
+        if weights is None:
+            return [self.choice(population) for _ in range(k)]
+        cum: List[float] = []
+        total = 0.0
+        for w in weights:
+            total += w
+            cum.append(total)
+        hi = len(population) - 1
+        return [population[min(bisect.bisect(cum, self.random() * total), hi)] for _ in range(k)]
+
+    def shuffle(self, x: List[Any]) -> None:
+        for i in range(len(x) - 1, 0, -1):
+            j = int(self.random() * (i + 1))
+            x[i], x[j] = x[j], x[i]
+
+
+def _draw_block_columns(np, g, k: int) -> Dict[str, List[Any]]:
+    """Draw the per-sample fields shared by every bucket for a block of k samples."""
+    risk_p = np.asarray(ACTION_RISK_WEIGHTS, dtype=float)
+    tier_p = np.asarray(ACTION_TIER_WEIGHTS, dtype=float)
+    conf_lo = np.asarray([CONFIDENCE_RANGES[t][0] for t in ACTION_TIERS])
+    conf_hi = np.asarray([CONFIDENCE_RANGES[t][1] for t in ACTION_TIERS])
+
+    tier = g.choice(len(ACTION_TIERS), size=k, p=tier_p / tier_p.sum())
+    conf = np.round(conf_lo[tier] + g.random(k) * (conf_hi[tier] - conf_lo[tier]), 2)
+    # .tolist() so samples hold plain Python bools/ints/floats
+    return {
+        "sensor_only": (g.random(k) < 0.5).tolist(),
+        "speed": np.round(g.uniform(0.0, 130.0, k), 1).tolist(),
+        "has_env": (g.random(k) < 0.5).tolist(),
+        "weather": g.integers(0, len(WEATHER_CHOICES), k).tolist(),
+        "road": g.integers(0, len(ROAD_CONDITION_CHOICES), k).tolist(),
+        "visibility": g.integers(0, len(VISIBILITY_CHOICES), k).tolist(),
+        "has_health": (g.random(k) < 0.35).tolist(),
+        "health_ok": (g.random(k) < 0.9).tolist(),
+        "camera_ok": (g.random(k) > 0.5).tolist(),
+        "model_ok": (g.random(k) > 0.5).tolist(),
+        "risk": g.choice(len(ACTION_RISK_TYPES), size=k, p=risk_p / risk_p.sum()).tolist(),
+        "tier": tier.tolist(),
+        "conf": conf.tolist(),
+        "stream": g.random((k, _STREAM_WIDTH)).tolist(),
+    }
+
+
+def _vectorized_sample(
+    cols: Dict[str, List[Any]],
+    i: int,
+    draws: _UniformStream,
+    schemas: "ToolSchemaSet",
+    bucket: str,
+    for_eval: Optional[str],
+    validate: bool = True,
+) -> Tuple[Dict[str, Any], Optional[RiskDecision], Dict[str, Any]]:
+    sensor_context: Dict[str, Any] = {"get_vehicle_speed": {"value": cols["speed"][i]}}
+    if cols["has_env"][i]:
+        sensor_context["get_driving_environment"] = {
+            "weather": WEATHER_CHOICES[cols["weather"][i]],
+            "road_condition": ROAD_CONDITION_CHOICES[cols["road"][i]],
+            "visibility_level": VISIBILITY_CHOICES[cols["visibility"][i]],
+        }
+    if cols["has_health"][i]:
+        if cols["health_ok"][i]:
+            sensor_context["get_sensor_health_status"] = {"overall_ok": True, "camera_ok": True, "model_ok": True}
         else:
-            assistant = {"role": "assistant", "content": build_normal_reply(rng)}
+            camera_ok = cols["camera_ok"][i]
+            model_ok = cols["model_ok"][i]
+            sensor_context["get_sensor_health_status"] = {"overall_ok": camera_ok and model_ok, "camera_ok": camera_ok, "model_ok": model_ok}
+
+    inquiry = ""
+    if bucket in ("single_action", "multi_action"):
+        primary = ACTION_RISK_TYPES[cols["risk"][i]]
+        inquiry = add_primary_risk_context(draws, sensor_context, primary, ACTION_TIERS[cols["tier"][i]], cols["conf"][i])
+        if bucket == "multi_action":
+            add_multi_action_extras(draws, sensor_context, primary)
+    elif bucket == "no_action":
+        inquiry = add_no_action_context(draws, sensor_context)
     elif bucket == "low_confidence":
-        hint = decision.risk_type if decision is not None else "위험"
-        assistant = {"role": "assistant", "content": build_clarification_reply(rng, hint)}
+        inquiry = add_low_confidence_context(draws, sensor_context)
     elif bucket == "general_conversation":
-        assistant = {"role": "assistant", "content": build_general_conversation_reply(rng)}
-    else:
-        assistant = {"role": "assistant", "content": build_normal_reply(rng)}
+        inquiry = add_general_conversation_context(draws, sensor_context)
 
-    sample = {
-        "metadata": "eval" if for_eval else "train",
-        "tools": tools_payload,
-        "messages": [
-            {"role": "developer", "content": developer_message},
-            {"role": "user", "content": user_message},
-            assistant,
-        ],
-    }
+    if for_eval == "eval_b":
+        perturb_eval_b_context(draws, sensor_context)
 
-    if set(sample.keys()) != {"metadata", "tools", "messages"}:
-        raise SchemaError("Top-level keys mismatch")
+    if validate:
+        validate_sensor_context(schemas.context_validators, sensor_context)
 
-    return sample
+    fmt = "sensor_only" if cols["sensor_only"][i] else "inquiry_plus_sensor"
+    user_message = build_user_message(draws, fmt, inquiry, sensor_context)
+    developer_message = build_developer_message(draws)
+    decision = decide_primary_risk(sensor_context)
+    assistant = build_assistant_message(draws, schemas.action_plans, bucket, decision, sensor_context)
+    sample = assemble_sample(schemas.tools_payload, for_eval, developer_message, user_message, assistant)
+    return sample, decision, sensor_context
+
+
+def generate_samples_vectorized(
+    seed: int,
+    schemas: "ToolSchemaSet",
+    bucket_list: List[str],
+    for_eval: Optional[str],
+    max_tries: int,
+    block_size: int = VECTOR_BLOCK_SIZE,
+    validate_every: int = 1,
+    stats: Optional["SplitResult"] = None,
+    dedup: Optional["SplitDeduper"] = None,
+) -> Iterator[GeneratedSample]:
+    """Block-wise sample generation backed by NumPy draws.
+
+    For each block, the common fields (user format, speed, environment,
+    sensor health, risk type, tier, confidence) are drawn as arrays with the
+    scalar path's weights. Every other draw comes from a per-sample row of
+    pre-drawn uniforms, so marginal distributions match generate_sample but
+    the output is not byte-identical to it.
+    """
+    np = require_numpy()
+    g = np.random.default_rng(seed)
+
+    def overflow_values() -> Iterator[float]:
+        while True:
+            yield from g.random(_STREAM_WIDTH).tolist()
+
+    overflow = overflow_values()
+    for start in range(0, len(bucket_list), block_size):
+        buckets = bucket_list[start : start + block_size]
+        cols = _draw_block_columns(np, g, len(buckets))
+        for i, bucket in enumerate(buckets):
+            row_cols, row = cols, i
+            draws = _UniformStream(cols["stream"][i], overflow)
+            validate = _should_validate(start + i, validate_every)
+            tries = 0
+            rejected = 0  # duplicates have their own budget, see SplitDeduper
+            while True:
+                tries += 1
+                if tries > max_tries:
+                    raise RuntimeError(f"Failed to generate valid sample after {max_tries} tries (bucket={bucket})")
+                try:
+                    sample, decision, sensor_context = _vectorized_sample(
+                        row_cols, row, draws, schemas, bucket, for_eval, validate
+                    )
+                except SchemaError:
+                    _count_validation(stats, validate, rejected=True)
+                    draws = _UniformStream([], overflow)
+                    continue
+                _count_validation(stats, validate, rejected=False)
+                if dedup is not None and not dedup.admit(sample):
+                    tries -= 1
+                    rejected += 1
+                    dedup.check_retries(rejected, bucket)
+                    # the block columns pin speed, risk and tier; redraw them for this sample
+                    row_cols, row = _draw_block_columns(np, g, 1), 0
+                    draws = _UniformStream(row_cols["stream"][0], overflow)
+                    continue
+                yield bucket, sample, decision, sensor_context
+                break
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--seed", type=int, default=42)
-    parser.add_argument("--train", type=int, default=12000)
-    parser.add_argument("--eval-a", type=int, default=1000)
-    parser.add_argument("--eval-b", type=int, default=1000)
-    parser.add_argument("--out-dir", type=str, default="DataSet")
-    parser.add_argument("--max-tries", type=int, default=30)
-    args = parser.parse_args()
+@dataclass(frozen=True)
+class ToolSchemaSet:
+    tools_payload: List[Dict[str, Any]]
+    context_validators: Dict[str, Validator]
+    action_validators: Dict[str, Validator]
+    action_plans: Dict[PlanKey, ActionPlan]
+    context_schemas: Dict[str, Dict[str, Any]]  # context tool name -> function definition
 
-    repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-    tool_schema_dir = os.path.join(repo_root, "ToolSchema")
 
+def load_tool_schema_set(tool_schema_dir: str) -> ToolSchemaSet:
     context_tool_schema_path = os.path.join(tool_schema_dir, "Context_tool_schema.json")
     action_tool_schema_path = os.path.join(tool_schema_dir, "Action_tool_schema.json")
 
@@ -639,86 +1371,1556 @@ def main() -> None:
         fn = t.get("function", {})
         action_schemas[fn["name"]] = fn
 
-    # Tools payload for each sample: include all action tool definitions
-    tools_payload = action_tools
+    # Tools payload for each sample: include all action tool definitions.
+    # Each tool's parameters schema is compiled once; per-sample checks reuse these.
+    action_validators = compile_tool_validators(action_schemas)
+    return ToolSchemaSet(
+        tools_payload=action_tools,
+        context_validators=compile_tool_validators(context_schemas),
+        action_validators=action_validators,
+        action_plans=compile_action_plans(action_validators),
+        context_schemas=context_schemas,
+    )
 
-    out_dir = os.path.join(repo_root, args.out_dir)
-    os.makedirs(out_dir, exist_ok=True)
 
-    rng = random.Random(args.seed)
+BUCKETS: List[Tuple[str, float]] = [
+    ("single_action", 0.40),
+    ("multi_action", 0.30),
+    ("no_action", 0.15),
+    ("low_confidence", 0.10),
+    ("general_conversation", 0.05),
+]
+
+
+def empty_bucket_stats() -> Dict[str, int]:
+    return {name: 0 for name, _ in BUCKETS}
 
-    def generate_file(path: str, count: int, kind: str, for_eval: Optional[str]) -> Dict[str, int]:
-        stats = {
-            "single_action": 0,
-            "multi_action": 0,
-            "no_action": 0,
-            "low_confidence": 0,
-            "general_conversation": 0,
+
+def plan_buckets(count: int) -> List[str]:
+    # Strict: keep the same batch composition for train/eval files
+    # exact counts via rounding then adjust
+    bucket_counts = {name: int(round(count * w)) for name, w in BUCKETS}
+    # fix rounding drift
+    drift = count - sum(bucket_counts.values())
+    names = [n for n, _ in BUCKETS]
+    i = 0
+    while drift != 0:
+        n = names[i % len(names)]
+        if drift > 0:
+            bucket_counts[n] += 1
+            drift -= 1
+        else:
+            if bucket_counts[n] > 0:
+                bucket_counts[n] -= 1
+                drift += 1
+        i += 1
+
+    bucket_list: List[str] = []
+    for name in names:
+        bucket_list.extend([name] * bucket_counts[name])
+    return bucket_list
+
+
+def plan_extension_buckets(existing: Dict[str, int], added: int) -> List[str]:
+    """Buckets for `added` more samples so the grown split matches plan_buckets(total)."""
+    target = Counter(plan_buckets(sum(existing.values()) + added))
+    need = {name: max(target[name] - existing.get(name, 0), 0) for name, _ in BUCKETS}
+    # a bucket already above its share cannot shrink, so take the excess from the others
+    excess = sum(need.values()) - added
+    for name, _ in BUCKETS:
+        take = min(need[name], excess)
+        need[name] -= take
+        excess -= take
+
+    bucket_list: List[str] = []
+    for name, _ in BUCKETS:
+        bucket_list.extend([name] * need[name])
+    return bucket_list
+
+
+STATS_SUFFIX = ".stats.json"
+CONFIDENCE_BINS = 20
+
+# whitespace words plus JSON punctuation: a tokenizer-free proxy for prompt length
+_TOKEN_PUNCTUATION = '{}[]:,"'
+
+
+@dataclass
+class QuantileSketch:
+    """Streaming quantiles over positive values with log-spaced buckets (DDSketch-style).
+
+    Every reported quantile is within relative_accuracy of an actual value.
+    Memory grows with log(max / min), not with the number of values, and
+    sketches merge by adding bucket counts.
+    """
+
+    relative_accuracy: float = 0.01
+    count: int = 0
+    total: float = 0.0
+    min: float = math.inf
+    max: float = -math.inf
+    zeros: int = 0
+    bins: Dict[int, int] = field(default_factory=dict)
+    _gamma: float = field(init=False, repr=False)
+    _inv_log_gamma: float = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._gamma = (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+        self._inv_log_gamma = 1.0 / math.log(self._gamma)
+
+    def add(self, x: float) -> None:
+        self.count += 1
+        self.total += x
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        if x <= 0:
+            self.zeros += 1
+            return
+        k = math.ceil(math.log(x) * self._inv_log_gamma)
+        bins = self.bins
+        bins[k] = bins.get(k, 0) + 1
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "zeros": self.zeros,
+            "bins": sorted(self.bins.items()),
         }
 
-        # Strict: keep the same batch composition for train/eval files
-        buckets = [
-            ("single_action", 0.40),
-            ("multi_action", 0.30),
-            ("no_action", 0.15),
-            ("low_confidence", 0.10),
-            ("general_conversation", 0.05),
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "QuantileSketch":
+        return cls(
+            count=state["count"],
+            total=state["total"],
+            min=state["min"],
+            max=state["max"],
+            zeros=state["zeros"],
+            bins={k: n for k, n in state["bins"]},
+        )
+
+    def merge(self, other: "QuantileSketch") -> None:
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.zeros += other.zeros
+        for k, n in other.bins.items():
+            self.bins[k] = self.bins.get(k, 0) + n
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return max(self.min, 0.0)
+        gamma = self._gamma
+        for k in sorted(self.bins):
+            seen += self.bins[k]
+            if rank < seen:
+                # bucket k covers (gamma^(k-1), gamma^k]; report its midpoint
+                return min(max(2 * gamma**k / (gamma + 1), self.min), self.max)
+        return self.max
+
+    def to_json(self) -> Dict[str, Any]:
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": round(self.total / self.count, 2),
+            "p50": round(self.quantile(0.5), 1),
+            "p90": round(self.quantile(0.9), 1),
+            "p99": round(self.quantile(0.99), 1),
+        }
+
+
+@dataclass
+class FixedHistogram:
+    lo: float
+    hi: float
+    counts: List[int]
+
+    @classmethod
+    def with_bins(cls, lo: float, hi: float, bins: int) -> "FixedHistogram":
+        return cls(lo, hi, [0] * bins)
+
+    def add(self, x: float) -> None:
+        n = len(self.counts)
+        i = int((x - self.lo) / (self.hi - self.lo) * n)
+        # hi itself lands in the last bin; out-of-range values clamp to the edges
+        self.counts[min(max(i, 0), n - 1)] += 1
+
+    def merge(self, other: "FixedHistogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"lo": self.lo, "hi": self.hi, "counts": self.counts}
+
+
+@dataclass
+class SplitStats:
+    """Per-split distribution accumulators, updated once per written line in O(1) memory."""
+
+    _COUNTERS = ("risk_types", "tiers", "assistant_kinds", "tool_calls_per_sample", "tool_names")
+    _SKETCHES = ("line_bytes", "user_chars", "user_tokens", "assistant_chars")
+
+    risk_types: Counter = field(default_factory=Counter)
+    tiers: Counter = field(default_factory=Counter)
+    assistant_kinds: Counter = field(default_factory=Counter)
+    tool_calls_per_sample: Counter = field(default_factory=Counter)
+    tool_names: Counter = field(default_factory=Counter)
+    confidence: FixedHistogram = field(default_factory=lambda: FixedHistogram.with_bins(0.0, 1.0, CONFIDENCE_BINS))
+    line_bytes: QuantileSketch = field(default_factory=QuantileSketch)
+    user_chars: QuantileSketch = field(default_factory=QuantileSketch)
+    user_tokens: QuantileSketch = field(default_factory=QuantileSketch)
+    assistant_chars: QuantileSketch = field(default_factory=QuantileSketch)
+
+    def add(self, sample: Dict[str, Any], decision: Optional[RiskDecision], line_bytes: int) -> None:
+        if decision is None:
+            self.risk_types["none"] += 1
+        else:
+            self.risk_types[decision.risk_type] += 1
+            self.tiers[decision.tier] += 1
+            self.confidence.add(decision.confidence)
+
+        messages = sample["messages"]
+        user = messages[1]["content"]
+        self.user_chars.add(len(user))
+        self.user_tokens.add(len(user.split()) + sum(map(user.count, _TOKEN_PUNCTUATION)))
+
+        assistant = messages[2]
+        tool_calls = assistant.get("tool_calls") or []
+        self.assistant_kinds["tool_calls" if tool_calls else "text"] += 1
+        self.tool_calls_per_sample[str(len(tool_calls))] += 1
+        for call in tool_calls:
+            self.tool_names[call["function"]["name"]] += 1
+        self.assistant_chars.add(len(assistant.get("content") or ""))
+        self.line_bytes.add(line_bytes)
+
+    def merge(self, other: "SplitStats") -> None:
+        for name in self._COUNTERS:
+            getattr(self, name).update(getattr(other, name))
+        for name in ("confidence",) + self._SKETCHES:
+            getattr(self, name).merge(getattr(other, name))
+
+    def state(self) -> Dict[str, Any]:
+        """Raw accumulators (unlike to_json, nothing is summarized), so a split can keep growing."""
+        state: Dict[str, Any] = {name: dict(getattr(self, name)) for name in self._COUNTERS}
+        state["confidence"] = self.confidence.counts
+        for name in self._SKETCHES:
+            state[name] = getattr(self, name).state()
+        return state
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "SplitStats":
+        stats = cls()
+        for name in cls._COUNTERS:
+            getattr(stats, name).update(state[name])
+        stats.confidence.counts = list(state["confidence"])
+        for name in cls._SKETCHES:
+            setattr(stats, name, QuantileSketch.from_state(state[name]))
+        return stats
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "risk_types": dict(self.risk_types.most_common()),
+            "tiers": dict(self.tiers.most_common()),
+            "confidence_histogram": self.confidence.to_json(),
+            "assistant": dict(self.assistant_kinds.most_common()),
+            "tool_calls_per_sample": dict(sorted(self.tool_calls_per_sample.items())),
+            "tool_names": dict(self.tool_names.most_common()),
+            "lengths": {
+                "line_bytes": self.line_bytes.to_json(),
+                "user_chars": self.user_chars.to_json(),
+                "user_tokens": self.user_tokens.to_json(),
+                "assistant_chars": self.assistant_chars.to_json(),
+            },
+        }
+
+
+# --columnar format -> file suffix of the per-split columnar file
+COLUMNAR_FORMATS = {"off": "", "parquet": ".parquet", "arrow": ".arrow"}
+COLUMNAR_BATCH_ROWS = 65536
+
+
+def require_pyarrow():
+    try:
+        import pyarrow  # type: ignore
+        import pyarrow.compute  # type: ignore  # noqa: F401
+        import pyarrow.ipc  # type: ignore  # noqa: F401
+        import pyarrow.parquet  # type: ignore  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError("Columnar export requires pyarrow. Install first: pip install pyarrow") from e
+    return pyarrow
+
+
+class ColumnarWriter:
+    """One typed row per JSONL line, written as Parquet or Arrow IPC next to the split.
+
+    Columns: line (0-based line number), offset and length (the line's byte
+    range in the uncompressed JSONL, newline included), bucket, risk_type,
+    tier and confidence of the primary risk (null without one), tool_names
+    (action tools called, in order), and one "<tool>.<field>" column per
+    context tool parameter, null when the tool is absent from the sample.
+    Labels and enum fields are dictionary-encoded against their fixed value
+    sets, so every batch shares one dictionary; array fields hold JSON text.
+
+    Rows are buffered and written in batches of batch_rows (one Parquet row
+    group each). The file is written under a temporary name and moved into
+    place by close(), so the previous file stays readable until then.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fmt: str,
+        context_schemas: Dict[str, Dict[str, Any]],
+        batch_rows: int = COLUMNAR_BATCH_ROWS,
+    ) -> None:
+        pa = require_pyarrow()
+        self._pa = pa
+        self.path = path
+        self.fmt = fmt
+        self.batch_rows = batch_rows
+        # added to line/offset of every row from add(); --extend and shards start past earlier lines
+        self.line_base = 0
+        self.offset_base = 0
+
+        label = pa.dictionary(pa.int8(), pa.string())
+        scalars = {"boolean": pa.bool_(), "integer": pa.int64(), "number": pa.float64(), "string": pa.string()}
+        fields = [
+            pa.field("line", pa.int64(), nullable=False),
+            pa.field("offset", pa.int64(), nullable=False),
+            pa.field("length", pa.int32(), nullable=False),
+            pa.field("bucket", label, nullable=False),
+            pa.field("risk_type", label),
+            pa.field("tier", label),
+            pa.field("confidence", pa.float64()),
+            pa.field("tool_names", pa.list_(pa.string())),
         ]
+        # label column -> its values; a row's index into them is what gets stored
+        self._labels: Dict[str, List[str]] = {
+            "bucket": [name for name, _ in BUCKETS],
+            "risk_type": list(PRIORITY_ORDER),
+            "tier": list(CONFIDENCE_TIERS),
+        }
+        # (column, context tool, parameter, store as JSON text)
+        self._context: List[Tuple[str, str, str, bool]] = []
+        for tool, fn in context_schemas.items():
+            for name, prop in fn.get("parameters", {}).get("properties", {}).items():
+                kind = str(prop.get("type", "")).lower()
+                column = f"{tool}.{name}"
+                if "enum" in prop:
+                    fields.append(pa.field(column, label))
+                    self._labels[column] = list(prop["enum"])
+                else:
+                    fields.append(pa.field(column, scalars.get(kind, pa.string())))
+                self._context.append((column, tool, name, kind not in scalars))
+        self.schema = pa.schema(fields)
+        self._dictionaries = {
+            column: (pa.array(values, pa.string()), {v: i for i, v in enumerate(values)})
+            for column, values in self._labels.items()
+        }
+        self._rows: Dict[str, List[Any]] = {f.name: [] for f in fields}
+
+        self._tmp_path = path + ".tmp"
+        if fmt == "parquet":
+            self._writer = pa.parquet.ParquetWriter(self._tmp_path, self.schema, compression="zstd")
+        elif fmt == "arrow":
+            self._writer = pa.ipc.new_file(self._tmp_path, self.schema)
+        else:
+            raise ValueError(fmt)
+
+    def add(
+        self,
+        line: int,
+        offset: int,
+        length: int,
+        bucket: str,
+        sample: Dict[str, Any],
+        decision: Optional[RiskDecision],
+        sensor_context: Dict[str, Any],
+    ) -> None:
+        rows = self._rows
+        rows["line"].append(self.line_base + line)
+        rows["offset"].append(self.offset_base + offset)
+        rows["length"].append(length)
+        rows["bucket"].append(bucket)
+        rows["risk_type"].append(decision.risk_type if decision is not None else None)
+        rows["tier"].append(decision.tier if decision is not None else None)
+        rows["confidence"].append(decision.confidence if decision is not None else None)
+        tool_calls = sample["messages"][2].get("tool_calls") or []
+        rows["tool_names"].append([call["function"]["name"] for call in tool_calls])
+        for column, tool, name, as_json in self._context:
+            params = sensor_context.get(tool)
+            value = params.get(name) if params is not None else None
+            if as_json and value is not None:
+                value = json_dumps_one_line(value)
+            rows[column].append(value)
+        if len(rows["line"]) >= self.batch_rows:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._rows["line"]:
+            return
+        pa = self._pa
+        arrays = []
+        for f in self.schema:
+            values = self._rows[f.name]
+            if f.name not in self._dictionaries:
+                arrays.append(pa.array(values, f.type))
+                continue
+            dictionary, index = self._dictionaries[f.name]
+            try:
+                indices = [None if v is None else index[v] for v in values]
+            except KeyError as e:
+                raise SchemaError(f"{f.name}: {e.args[0]!r} is not one of {self._labels[f.name]}") from None
+            arrays.append(pa.DictionaryArray.from_arrays(pa.array(indices, pa.int8()), dictionary))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        for values in self._rows.values():
+            values.clear()
+
+    def append_from(self, path: str, line_base: int, offset_base: int) -> None:
+        """Copy the rows of another columnar file of this format, shifting line and offset."""
+        pa = self._pa
+        self._flush()
+        if self.fmt == "parquet":
+            batches = pa.parquet.ParquetFile(path).iter_batches(batch_size=self.batch_rows)
+        else:
+            reader = pa.ipc.open_file(path)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        for batch in batches:
+            table = pa.Table.from_batches([batch]).cast(self.schema)
+            for name, base in (("line", line_base), ("offset", offset_base)):
+                if base:
+                    i = self.schema.get_field_index(name)
+                    table = table.set_column(i, self.schema.field(i), pa.compute.add(table.column(i), base))
+            self._writer.write_table(table)
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        self._writer.close()
+        os.remove(self._tmp_path)
+
+
+@contextmanager
+def open_columnar_writer(
+    path: str, fmt: str, context_schemas: Dict[str, Dict[str, Any]]
+) -> Iterator[Optional[ColumnarWriter]]:
+    """ColumnarWriter for --columnar fmt, or None when columnar export is off."""
+    if fmt == "off":
+        yield None
+        return
+    writer = ColumnarWriter(path, fmt, context_schemas)
+    try:
+        yield writer
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+
+DEDUP_MODES = ("off", "exact", "near")
+NEAR_DUP_SPEED_STEP = 5.0  # km/h; speeds in the same step count as equal
+NEAR_DUP_FLOAT_DIGITS = 1  # other floats are compared at this many decimals
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _assistant_text(message: Dict[str, Any]) -> str:
+    if message.get("tool_calls"):
+        return json.dumps(message["tool_calls"], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return _normalize_text(message.get("content") or "")
 
-        # exact counts via rounding then adjust
-        bucket_counts = {name: int(round(count * w)) for name, w in buckets}
-        # fix rounding drift
-        drift = count - sum(bucket_counts.values())
-        names = [n for n, _ in buckets]
-        i = 0
-        while drift != 0:
-            n = names[i % len(names)]
-            if drift > 0:
-                bucket_counts[n] += 1
-                drift -= 1
+
+def exact_dedup_key(sample: Dict[str, Any]) -> int:
+    """64-bit hash of the whitespace-normalized messages."""
+    developer, user, assistant = sample["messages"]
+    return _hash64("\x1f".join((_normalize_text(developer["content"]), _normalize_text(user["content"]), _assistant_text(assistant))))
+
+
+def _quantize(value: Any) -> Any:
+    if isinstance(value, float):
+        return round(value, NEAR_DUP_FLOAT_DIGITS)
+    if isinstance(value, dict):
+        return {k: _quantize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_quantize(v) for v in value]
+    return value
+
+
+def near_dedup_key(sample: Dict[str, Any]) -> int:
+    """64-bit hash of the user inquiry and a coarsened SENSOR_CONTEXT.
+
+    Samples whose prompts differ only by speed within NEAR_DUP_SPEED_STEP or
+    other floats below NEAR_DUP_FLOAT_DIGITS share a key, whatever the
+    developer message or the assistant's phrasing.
+    """
+    user = sample["messages"][1]["content"]
+    inquiry, _, sensor_json = user.partition(SENSOR_CONTEXT_MARKER)
+    sensor_context = _quantize(json.loads(sensor_json)) if sensor_json else {}
+    speed = sensor_context.get("get_vehicle_speed")
+    if isinstance(speed, dict) and isinstance(speed.get("value"), (int, float)):
+        speed["value"] = int(speed["value"] // NEAR_DUP_SPEED_STEP)
+    return _hash64(_normalize_text(inquiry) + "\x1f" + json.dumps(sensor_context, sort_keys=True, separators=(",", ":")))
+
+
+def dedup_key(sample: Dict[str, Any], near: bool) -> int:
+    return near_dedup_key(sample) if near else exact_dedup_key(sample)
+
+
+# ExactHashIndex buffers at least this many new keys before sorting them in
+EXACT_INDEX_MIN_PENDING = 4096
+
+
+class ExactHashIndex:
+    """Sorted uint64 array of sample hashes; no false positives, 8 bytes per key.
+
+    New keys go to a small set that is merged into the sorted array once it
+    outgrows an eighth of it, so lookups are a set probe plus a binary search
+    and merging stays amortized O(1) per key.
+    """
+
+    def __init__(self) -> None:
+        self._keys = array("Q")  # sorted, unique
+        self._pending: set = set()
+
+    def _compact(self) -> None:
+        if self._pending:
+            self._keys = _merge_unique(self._keys, array("Q", sorted(self._pending)))
+            self._pending = set()
+
+    def add(self, key: int) -> None:
+        self._pending.add(key)
+        if len(self._pending) > max(EXACT_INDEX_MIN_PENDING, len(self._keys) // 8):
+            self._compact()
+
+    def __contains__(self, key: int) -> bool:
+        if key in self._pending:
+            return True
+        keys = self._keys
+        i = bisect.bisect_left(keys, key)
+        return i < len(keys) and keys[i] == key
+
+    def merge(self, other: "ExactHashIndex") -> None:
+        self._compact()
+        other._compact()
+        self._keys = _merge_unique(self._keys, other._keys)
+
+    def empty_like(self) -> "ExactHashIndex":
+        return ExactHashIndex()
+
+    @property
+    def nbytes(self) -> int:
+        self._compact()
+        return self._keys.itemsize * len(self._keys)
+
+    def __len__(self) -> int:
+        self._compact()
+        return len(self._keys)
+
+
+def _merge_unique(a: "array[int]", b: "array[int]") -> "array[int]":
+    """Union of two sorted uint64 arrays, streamed into a new array without intermediate lists."""
+    return array("Q", (key for key, _ in itertools.groupby(heapq.merge(a, b))))
+
+
+BLOOM_MERGE_CHUNK = 64 * 1024
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over 64-bit sample hashes.
+
+    Memory is set up front from the expected count and false-positive rate.
+    A false positive only rejects a fresh sample, which is then regenerated,
+    so duplicates never leak.
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.error_rate = error_rate
+        self.capacity = capacity
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: int) -> Iterator[int]:
+        # double hashing from the two 32-bit halves of the key
+        h1 = key & 0xFFFFFFFF
+        h2 = (key >> 32) | 1
+        size = self.size
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % size
+
+    def add(self, key: int) -> None:
+        bits = self._bits
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: int) -> bool:
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def merge(self, other: "BloomFilter") -> None:
+        if other.size != self.size or other.hashes != self.hashes:
+            raise ValueError("Bloom filters differ in shape")
+        # OR in place a chunk at a time, so the extra memory is one chunk, not the whole filter
+        bits = self._bits
+        src = memoryview(other._bits)
+        for start in range(0, len(bits), BLOOM_MERGE_CHUNK):
+            end = min(start + BLOOM_MERGE_CHUNK, len(bits))
+            merged = int.from_bytes(bits[start:end], "little") | int.from_bytes(src[start:end], "little")
+            bits[start:end] = merged.to_bytes(end - start, "little")
+
+    def empty_like(self) -> "BloomFilter":
+        return BloomFilter(self.capacity, self.error_rate)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+
+DedupIndex = Any  # ExactHashIndex | BloomFilter
+
+
+# consecutive duplicate rejections allowed for one line (--dedup-max-retries)
+DEDUP_MAX_RETRIES = 1000
+
+
+@dataclass
+class SplitDeduper:
+    """Rejects samples whose key was produced by an earlier split.
+
+    `seen` holds the earlier splits and is read-only while this split is
+    generated, so process-pool shards can each carry a copy; `current`
+    collects this split's keys and is merged into `seen` afterwards.
+    Duplicates within one split are allowed.
+
+    Rejections have their own budget, separate from --max-tries: a sample
+    that is regenerated max_retries times in a row because it keeps matching
+    an earlier split means its bucket has run out of distinct samples.
+    """
+
+    near: bool
+    seen: DedupIndex
+    current: DedupIndex
+    duplicates: int = 0
+    max_retries: int = DEDUP_MAX_RETRIES
+
+    def admit(self, sample: Dict[str, Any]) -> bool:
+        key = dedup_key(sample, self.near)
+        if key in self.seen:
+            self.duplicates += 1
+            return False
+        if key not in self.current:
+            self.current.add(key)
+        return True
+
+    def check_retries(self, rejected: int, bucket: str) -> None:
+        """Raise once `rejected` consecutive samples for one line were duplicates."""
+        if rejected > self.max_retries:
+            raise RuntimeError(
+                f"--dedup {'near' if self.near else 'exact'}: {rejected} samples in a row for bucket={bucket} "
+                "duplicated earlier splits; the bucket has too few distinct samples left "
+                "(raise --dedup-max-retries or use a smaller split)"
+            )
+
+
+@dataclass
+class SplitResult:
+    buckets: Dict[str, int] = field(default_factory=lambda: empty_bucket_stats())
+    bytes: int = 0  # uncompressed JSONL bytes
+    validated: int = 0  # generation attempts checked against the schemas
+    rejected: int = 0  # of those, attempts that failed and were retried
+    stats: SplitStats = field(default_factory=SplitStats)
+    duplicates: int = 0  # samples regenerated because an earlier split already had them
+    dedup_keys: Optional[DedupIndex] = None  # this split's keys, when dedup is on
+
+    def manifest_fields(self) -> Dict[str, Any]:
+        return {
+            "buckets": self.buckets,
+            "bytes": self.bytes,
+            "validated": self.validated,
+            "rejected": self.rejected,
+            "duplicates": self.duplicates,
+        }
+
+    @classmethod
+    def from_manifest(cls, fields: Dict[str, Any]) -> "SplitResult":
+        # stats are not kept in the manifest; the split's stats.json is already on disk
+        return cls(
+            buckets=dict(fields["buckets"]),
+            bytes=fields["bytes"],
+            validated=fields["validated"],
+            rejected=fields["rejected"],
+            duplicates=fields["duplicates"],
+        )
+
+    def merge(self, other: "SplitResult") -> None:
+        for k, v in other.buckets.items():
+            self.buckets[k] += v
+        self.bytes += other.bytes
+        self.validated += other.validated
+        self.rejected += other.rejected
+        self.stats.merge(other.stats)
+        self.duplicates += other.duplicates
+        if other.dedup_keys is not None:
+            if self.dedup_keys is None:
+                self.dedup_keys = other.dedup_keys
             else:
-                if bucket_counts[n] > 0:
-                    bucket_counts[n] -= 1
-                    drift += 1
-            i += 1
-
-        bucket_list: List[str] = []
-        for name in names:
-            bucket_list.extend([name] * bucket_counts[name])
-        rng.shuffle(bucket_list)
+                self.dedup_keys.merge(other.dedup_keys)
 
-        with open(path, "w", encoding="utf-8") as f:
-            for bucket in bucket_list:
-                tries = 0
-                while True:
-                    tries += 1
-                    if tries > args.max_tries:
-                        raise RuntimeError(f"Failed to generate valid sample after {args.max_tries} tries (bucket={bucket})")
-                    try:
-                        sample = generate_sample(rng, tools_payload, context_schemas, action_schemas, bucket=bucket, for_eval=for_eval)
-                        # final JSONL line must be single line
-                        line = json_dumps_one_line(sample)
-                        if "\n" in line or "\r" in line:
-                            raise SchemaError("JSONL line contains newline")
-                        f.write(line + "\n")
-                        stats[bucket] += 1
-                        break
-                    except SchemaError:
-                        continue
-        return stats
+    def validation_stats(self) -> Dict[str, Any]:
+        return {
+            "validated": self.validated,
+            "rejected": self.rejected,
+            "rejection_rate": round(self.rejected / self.validated, 6) if self.validated else 0.0,
+        }
+
+
+# <split>.jsonl[.gz|.zst] + LABELS_SUFFIX: "bucket\trisk_type\ttier" per JSONL line, LABEL_NONE without a risk
+LABELS_SUFFIX = ".labels"
+LABEL_FIELDS = ("bucket", "risk_type", "tier")
+LABEL_NONE = "-"
+
+# label field -> every value it can take, in a stable order
+LABEL_VALUES: Dict[str, List[str]] = {
+    "bucket": [name for name, _ in BUCKETS],
+    "risk_type": list(PRIORITY_ORDER),
+    "tier": list(CONFIDENCE_TIERS),
+}
+
+
+def line_labels(bucket: str, decision: Optional[RiskDecision]) -> bytes:
+    if decision is None:
+        return f"{bucket}\t{LABEL_NONE}\t{LABEL_NONE}\n".encode("utf-8")
+    return f"{bucket}\t{decision.risk_type}\t{decision.tier}\n".encode("utf-8")
+
+
+# --structured: extra top-level key on every line with the labels and the sensor context dict
+STRUCTURED_FIELD = "structured"
+
+
+def structured_fields(bucket: str, decision: Optional[RiskDecision], sensor_context: Dict[str, Any]) -> Dict[str, Any]:
+    risk_decision = None
+    if decision is not None:
+        risk_decision = {"risk_type": decision.risk_type, "confidence": decision.confidence, "tier": decision.tier}
+    return {"bucket": bucket, "risk_decision": risk_decision, "sensor_context": sensor_context}
+
+
+# --validate mode -> default validate_every (0 = never, 1 = every sample)
+VALIDATION_MODES: Dict[str, int] = {"all": 1, "sampled": 100, "off": 0}
+
+
+def _should_validate(index: int, validate_every: int) -> bool:
+    return validate_every > 0 and index % validate_every == 0
+
+
+def _count_validation(stats: Optional[SplitResult], validated: bool, rejected: bool) -> None:
+    if stats is None or not validated:
+        return
+    stats.validated += 1
+    if rejected:
+        stats.rejected += 1
+
+
+def generate_samples_scalar(
+    rng: random.Random,
+    schemas: ToolSchemaSet,
+    bucket_list: List[str],
+    for_eval: Optional[str],
+    max_tries: int,
+    validate_every: int = 1,
+    stats: Optional[SplitResult] = None,
+    dedup: Optional[SplitDeduper] = None,
+) -> Iterator[GeneratedSample]:
+    for index, bucket in enumerate(bucket_list):
+        validate = _should_validate(index, validate_every)
+        tries = 0
+        rejected = 0  # duplicates have their own budget, see SplitDeduper
+        while True:
+            tries += 1
+            if tries > max_tries:
+                raise RuntimeError(f"Failed to generate valid sample after {max_tries} tries (bucket={bucket})")
+            try:
+                sample, decision, sensor_context = generate_labeled_sample(
+                    rng,
+                    schemas.tools_payload,
+                    schemas.context_validators,
+                    schemas.action_plans,
+                    bucket=bucket,
+                    for_eval=for_eval,
+                    validate=validate,
+                )
+            except SchemaError:
+                _count_validation(stats, validate, rejected=True)
+                continue
+            _count_validation(stats, validate, rejected=False)
+            if dedup is not None and not dedup.admit(sample):
+                tries -= 1
+                rejected += 1
+                dedup.check_retries(rejected, bucket)
+                continue
+            yield bucket, sample, decision, sensor_context
+            break
+
+
+def write_samples(
+    f: BinaryIO,
+    rng: random.Random,
+    schemas: ToolSchemaSet,
+    bucket_list: List[str],
+    for_eval: Optional[str],
+    max_tries: int,
+    tools_ref: Optional[str] = None,
+    engine: str = "scalar",
+    block_size: int = VECTOR_BLOCK_SIZE,
+    validate_every: int = 1,
+    dedup: Optional[SplitDeduper] = None,
+    columnar: Optional[ColumnarWriter] = None,
+    index: Optional[LineIndexWriter] = None,
+    labels: Optional[BinaryIO] = None,
+    structured: bool = False,
+) -> SplitResult:
+    result = SplitResult()
+    encoder = SampleLineEncoder(schemas.tools_payload, tools_ref=tools_ref)
+    samples: Iterator[GeneratedSample]
+    if engine == "vectorized":
+        # the NumPy generator is seeded from the split's RNG, so runs stay reproducible
+        samples = generate_samples_vectorized(
+            rng.getrandbits(64), schemas, bucket_list, for_eval, max_tries, block_size, validate_every, result, dedup
+        )
+    else:
+        samples = generate_samples_scalar(rng, schemas, bucket_list, for_eval, max_tries, validate_every, result, dedup)
+    for line_no, (bucket, sample, decision, sensor_context) in enumerate(samples):
+        # final JSONL line must be single line
+        line = encoder.encode(sample)
+        if structured:
+            # spliced after encoding so the sample itself (stats, dedup, columnar rows) is unchanged
+            extra = json_dumps_one_line(structured_fields(bucket, decision, sensor_context))
+            line = line[:-1] + ',"' + STRUCTURED_FIELD + '":' + extra + "}"
+        # json escapes control characters, so a raw newline means an encoder bug, not bad data
+        assert "\n" not in line and "\r" not in line, "JSONL line contains newline"
+        data = (line + "\n").encode("utf-8")
+        f.write(data)
+        if columnar is not None:
+            columnar.add(line_no, result.bytes, len(data), bucket, sample, decision, sensor_context)
+        result.buckets[bucket] += 1
+        result.bytes += len(data)
+        if index is not None:
+            index.add(result.bytes)
+        if labels is not None:
+            labels.write(line_labels(bucket, decision))
+        result.stats.add(sample, decision, len(data))
+    if dedup is not None:
+        result.duplicates = dedup.duplicates
+        result.dedup_keys = dedup.current
+    return result
+
+
+def write_split_stats(path: str, split: str, result: SplitResult) -> None:
+    samples = sum(result.buckets.values())
+    stats = {"split": split, "samples": samples, "bytes": result.bytes, "buckets": result.buckets}
+    stats.update(result.stats.to_json())
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+BUILD_MANIFEST_FILE = "build_manifest.json"
+
+
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(WRITE_BUFFER_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_stamp(path: str) -> List[int]:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def generator_version() -> str:
+    # any edit to this script invalidates previously built splits
+    return sha256_file(os.path.abspath(__file__))
+
+
+def schema_hashes(tool_schema_dir: str) -> Dict[str, str]:
+    return {
+        name: sha256_file(os.path.join(tool_schema_dir, name))
+        for name in sorted(os.listdir(tool_schema_dir))
+        if name.endswith(".json")
+    }
+
+
+def split_build_key(params: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class BuildManifest:
+    """build_manifest.json: how each split in an output dir was built.
+
+    "splits" maps a split name to its build key, the sha256 of each output
+    file, the result counters and the RNG state after the split, so later
+    splits can be rebuilt without regenerating an up-to-date earlier one.
+    Each digest has a [size, mtime_ns] stamp next to it; a file whose stamp
+    still matches is trusted without being read again.
+    Other top-level sections (the uploader's "uploads") are preserved.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.splits: Dict[str, Dict[str, Any]] = self._read().get("splits", {})
+
+    def _read(self) -> Dict[str, Any]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            data = load_json(self.path)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def up_to_date(self, split: str, key: str, out_dir: str) -> Optional[Dict[str, Any]]:
+        entry = self.splits.get(split)
+        if entry is None or entry.get("key") != key:
+            return None
+        stamps = entry.setdefault("stamps", {})
+        restamped = False
+        for name, digest in entry.get("files", {}).items():
+            path = os.path.join(out_dir, name)
+            if not os.path.exists(path):
+                return None
+            stamp = file_stamp(path)
+            if stamps.get(name) == stamp:
+                continue
+            # touched or copied since it was recorded: only the content decides
+            if sha256_file(path) != digest:
+                return None
+            stamps[name] = stamp
+            restamped = True
+        if restamped:
+            self.record(split, entry)
+        return entry
+
+    @staticmethod
+    def fingerprint(out_dir: str, names: List[str]) -> Dict[str, Any]:
+        """The "files" and "stamps" fields of an entry for the named output files."""
+        paths = {name: os.path.join(out_dir, name) for name in names}
+        return {
+            "files": {name: sha256_file(path) for name, path in paths.items()},
+            "stamps": {name: file_stamp(path) for name, path in paths.items()},
+        }
 
-    train_path = os.path.join(out_dir, "train.jsonl")
-    eval_a_path = os.path.join(out_dir, "eval_a.jsonl")
-    eval_b_path = os.path.join(out_dir, "eval_b.jsonl")
+    def record(self, split: str, entry: Dict[str, Any]) -> None:
+        self.splits[split] = entry
+        # re-read so sections written by other tools since we loaded are kept
+        data = self._read()
+        data["splits"] = self.splits
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        os.replace(tmp, self.path)
+
+
+def encode_rng_state(rng: random.Random) -> List[Any]:
+    version, internal, gauss_next = rng.getstate()
+    return [version, list(internal), gauss_next]
+
+
+def decode_rng_state(state: List[Any]) -> Tuple[Any, ...]:
+    version, internal, gauss_next = state
+    return (version, tuple(internal), gauss_next)
+
+
+def load_dedup_keys(path: str, compress: str, near: bool, index: DedupIndex) -> None:
+    """Add the dedup keys of an already generated split file to index."""
+    with open_jsonl_reader(path, compress) as f:
+        for line in f:
+            if line.strip():
+                index.add(dedup_key(json.loads(line), near))
+
+
+def derive_shard_seed(seed: int, kind: str, shard_index: int) -> int:
+    digest = hashlib.sha256(f"{seed}:{kind}:{shard_index}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def split_shards(items: List[str], n: int) -> List[List[str]]:
+    size, rem = divmod(len(items), n)
+    shards: List[List[str]] = []
+    start = 0
+    for i in range(n):
+        end = start + size + (1 if i < rem else 0)
+        shards.append(items[start:end])
+        start = end
+    return shards
+
+
+_WORKER_SCHEMAS: Optional[ToolSchemaSet] = None
+
+
+def _init_shard_worker(tool_schema_dir: str) -> None:
+    global _WORKER_SCHEMAS
+    _WORKER_SCHEMAS = load_tool_schema_set(tool_schema_dir)
+
+
+def _generate_shard(
+    path: str,
+    seed: int,
+    bucket_list: List[str],
+    for_eval: Optional[str],
+    max_tries: int,
+    tools_ref: Optional[str],
+    compress: str,
+    engine: str,
+    block_size: int,
+    validate_every: int,
+    dedup: Optional[SplitDeduper],
+    columnar: str,
+    structured: bool,
+) -> SplitResult:
+    """Write one shard's JSONL to path, its line index and labels to path + INDEX_SUFFIX / LABELS_SUFFIX
+    and, unless columnar is "off", its rows to path + the columnar suffix."""
+    assert _WORKER_SCHEMAS is not None
+    rng = random.Random(seed)
+    columnar_path = path + COLUMNAR_FORMATS[columnar]
+    with open_jsonl_writer(path, compress) as f, open_line_index_writer(path + INDEX_SUFFIX) as index, open(
+        path + LABELS_SUFFIX, "wb"
+    ) as labels, open_columnar_writer(columnar_path, columnar, _WORKER_SCHEMAS.context_schemas) as columnar_writer:
+        return write_samples(
+            f,
+            rng,
+            _WORKER_SCHEMAS,
+            bucket_list,
+            for_eval,
+            max_tries,
+            tools_ref,
+            engine,
+            block_size,
+            validate_every,
+            dedup,
+            columnar_writer,
+            index,
+            labels,
+            structured,
+        )
 
-    train_stats = generate_file(train_path, args.train, "train", None)
-    eval_a_stats = generate_file(eval_a_path, args.eval_a, "eval_a", "eval_a")
-    eval_b_stats = generate_file(eval_b_path, args.eval_b, "eval_b", "eval_b")
 
-    summary = {
-        "train": train_stats,
-        "eval_a": eval_a_stats,
-        "eval_b": eval_b_stats,
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--train", type=int, default=12000)
+    parser.add_argument("--eval-a", type=int, default=1000)
+    parser.add_argument("--eval-b", type=int, default=1000)
+    parser.add_argument("--out-dir", type=str, default="DataSet")
+    parser.add_argument("--max-tries", type=int, default=30)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Generate each file as N independently seeded shards in a process pool (1 = single shared RNG)",
+    )
+    parser.add_argument(
+        "--tools-format",
+        choices=["inline", "ref"],
+        default="inline",
+        help="inline: embed the action tools in every sample; ref: write tools.json and store a tools_ref per sample",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=sorted(COMPRESSION_SUFFIXES),
+        default="none",
+        help="Write .jsonl.gz / .jsonl.zst instead of plain .jsonl",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["scalar", "vectorized"],
+        default="scalar",
+        help="vectorized: draw common fields per block with NumPy (same distributions, different samples)",
+    )
+    parser.add_argument("--block-size", type=int, default=VECTOR_BLOCK_SIZE, help="Samples per vectorized block")
+    parser.add_argument(
+        "--validate",
+        choices=list(VALIDATION_MODES),
+        default="all",
+        help="all: schema-check every sample; sampled: every --validate-every'th; off: none. "
+        "sampled/off run a generator self-test at startup first",
+    )
+    parser.add_argument(
+        "--validate-every",
+        type=int,
+        default=0,
+        help=f"Sample interval for --validate sampled (default {VALIDATION_MODES['sampled']})",
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=DEDUP_MODES,
+        default="off",
+        help="Regenerate eval samples already produced by an earlier split. exact: same normalized messages; "
+        "near: same inquiry and SENSOR_CONTEXT after coarsening speed/floats",
+    )
+    parser.add_argument(
+        "--dedup-index",
+        choices=["set", "bloom"],
+        default="set",
+        help="set: exact sorted array of 64-bit hashes (8 bytes per sample); bloom: fixed-size Bloom filter for very large runs",
+    )
+    parser.add_argument(
+        "--dedup-error-rate",
+        type=float,
+        default=1e-6,
+        help="Bloom filter false-positive rate (a false positive only costs a regeneration)",
+    )
+    parser.add_argument(
+        "--dedup-max-retries",
+        type=int,
+        default=DEDUP_MAX_RETRIES,
+        help="Duplicate rejections allowed in a row for one line before the build fails (separate from --max-tries)",
+    )
+    parser.add_argument(
+        "--columnar",
+        choices=list(COLUMNAR_FORMATS),
+        default="off",
+        help="Also write <split>.parquet / <split>.arrow with one typed row per sample (bucket, risk, tools, "
+        "flattened sensor context, JSONL byte offsets) for filtering without JSON parsing. Requires pyarrow",
+    )
+    parser.add_argument(
+        "--structured",
+        action="store_true",
+        default=False,
+        help=f'Add a "{STRUCTURED_FIELD}" key to every line with the bucket, the primary RiskDecision and the '
+        "sensor context dict, so evaluators need not parse SENSOR_CONTEXT out of the user message",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        default=False,
+        help=f"Regenerate every split even if {BUILD_MANIFEST_FILE} says it is up to date",
+    )
+    parser.add_argument(
+        "--extend",
+        action="store_true",
+        default=False,
+        help="Grow already built splits to the --train/--eval-a/--eval-b counts by appending lines "
+        "from each split's own RNG stream; existing lines are neither read nor rewritten",
+    )
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers must be >= 1")
+    if args.compress == "zstd":
+        try:
+            require_zstandard()
+        except RuntimeError as e:
+            parser.error(str(e))
+    if args.engine == "vectorized":
+        try:
+            require_numpy()
+        except RuntimeError as e:
+            parser.error(str(e))
+        if args.block_size < 1:
+            parser.error("--block-size must be >= 1")
+    if args.validate_every < 0:
+        parser.error("--validate-every must be >= 0")
+    if args.validate_every and args.validate != "sampled":
+        parser.error("--validate-every only applies with --validate sampled")
+    validate_every = VALIDATION_MODES[args.validate]
+    if args.validate_every:
+        validate_every = args.validate_every
+    if args.dedup_max_retries < 1:
+        parser.error("--dedup-max-retries must be >= 1")
+    if not 0 < args.dedup_error_rate < 1:
+        parser.error("--dedup-error-rate must be between 0 and 1")
+    if args.columnar != "off":
+        try:
+            require_pyarrow()
+        except RuntimeError as e:
+            parser.error(str(e))
+    if args.extend and args.force:
+        parser.error("--extend and --force are mutually exclusive")
+    if args.extend and args.dedup != "off":
+        # checking new lines against the other splits would mean reading all of them
+        parser.error("--extend does not support --dedup")
+
+    repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    tool_schema_dir = os.path.join(repo_root, "ToolSchema")
+
+    schemas = load_tool_schema_set(tool_schema_dir)
+
+    self_test_samples = 0
+    if validate_every != 1:
+        # production runs skip most per-sample checks, so prove the generators first
+        try:
+            self_test_samples = self_test_generators(schemas)
+        except SchemaError as e:
+            raise SystemExit(f"Generator self-test failed: {e}")
+
+    out_dir = os.path.join(repo_root, args.out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+
+    tools_ref: Optional[str] = None
+    if args.tools_format == "ref":
+        tools_ref = write_tools_dictionary(os.path.join(out_dir, TOOLS_DICTIONARY_FILE), schemas.tools_payload)
+
+    rng = random.Random(args.seed)
+
+    pool: Optional[ProcessPoolExecutor] = None
+    if args.workers > 1:
+        pool = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_shard_worker, initargs=(tool_schema_dir,))
+
+    # keys of every split generated so far; later splits regenerate samples found here
+    dedup_seen: Optional[DedupIndex] = None
+    # a Bloom filter is sized for every split, so its false positives in each split depend on all counts
+    bloom_capacity = args.train + args.eval_a + args.eval_b if args.dedup != "off" and args.dedup_index == "bloom" else None
+    if args.dedup != "off":
+        if bloom_capacity is not None:
+            dedup_seen = BloomFilter(bloom_capacity, args.dedup_error_rate)
+        else:
+            dedup_seen = ExactHashIndex()
+
+    def new_deduper() -> Optional[SplitDeduper]:
+        if dedup_seen is None:
+            return None
+        return SplitDeduper(
+            near=args.dedup == "near",
+            seen=dedup_seen,
+            current=dedup_seen.empty_like(),
+            max_retries=args.dedup_max_retries,
+        )
+
+    manifest = BuildManifest(os.path.join(out_dir, BUILD_MANIFEST_FILE))
+    # everything a split's bytes depend on besides its own count; each split's key
+    # also chains the previous split's key because they share the RNG (and dedup keys)
+    build_params: Dict[str, Any] = {
+        "generator": generator_version(),
+        "schemas": schema_hashes(tool_schema_dir),
+        "seed": args.seed,
+        "max_tries": args.max_tries,
+        "workers": args.workers,
+        "tools_format": args.tools_format,
+        "compress": args.compress,
+        "engine": args.engine,
+        "block_size": args.block_size if args.engine == "vectorized" else None,
+        "validate_every": validate_every,
+        "dedup": [args.dedup, args.dedup_index, args.dedup_error_rate] if args.dedup != "off" else None,
+        "bloom_capacity": bloom_capacity,
+        "columnar": args.columnar,
+        "structured": args.structured,
+    }
+    params_key = split_build_key(build_params)
+
+    def appended_files(path: str) -> List[str]:
+        # files --extend appends to, checked by size instead of being hashed again
+        name = os.path.basename(path)
+        return [name, name + LABELS_SUFFIX]
+
+    previous_key = ""
+    skipped: List[str] = []
+    skipped_paths: List[str] = []  # skipped splits whose dedup keys are not loaded yet
+
+    def generate_file(path: str, count: int, kind: str, for_eval: Optional[str]) -> SplitResult:
+        nonlocal previous_key
+        key = split_build_key(dict(build_params, split=kind, count=count, previous=previous_key))
+        previous_key = key
+        stats_name = kind + STATS_SUFFIX
+        sidecars = [stats_name, os.path.basename(path) + INDEX_SUFFIX, os.path.basename(path) + LABELS_SUFFIX]
+        if args.columnar != "off":
+            sidecars.append(kind + COLUMNAR_FORMATS[args.columnar])
+
+        entry = None if args.force else manifest.up_to_date(kind, key, out_dir)
+        if entry is not None:
+            rng.setstate(decode_rng_state(entry["rng_state"]))
+            skipped.append(kind)
+            skipped_paths.append(path)
+            return SplitResult.from_manifest(entry["result"])
+
+        if dedup_seen is not None:
+            for skipped_path in skipped_paths:
+                load_dedup_keys(skipped_path, args.compress, args.dedup == "near", dedup_seen)
+            skipped_paths.clear()
+        bucket_list = plan_buckets(count)
+        rng.shuffle(bucket_list)
+        shard_seeds = [derive_shard_seed(args.seed, kind, i) for i in range(args.workers)]
+        result = generate_split(
+            path, bucket_list, for_eval, rng, shard_seeds, os.path.join(out_dir, kind + COLUMNAR_FORMATS[args.columnar])
+        )
+        if dedup_seen is not None and result.dedup_keys is not None:
+            dedup_seen.merge(result.dedup_keys)
+            result.dedup_keys = None
+        write_split_stats(os.path.join(out_dir, stats_name), kind, result)
+
+        manifest.record(
+            kind,
+            {
+                "key": key,
+                "params": params_key,
+                **manifest.fingerprint(out_dir, [os.path.basename(path)] + sidecars),
+                "sizes": {name: os.path.getsize(os.path.join(out_dir, name)) for name in appended_files(path)},
+                "result": result.manifest_fields(),
+                "stats_state": result.stats.state(),
+                "rng_state": encode_rng_state(rng),
+            },
+        )
+        return result
+
+    def extend_file(path: str, count: int, kind: str, for_eval: Optional[str]) -> SplitResult:
+        name = os.path.basename(path)
+        entry = manifest.splits.get(kind)
+        if entry is None or entry.get("params") != params_key:
+            raise SystemExit(
+                f"--extend: {kind} in {args.out_dir} was not built with these options and generator version; "
+                "build it without --extend first"
+            )
+        for appended, size in entry["sizes"].items():
+            appended_path = os.path.join(out_dir, appended)
+            if not os.path.exists(appended_path) or os.path.getsize(appended_path) != size:
+                raise SystemExit(f"--extend: {appended} changed since it was built; rebuild it without --extend")
+
+        result = SplitResult.from_manifest(entry["result"])
+        result.stats = SplitStats.from_state(entry["stats_state"])
+        existing = sum(result.buckets.values())
+        index_path = path + INDEX_SUFFIX
+        if not os.path.exists(index_path) or os.path.getsize(index_path) != 8 * (existing + 1):
+            raise SystemExit(f"--extend: {name + INDEX_SUFFIX} does not match {name}; rebuild it without --extend")
+        if count < existing:
+            raise SystemExit(f"--extend: {kind} already has {existing} samples, more than the requested {count}")
+        extended[kind] = {"before": existing, "added": count - existing}
+        if count == existing:
+            return result
+
+        # The split's own stream, separate from the RNG the splits share, so
+        # growing one split never changes another. It continues from where the
+        # previous extension of this split stopped.
+        stream = random.Random(derive_shard_seed(args.seed, kind + ":extend", 0))
+        if "stream" in entry:
+            stream.setstate(decode_rng_state(entry["stream"]))
+        bucket_list = plan_extension_buckets(result.buckets, count - existing)
+        stream.shuffle(bucket_list)
+        shard_seeds = [stream.getrandbits(64) for _ in range(args.workers)] if pool is not None else []
+        columnar_name = kind + COLUMNAR_FORMATS[args.columnar]
+        result.merge(
+            generate_split(path, bucket_list, for_eval, stream, shard_seeds, os.path.join(out_dir, columnar_name), result)
+        )
+        stats_name = kind + STATS_SUFFIX
+        write_split_stats(os.path.join(out_dir, stats_name), kind, result)
+        sidecars = [stats_name, name + INDEX_SUFFIX] + ([columnar_name] if args.columnar != "off" else [])
+
+        # the new key never matches a full build, so a later run without --extend
+        # rebuilds this split (and the split file is not hashed again here)
+        entry = dict(
+            entry,
+            key=split_build_key({"extends": entry["key"], "count": count}),
+            **manifest.fingerprint(out_dir, sidecars),
+            sizes={appended: os.path.getsize(os.path.join(out_dir, appended)) for appended in appended_files(path)},
+            result=result.manifest_fields(),
+            stats_state=result.stats.state(),
+            stream=encode_rng_state(stream),
+        )
+        manifest.record(kind, entry)
+        return result
+
+    def generate_split(
+        path: str,
+        bucket_list: List[str],
+        for_eval: Optional[str],
+        split_rng: random.Random,
+        shard_seeds: List[int],
+        columnar_path: str,
+        base: Optional[SplitResult] = None,
+    ) -> SplitResult:
+        """Write bucket_list's samples to path, or append them after base's lines when given."""
+        append = base is not None
+        line_base = sum(base.buckets.values()) if base is not None else 0
+        offset_base = base.bytes if base is not None else 0
+        with open_line_index_writer(path + INDEX_SUFFIX, append) as index, open(
+            path + LABELS_SUFFIX, "ab" if append else "wb"
+        ) as labels, open_columnar_writer(columnar_path, args.columnar, schemas.context_schemas) as columnar:
+            if columnar is not None and append:
+                # Parquet/Arrow files cannot be appended to; copy the existing rows first
+                columnar.append_from(columnar_path, 0, 0)
+            if pool is None:
+                index.base = offset_base
+                if columnar is not None:
+                    columnar.line_base, columnar.offset_base = line_base, offset_base
+                with open_jsonl_writer(path, args.compress, append) as f:
+                    return write_samples(
+                        f,
+                        split_rng,
+                        schemas,
+                        bucket_list,
+                        for_eval,
+                        args.max_tries,
+                        tools_ref,
+                        args.engine,
+                        args.block_size,
+                        validate_every,
+                        new_deduper(),
+                        columnar,
+                        index,
+                        labels,
+                        args.structured,
+                    )
+            return generate_shards(
+                path, bucket_list, for_eval, shard_seeds, index, labels, columnar, line_base, offset_base, append
+            )
+
+    def generate_shards(
+        path: str,
+        bucket_list: List[str],
+        for_eval: Optional[str],
+        shard_seeds: List[int],
+        index: LineIndexWriter,
+        labels: BinaryIO,
+        columnar: Optional[ColumnarWriter],
+        line_base: int,
+        offset_base: int,
+        append: bool,
+    ) -> SplitResult:
+        assert pool is not None
+        # Each shard has its own seeded RNG, so the output only depends on the
+        # seeds and worker count, not on scheduling.
+        shard_paths = [f"{path}.shard{i:04d}" for i in range(args.workers)]
+        futures = [
+            pool.submit(
+                _generate_shard,
+                shard_path,
+                shard_seed,
+                shard,
+                for_eval,
+                args.max_tries,
+                tools_ref,
+                args.compress,
+                args.engine,
+                args.block_size,
+                validate_every,
+                new_deduper(),
+                args.columnar,
+                args.structured,
+            )
+            for shard_path, shard_seed, shard in zip(shard_paths, shard_seeds, split_shards(bucket_list, args.workers))
+        ]
+        columnar_suffix = COLUMNAR_FORMATS[args.columnar]
+        result = SplitResult()
+        try:
+            for shard_path, fut in zip(shard_paths, futures):
+                shard_result = fut.result()
+                # shard indexes and rows count lines and bytes from the start of the shard
+                index.append_from(shard_path + INDEX_SUFFIX, offset_base)
+                with open(shard_path + LABELS_SUFFIX, "rb") as src:
+                    shutil.copyfileobj(src, labels, WRITE_BUFFER_SIZE)
+                if columnar is not None:
+                    columnar.append_from(shard_path + columnar_suffix, line_base, offset_base)
+                line_base += sum(shard_result.buckets.values())
+                offset_base += shard_result.bytes
+                result.merge(shard_result)
+            # compressed shards are independent gzip members / zstd frames, so
+            # plain concatenation yields a valid stream
+            with open(path, "ab" if append else "wb") as out:
+                for shard_path in shard_paths:
+                    with open(shard_path, "rb") as src:
+                        shutil.copyfileobj(src, out, WRITE_BUFFER_SIZE)
+        finally:
+            for shard_path in shard_paths:
+                for leftover in {
+                    shard_path,
+                    shard_path + INDEX_SUFFIX,
+                    shard_path + LABELS_SUFFIX,
+                    shard_path + columnar_suffix,
+                }:
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+        return result
+
+    suffix = ".jsonl" + COMPRESSION_SUFFIXES[args.compress]
+    train_path = os.path.join(out_dir, "train" + suffix)
+    eval_a_path = os.path.join(out_dir, "eval_a" + suffix)
+    eval_b_path = os.path.join(out_dir, "eval_b" + suffix)
+
+    extended: Dict[str, Dict[str, int]] = {}
+    build_file = extend_file if args.extend else generate_file
+    try:
+        train_result = build_file(train_path, args.train, "train", None)
+        eval_a_result = build_file(eval_a_path, args.eval_a, "eval_a", "eval_a")
+        eval_b_result = build_file(eval_b_path, args.eval_b, "eval_b", "eval_b")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    results = (train_result, eval_a_result, eval_b_result)
+    summary: Dict[str, Any] = {
+        "train": train_result.buckets,
+        "eval_a": eval_a_result.buckets,
+        "eval_b": eval_b_result.buckets,
+    }
+
+    summary["stats"] = {split: split + STATS_SUFFIX for split in ("train", "eval_a", "eval_b")}
+    if args.columnar != "off":
+        summary["columnar"] = {split: split + COLUMNAR_FORMATS[args.columnar] for split in ("train", "eval_a", "eval_b")}
+    summary["manifest"] = {"file": BUILD_MANIFEST_FILE, "skipped": skipped}
+    if args.extend:
+        summary["extended"] = extended
+
+    if args.compress != "none":
+        written = sum(r.bytes for r in results)
+        compressed = sum(os.path.getsize(p) for p in (train_path, eval_a_path, eval_b_path))
+        summary["compression"] = {
+            "format": args.compress,
+            "bytes": written,
+            "compressed_bytes": compressed,
+            "ratio": round(compressed / written, 4) if written else 0.0,
+        }
+
+    if tools_ref is not None:
+        written = sum(r.bytes for r in results)
+        lines = sum(sum(r.buckets.values()) for r in results)
+        inline = written + lines * SampleLineEncoder(schemas.tools_payload, tools_ref=tools_ref).bytes_saved_per_line()
+        summary["tools_dictionary"] = {
+            "file": TOOLS_DICTIONARY_FILE,
+            "tools_ref": tools_ref,
+            "bytes": written,
+            "inline_bytes": inline,
+            "reduction": round(1 - written / inline, 4) if inline else 0.0,
+        }
+
+    if dedup_seen is not None:
+        dedup_summary: Dict[str, Any] = {"mode": args.dedup, "index": args.dedup_index, "index_bytes": dedup_seen.nbytes}
+        for split, result in zip(("train", "eval_a", "eval_b"), results):
+            attempts = sum(result.buckets.values()) + result.duplicates
+            dedup_summary[split] = {
+                "duplicates": result.duplicates,
+                "rate": round(result.duplicates / attempts, 6) if attempts else 0.0,
+            }
+        summary["dedup"] = dedup_summary
+
+    summary["validation"] = {
+        "mode": args.validate,
+        "every": validate_every,
+        "self_test_samples": self_test_samples,
+        "train": train_result.validation_stats(),
+        "eval_a": eval_a_result.validation_stats(),
+        "eval_b": eval_b_result.validation_stats(),
     }
 
     print(json.dumps(summary, ensure_ascii=False, indent=2))
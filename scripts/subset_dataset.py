@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""Draw a stratified random subset of a generated JSONL split.
+
+Strata come from the <file>.labels sidecar generate_dataset.py writes next to
+every split (bucket, primary risk type and confidence tier per line), so the
+selection is a single streaming pass over the labels with reservoirs holding
+O(n) lines; the JSONL itself is only read at the selected lines, through its
+.idx offsets when present, and those lines are copied byte for byte.
+
+    python scripts/subset_dataset.py DataSet/eval_b.jsonl DataSet/eval_b_small.jsonl -n 1000 \\
+        --quota bucket=multi_action:0.3 --min-per risk_type=1
+
+--quota pins the exact share of one field value; --min-per guarantees every
+value of a field that occurs in the source appears at least COUNT times.
+Writes the subset with its own .idx and .labels and prints a JSON report.
+"""
+import argparse
+import json
+import random
+import shutil
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import generate_dataset as gen
+import upload_mlflow_datasets as up
+
+
+# (line number, labels in gen.LABEL_FIELDS order)
+LabeledLine = Tuple[int, Tuple[str, ...]]
+
+
+@dataclass
+class Reservoir:
+    """Uniform random sample of up to k items from a stream of unknown length (Algorithm R)."""
+
+    k: int
+    rng: random.Random
+    seen: int = 0
+    items: List[LabeledLine] = field(default_factory=list)
+
+    def offer(self, item: LabeledLine) -> None:
+        self.seen += 1
+        if len(self.items) < self.k:
+            self.items.append(item)
+        else:
+            j = self.rng.randrange(self.seen)
+            if j < self.k:
+                self.items[j] = item
+
+
+def parse_quota(text: str) -> Tuple[str, str, float]:
+    """FIELD=VALUE:FRACTION -> (field, value, fraction)."""
+    try:
+        name, rest = text.split("=", 1)
+        value, fraction_text = rest.rsplit(":", 1)
+        fraction = float(fraction_text)
+    except ValueError:
+        raise ValueError(f"--quota {text!r}: expected FIELD=VALUE:FRACTION") from None
+    if name not in gen.LABEL_VALUES:
+        raise ValueError(f"--quota {text!r}: field must be one of {', '.join(gen.LABEL_FIELDS)}")
+    if value not in gen.LABEL_VALUES[name]:
+        raise ValueError(f"--quota {text!r}: unknown {name} '{value}'")
+    if not 0.0 <= fraction <= 1.0:
+        raise ValueError(f"--quota {text!r}: fraction must be between 0 and 1")
+    return name, value, fraction
+
+
+def parse_min_per(text: str) -> Tuple[str, int]:
+    """FIELD=COUNT -> (field, count)."""
+    try:
+        name, count_text = text.split("=", 1)
+        count = int(count_text)
+    except ValueError:
+        raise ValueError(f"--min-per {text!r}: expected FIELD=COUNT") from None
+    if name not in gen.LABEL_VALUES:
+        raise ValueError(f"--min-per {text!r}: field must be one of {', '.join(gen.LABEL_FIELDS)}")
+    if count < 1:
+        raise ValueError(f"--min-per {text!r}: count must be >= 1")
+    return name, count
+
+
+@dataclass
+class SubsetPlan:
+    n: int
+    quota_field: Optional[str]  # every --quota uses this one field, so the quota strata are disjoint
+    targets: Dict[Optional[str], int]  # quota value -> exact lines, None -> lines outside every quota
+    min_per: Dict[str, int]  # label field -> minimum lines per value present in the source
+
+
+def build_plan(n: int, quotas: List[Tuple[str, str, float]], min_per: List[Tuple[str, int]]) -> SubsetPlan:
+    fields = {name for name, _, _ in quotas}
+    if len(fields) > 1:
+        raise ValueError("every --quota must use the same field")
+    targets: Dict[Optional[str], int] = {}
+    for _, value, fraction in quotas:
+        if value in targets:
+            raise ValueError(f"--quota given twice for '{value}'")
+        targets[value] = round(fraction * n)
+    rest = n - sum(targets.values())
+    if rest < 0:
+        raise ValueError("--quota fractions add up to more than 1")
+    targets[None] = rest
+    return SubsetPlan(n, fields.pop() if fields else None, targets, dict(min_per))
+
+
+@dataclass
+class Selection:
+    lines: List[LabeledLine]  # sorted by line number
+    source_lines: int
+    source_counts: Dict[str, Counter]  # label field -> value -> lines in the source
+    swaps: int
+
+
+def select_lines(labels_path: Path, plan: SubsetPlan, seed: int) -> Selection:
+    """One pass over a .labels file: a reservoir per quota stratum, plus small per-value reservoirs
+    of spare lines that coverage swaps draw from without changing any stratum's count."""
+    rng = random.Random(seed)
+    field_index = {name: i for i, name in enumerate(gen.LABEL_FIELDS)}
+    quota_i = field_index[plan.quota_field] if plan.quota_field is not None else -1
+    strata = {value: Reservoir(k, rng) for value, k in plan.targets.items()}
+    spares: Dict[Tuple[Optional[str], str, str], Reservoir] = {}
+    coverage = [(name, field_index[name], count) for name, count in plan.min_per.items()]
+    source_counts: Dict[str, Counter] = {name: Counter() for name in gen.LABEL_FIELDS}
+    counters = [source_counts[name] for name in gen.LABEL_FIELDS]
+
+    line_no = -1
+    with labels_path.open("rb") as f:
+        for line_no, raw in enumerate(f):
+            labels = tuple(raw.decode("utf-8").rstrip("\n").split("\t"))
+            if len(labels) != len(gen.LABEL_FIELDS):
+                raise ValueError(f"{labels_path}:{line_no + 1}: expected {len(gen.LABEL_FIELDS)} tab-separated labels")
+            for counter, value in zip(counters, labels):
+                counter[value] += 1
+            stratum = labels[quota_i] if quota_i >= 0 and labels[quota_i] in strata else None
+            item = (line_no, labels)
+            strata[stratum].offer(item)
+            for name, i, count in coverage:
+                key = (stratum, name, labels[i])
+                spare = spares.get(key)
+                if spare is None:
+                    spare = spares[key] = Reservoir(count, rng)
+                spare.offer(item)
+
+    for value, reservoir in strata.items():
+        if len(reservoir.items) < reservoir.k:
+            where = f"{plan.quota_field}={value}" if value is not None else "outside the --quota strata"
+            raise ValueError(f"{labels_path}: {reservoir.seen} lines {where}, need {reservoir.k}")
+
+    chosen: Dict[Optional[str], List[LabeledLine]] = {value: r.items for value, r in strata.items()}
+    for items in chosen.values():
+        rng.shuffle(items)  # swap victims are then picked at random
+    taken: Set[int] = {line for items in chosen.values() for line, _ in items}
+    counts = {name: Counter(labels[i] for items in chosen.values() for _, labels in items) for name, i, _ in coverage}
+    needed = {
+        name: {value: min(count, seen) for value, seen in source_counts[name].items() if value != gen.LABEL_NONE}
+        for name, _, count in coverage
+    }
+
+    def can_drop(labels: Tuple[str, ...]) -> bool:
+        return all(counts[name][labels[i]] > needed[name].get(labels[i], 0) for name, i, _ in coverage)
+
+    swaps = 0
+    for name, i, _ in coverage:
+        for value, need in needed[name].items():
+            for (stratum, spare_field, spare_value), spare in spares.items():
+                if counts[name][value] >= need:
+                    break
+                if spare_field != name or spare_value != value:
+                    continue
+                items = chosen[stratum]
+                for incoming in spare.items:
+                    if counts[name][value] >= need:
+                        break
+                    if incoming[0] in taken:
+                        continue
+                    victim = next((j for j, (_, labels) in enumerate(items) if can_drop(labels)), None)
+                    if victim is None:
+                        break
+                    outgoing = items[victim]
+                    items[victim] = incoming
+                    taken.discard(outgoing[0])
+                    taken.add(incoming[0])
+                    for other, k, _ in coverage:
+                        counts[other][outgoing[1][k]] -= 1
+                        counts[other][incoming[1][k]] += 1
+                    swaps += 1
+            if counts[name][value] < need:
+                raise ValueError(
+                    f"cannot fit {need} lines with {name}={value} into {plan.n} lines under the other constraints"
+                )
+
+    lines = sorted(item for items in chosen.values() for item in items)
+    return Selection(lines, line_no + 1, source_counts, swaps)
+
+
+def write_subset(source: Path, out: Path, selection: Selection) -> int:
+    """Copy the selected lines verbatim into out, with its own line index and labels; returns bytes written."""
+    numbers = [line for line, _ in selection.lines]
+    compress = {None: "none", "gzip": "gzip", "zstd": "zstd"}[up.compression_of(out)]
+    written = 0
+    copied = 0
+    index = up.LineIndex.open(source)
+    try:
+        if index is not None and len(index) != selection.source_lines:
+            raise ValueError(f"{source}: {len(index)} indexed lines but {selection.source_lines} labels")
+        with gen.open_jsonl_writer(str(out), compress) as f, gen.open_line_index_writer(
+            str(out) + gen.INDEX_SUFFIX
+        ) as out_index, open(str(out) + gen.LABELS_SUFFIX, "wb") as labels_out:
+            lines = up.read_sampled_lines(source, numbers, index)
+            for (_, labels), line in zip(selection.lines, lines):
+                data = line.strip() + b"\n"
+                f.write(data)
+                written += len(data)
+                out_index.add(written)
+                labels_out.write(("\t".join(labels) + "\n").encode("utf-8"))
+                copied += 1
+    finally:
+        if index is not None:
+            index.close()
+    if copied < len(numbers):
+        raise ValueError(f"{source} has fewer lines than its labels ({selection.source_lines})")
+    return written
+
+
+def main() -> int:
+    p = argparse.ArgumentParser()
+    p.add_argument("source", help="Generated JSONL split (.jsonl, .jsonl.gz, .jsonl.zst) with a .labels sidecar")
+    p.add_argument("out", help="Subset JSONL to write; a .gz / .zst suffix compresses it")
+    p.add_argument("-n", "--count", type=int, required=True, help="Lines in the subset")
+    p.add_argument(
+        "--quota",
+        action="append",
+        default=[],
+        metavar="FIELD=VALUE:FRACTION",
+        help="Exact share of the subset with this label, e.g. bucket=multi_action:0.3 (repeatable, one field)",
+    )
+    p.add_argument(
+        "--min-per",
+        action="append",
+        default=[],
+        metavar="FIELD=COUNT",
+        help="At least COUNT lines for every value of FIELD present in the source, e.g. risk_type=1 (repeatable)",
+    )
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args()
+
+    source = Path(args.source)
+    out = Path(args.out)
+    labels_path = Path(args.source + gen.LABELS_SUFFIX)
+    if not source.is_file():
+        p.error(f"not a file: {source}")
+    if not labels_path.is_file():
+        p.error(f"{labels_path} not found; regenerate {source.name} with generate_dataset.py to record labels")
+    if out.resolve() == source.resolve():
+        p.error("out must differ from source")
+    if args.count < 1:
+        p.error("-n must be >= 1")
+    try:
+        plan = build_plan(args.count, [parse_quota(q) for q in args.quota], [parse_min_per(m) for m in args.min_per])
+    except ValueError as e:
+        p.error(str(e))
+    if up.compression_of(source) == "zstd" or up.compression_of(out) == "zstd":
+        try:
+            gen.require_zstandard()
+        except RuntimeError as e:
+            p.error(str(e))
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    try:
+        selection = select_lines(labels_path, plan, args.seed)
+        written = write_subset(source, out, selection)
+    except ValueError as e:
+        raise SystemExit(str(e)) from None
+    elapsed = time.perf_counter() - started
+
+    # ref-format lines point at the tools dictionary next to them
+    tools_dictionary = source.parent / gen.TOOLS_DICTIONARY_FILE
+    if tools_dictionary.is_file() and out.parent.resolve() != source.parent.resolve():
+        target = out.parent / gen.TOOLS_DICTIONARY_FILE
+        if not target.exists():
+            shutil.copyfile(tools_dictionary, target)
+
+    counts = {name: Counter() for name in gen.LABEL_FIELDS}
+    for _, labels in selection.lines:
+        for name, value in zip(gen.LABEL_FIELDS, labels):
+            counts[name][value] += 1
+    report: Dict[str, Any] = {
+        "source": str(source),
+        "out": str(out),
+        "source_lines": selection.source_lines,
+        "lines": len(selection.lines),
+        "bytes": written,
+        "seed": args.seed,
+        "swaps": selection.swaps,
+        "counts": {name: dict(sorted(counter.items())) for name, counter in counts.items()},
+        "unavailable": {
+            name: [value for value in gen.LABEL_VALUES[name] if not selection.source_counts[name][value]]
+            for name in plan.min_per
+        },
+        "elapsed_s": round(elapsed, 3),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,269 @@
+"""Tests for the generator's build manifest, --extend and schema validators.
+
+Run from the repo root:
+
+    python -m pytest scripts
+"""
+import json
+import sys
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+import generate_dataset as gen
+import upload_mlflow_datasets as up
+
+
+SPLITS = ("train", "eval_a", "eval_b")
+
+
+def run_generator(monkeypatch, capsys, out_dir: Path, *args: str) -> Dict[str, Any]:
+    """Run generate_dataset.main() with small default counts and return its summary."""
+    argv = ["generate_dataset.py", "--out-dir", str(out_dir), "--train", "300", "--eval-a", "60", "--eval-b", "60"]
+    monkeypatch.setattr(sys, "argv", argv + list(args))
+    capsys.readouterr()
+    gen.main()
+    return json.loads(capsys.readouterr().out)
+
+
+def read_bytes(out_dir: Path) -> Dict[str, bytes]:
+    return {split: (out_dir / f"{split}.jsonl").read_bytes() for split in SPLITS}
+
+
+def count_output_hashes(monkeypatch, out_dir: Path) -> List[str]:
+    """Record the output files sha256_file reads from here on (schema and script hashes are ignored)."""
+    hashed: List[str] = []
+    sha256_file = gen.sha256_file
+
+    def counting(path: str) -> str:
+        if Path(path).parent == out_dir:
+            hashed.append(Path(path).name)
+        return sha256_file(path)
+
+    monkeypatch.setattr(gen, "sha256_file", counting)
+    return hashed
+
+
+def test_rerun_skips_every_split_without_rehashing(tmp_path, monkeypatch, capsys):
+    out_dir = tmp_path / "out"
+    run_generator(monkeypatch, capsys, out_dir)
+    before = read_bytes(out_dir)
+
+    hashed = count_output_hashes(monkeypatch, out_dir)
+    summary = run_generator(monkeypatch, capsys, out_dir)
+
+    assert summary["manifest"]["skipped"] == list(SPLITS)
+    assert hashed == []
+    assert read_bytes(out_dir) == before
+
+
+def test_touched_output_is_rehashed_once(tmp_path, monkeypatch, capsys):
+    out_dir = tmp_path / "out"
+    run_generator(monkeypatch, capsys, out_dir)
+    train = out_dir / "train.jsonl"
+    train.touch()
+
+    hashed = count_output_hashes(monkeypatch, out_dir)
+    assert run_generator(monkeypatch, capsys, out_dir)["manifest"]["skipped"] == list(SPLITS)
+    assert hashed == ["train.jsonl"]
+
+    # the refreshed stamp was recorded, so the next run trusts it again
+    hashed.clear()
+    run_generator(monkeypatch, capsys, out_dir)
+    assert hashed == []
+
+
+def test_changed_eval_b_rebuilds_only_eval_b(tmp_path, monkeypatch, capsys):
+    out_dir = tmp_path / "out"
+    run_generator(monkeypatch, capsys, out_dir)
+    before = read_bytes(out_dir)
+
+    summary = run_generator(monkeypatch, capsys, out_dir, "--eval-b", "90")
+    assert summary["manifest"]["skipped"] == ["train", "eval_a"]
+    assert sum(summary["eval_b"].values()) == 90
+
+    fresh_dir = tmp_path / "fresh"
+    run_generator(monkeypatch, capsys, fresh_dir, "--eval-b", "90")
+    after = read_bytes(out_dir)
+    assert after == read_bytes(fresh_dir)
+    assert after["train"] == before["train"] and after["eval_a"] == before["eval_a"]
+
+
+def read_index(path: Path) -> List[int]:
+    offsets = array("Q")
+    offsets.frombytes(path.read_bytes())
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    return offsets.tolist()
+
+
+def expected_sidecars(data: bytes) -> Dict[str, Any]:
+    """The .idx offsets and .labels lines a --structured JSONL file should have."""
+    offsets = [0]
+    labels = []
+    for line in data.splitlines(keepends=True):
+        offsets.append(offsets[-1] + len(line))
+        structured = json.loads(line)[gen.STRUCTURED_FIELD]
+        decision: Optional[Dict[str, Any]] = structured["risk_decision"]
+        if decision is None:
+            labels.append(f"{structured['bucket']}\t{gen.LABEL_NONE}\t{gen.LABEL_NONE}")
+        else:
+            labels.append(f"{structured['bucket']}\t{decision['risk_type']}\t{decision['tier']}")
+    return {"offsets": offsets, "labels": labels}
+
+
+def assert_sidecars_match(out_dir: Path, split: str) -> None:
+    path = out_dir / f"{split}.jsonl"
+    expected = expected_sidecars(path.read_bytes())
+    assert read_index(out_dir / f"{split}.jsonl{gen.INDEX_SUFFIX}") == expected["offsets"]
+    labels = (out_dir / f"{split}.jsonl{gen.LABELS_SUFFIX}").read_text(encoding="utf-8").splitlines()
+    assert labels == expected["labels"]
+
+
+def test_extend_keeps_offsets_and_labels_in_step(tmp_path, monkeypatch, capsys):
+    out_dir = tmp_path / "out"
+    run_generator(monkeypatch, capsys, out_dir, "--structured")
+    before = read_bytes(out_dir)
+
+    summary = run_generator(monkeypatch, capsys, out_dir, "--structured", "--extend", "--train", "450", "--eval-b", "75")
+    assert summary["extended"]["train"] == {"before": 300, "added": 150}
+    assert summary["extended"]["eval_a"] == {"before": 60, "added": 0}
+    assert summary["extended"]["eval_b"] == {"before": 60, "added": 15}
+
+    full_dir = tmp_path / "full"
+    run_generator(monkeypatch, capsys, full_dir, "--structured", "--train", "450", "--eval-b", "75")
+    after = read_bytes(out_dir)
+    for split in SPLITS:
+        # extended lines come from the split's own stream, so only the existing lines match a full build
+        assert after[split].startswith(before[split])
+        assert after[split].count(b"\n") == (full_dir / f"{split}.jsonl").read_bytes().count(b"\n")
+        assert_sidecars_match(out_dir, split)
+        assert_sidecars_match(full_dir, split)
+
+
+class _StubDataset:
+    def __init__(self, dataset_id: str) -> None:
+        self.dataset_id = dataset_id
+        self.records = 0
+
+    def merge_records(self, batch: List[Dict[str, object]]) -> None:
+        self.records += len(batch)
+
+
+class _StubClient:
+    """In-memory stand-in for MlflowClient's dataset API."""
+
+    def __init__(self) -> None:
+        self.datasets: Dict[str, _StubDataset] = {}
+        self.names: Dict[str, str] = {}
+        self.deleted: List[str] = []
+
+    def search_datasets(self, experiment_ids, filter_string: str, max_results: int):
+        name = filter_string.split("'", 1)[1].rsplit("'", 1)[0]
+        dataset_id = self.names.get(name)
+        return [self.datasets[dataset_id]] if dataset_id is not None else []
+
+    def get_dataset(self, dataset_id: str) -> _StubDataset:
+        return self.datasets[dataset_id]
+
+    def delete_dataset(self, dataset_id: str) -> None:
+        self.datasets.pop(dataset_id)
+        self.names = {k: v for k, v in self.names.items() if v != dataset_id}
+        self.deleted.append(dataset_id)
+
+    def create_dataset(self, name: str, experiment_id: str, tags: Dict[str, object]) -> _StubDataset:
+        ds = _StubDataset(f"stub-{len(self.datasets) + len(self.deleted)}")
+        self.datasets[ds.dataset_id] = ds
+        self.names[name] = ds.dataset_id
+        return ds
+
+
+def test_explicit_if_exists_overrides_upload_manifest(tmp_path, monkeypatch, capsys):
+    out_dir = tmp_path / "out"
+    run_generator(monkeypatch, capsys, out_dir)
+    client = _StubClient()
+    manifest = up._ManifestUploads(out_dir / gen.BUILD_MANIFEST_FILE)
+
+    def register(if_exists: str) -> Dict[str, str]:
+        return up.register_evaluation_dataset(
+            client=client,
+            experiment_id="1",
+            name_prefix="test",
+            dataset_file=out_dir / "eval_b.jsonl",
+            batch_size=50,
+            include_tools=True,
+            if_exists=if_exists,
+            fingerprints=up.FingerprintCache(None),
+            manifest=manifest,
+        )
+
+    first = register("error")
+    assert first["status"] == "created" and first["records"] == "60"
+    assert register("error")["status"] == "unchanged"
+    assert register("merge")["status"] == "unchanged"
+    assert register("skip")["status"] == "skipped"
+
+    replaced = register("replace")
+    assert replaced["status"] == "created"
+    assert client.deleted == [first["dataset_id"]]
+    assert client.datasets[replaced["dataset_id"]].records == 60
+
+    # the uploads section survives a generator rerun, and the rerun still skips every split
+    assert run_generator(monkeypatch, capsys, out_dir)["manifest"]["skipped"] == list(SPLITS)
+    assert up._ManifestUploads(out_dir / gen.BUILD_MANIFEST_FILE).get(f"1/{replaced['dataset_name']}") is not None
+
+
+SCHEMA: Dict[str, Any] = {
+    "type": "OBJECT",
+    "required": ["name", "count"],
+    "additionalProperties": False,
+    "properties": {
+        "name": {"type": "STRING", "pattern": "^[a-z]+$"},
+        "mode": {"type": "STRING", "enum": ["on", "off"]},
+        "count": {"type": "INTEGER", "minimum": 0, "maximum": 10},
+        "ratio": {"type": "NUMBER", "minimum": 0.0, "maximum": 1.0},
+        "enabled": {"type": "BOOLEAN"},
+        "tags": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "nested": {"type": "OBJECT", "properties": {"level": {"type": "INTEGER"}}},
+    },
+}
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        [],
+        {"count": 1},
+        {"name": "a", "count": 1, "extra": 1},
+        {"name": 1, "count": 1},
+        {"name": "A1", "count": 1},
+        {"name": "a", "count": 1, "mode": "maybe"},
+        {"name": "a", "count": True},
+        {"name": "a", "count": 1.5},
+        {"name": "a", "count": -1},
+        {"name": "a", "count": 11},
+        {"name": "a", "count": 1, "ratio": "x"},
+        {"name": "a", "count": 1, "ratio": False},
+        {"name": "a", "count": 1, "ratio": -0.5},
+        {"name": "a", "count": 1, "ratio": 2},
+        {"name": "a", "count": 1, "enabled": 1},
+        {"name": "a", "count": 1, "tags": "x"},
+        {"name": "a", "count": 1, "tags": ["x", 2]},
+        {"name": "a", "count": 1, "nested": []},
+        {"name": "a", "count": 1, "nested": {"level": "high"}},
+    ],
+)
+def test_compiled_validator_matches_validate_value(value):
+    with pytest.raises(gen.SchemaError) as interpreted:
+        gen.validate_value(value, SCHEMA, "root")
+    with pytest.raises(gen.SchemaError) as compiled:
+        gen.compile_schema(SCHEMA)(value, "root")
+    assert str(compiled.value) == str(interpreted.value)
+
+
+def test_compiled_validator_accepts_valid_values():
+    value = {"name": "a", "count": 0, "ratio": 1, "enabled": False, "tags": [], "nested": {"level": 3, "other": None}}
+    gen.validate_value(value, SCHEMA, "root")
+    gen.compile_schema(SCHEMA)(value, "root")
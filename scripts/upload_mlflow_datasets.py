@@ -1,27 +1,291 @@
 import argparse
+import bisect
+import functools
+import gzip
 import hashlib
+import io
 import json
+import mmap
 import os
+import queue
+import random
 import sys
+import threading
+import time
+from array import array
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Tuple
+from typing import Any, BinaryIO, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 
 
-def _sha256(path: Path) -> str:
-    h = hashlib.sha256()
-    with path.open("rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
+TOOLS_DICTIONARY_FILE = "tools.json"
 
+SUMMARY_FILE = "mlflow_upload_summary.json"
 
-def _count_lines(path: Path) -> int:
-    n = 0
-    with path.open("rb") as f:
-        for _ in f:
-            n += 1
-    return n
+FINGERPRINT_CACHE_FILE = ".mlflow_fingerprint_cache.json"
+
+CHECKPOINT_FILE = "mlflow_upload_checkpoint.json"
+
+# written by generate_dataset.py; this script adds an "uploads" section
+BUILD_MANIFEST_FILE = "build_manifest.json"
+
+# generate_dataset.py --structured adds this key to every line: bucket, risk_decision, sensor_context
+STRUCTURED_FIELD = "structured"
+
+# generate_dataset.py writes <split>.stats.json next to each split
+STATS_SUFFIX = ".stats.json"
+
+# Files the tooling writes next to the datasets; never uploaded as splits.
+SIDECAR_FILES = frozenset(
+    {TOOLS_DICTIONARY_FILE, SUMMARY_FILE, FINGERPRINT_CACHE_FILE, CHECKPOINT_FILE, BUILD_MANIFEST_FILE}
+)
+
+JSONL_SUFFIXES = (".jsonl", ".jsonl.gz", ".jsonl.zst")
+
+# generate_dataset.py writes <file>.idx (uint64 line offsets) next to each JSONL file
+INDEX_SUFFIX = ".idx"
+
+READ_BUFFER_SIZE = 1024 * 1024
+
+PARSE_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+def _json_backend() -> Tuple[str, Callable[[Any], object]]:
+    """orjson when installed (pip install orjson), else the stdlib parser."""
+    try:
+        import orjson  # type: ignore
+    except ImportError:
+        return "json", json.loads
+    return "orjson", orjson.loads
+
+
+# Public reader API, also used by validate_dataset.py, subset_dataset.py and evaluate_dataset.py:
+# json_loads, compression_of, open_decoded, split_name, LineIndex, read_sampled_lines,
+# ToolsDictionary / tools_dictionary_for. bench.py also drives build_dataset_record,
+# register_evaluation_dataset and FingerprintCache. Everything prefixed with _ is private to this script.
+JSON_BACKEND, json_loads = _json_backend()
+
+
+def compression_of(path: Path) -> Optional[str]:
+    name = path.name.lower()
+    if name.endswith(".gz"):
+        return "gzip"
+    if name.endswith(".zst"):
+        return "zstd"
+    return None
+
+
+def _is_jsonl(path: Path) -> bool:
+    return path.name.lower().endswith(JSONL_SUFFIXES)
+
+
+def _zstd_reader(raw: BinaryIO, path: Path, *, closefd: bool) -> BinaryIO:
+    try:
+        import zstandard  # type: ignore
+    except ImportError as e:
+        raise RuntimeError(f"Reading {path} requires the zstandard package. Install first: pip install zstandard") from e
+    reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=closefd)
+    return io.BufferedReader(reader, READ_BUFFER_SIZE)
+
+
+def open_decoded(path: Path) -> BinaryIO:
+    """Open a dataset file for binary reading, transparently decoding .gz/.zst."""
+    compression = compression_of(path)
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    if compression == "zstd":
+        return _zstd_reader(path.open("rb"), path, closefd=True)
+    return path.open("rb", buffering=READ_BUFFER_SIZE)
+
+
+class _HashingReader(io.RawIOBase):
+    """Raw reader that feeds every byte it returns into a SHA-256."""
+
+    def __init__(self, raw: BinaryIO) -> None:
+        super().__init__()
+        self._raw = raw
+        self.hash = hashlib.sha256()
+        self.bytes = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = self._raw.readinto(b)
+        if n:
+            self.hash.update(memoryview(b)[:n])
+            self.bytes += n
+        return n or 0
+
+
+@dataclass(frozen=True)
+class _Fingerprint:
+    bytes: int
+    lines: int
+    sha256: str
+
+
+def _fingerprint(path: Path) -> _Fingerprint:
+    """Byte size, decoded line count and SHA-256 of the on-disk bytes in one read."""
+    with path.open("rb", buffering=0) as raw:
+        hashing = _HashingReader(raw)
+        stream = io.BufferedReader(hashing, READ_BUFFER_SIZE)
+        compression = compression_of(path)
+        decoded: BinaryIO
+        if compression == "gzip":
+            decoded = gzip.GzipFile(fileobj=stream, mode="rb")
+        elif compression == "zstd":
+            decoded = _zstd_reader(stream, path, closefd=False)
+        else:
+            decoded = stream
+        lines = 0
+        last = b"\n"
+        for chunk in iter(lambda: decoded.read(READ_BUFFER_SIZE), b""):
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+        if last != b"\n":
+            # count a final line without a trailing newline, like iterating the file does
+            lines += 1
+        # drain anything the decoder did not need (e.g. trailing padding)
+        for _ in iter(lambda: stream.read(READ_BUFFER_SIZE), b""):
+            pass
+        return _Fingerprint(bytes=hashing.bytes, lines=lines, sha256=hashing.hash.hexdigest())
+
+
+class FingerprintCache:
+    """On-disk cache of _Fingerprint keyed by (path, mtime, size)."""
+
+    def __init__(self, path: Optional[Path]) -> None:
+        self.path = path
+        self._entries: Dict[str, Dict[str, object]] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if path is not None and path.exists():
+            try:
+                with path.open("r", encoding="utf-8") as f:
+                    loaded = json.load(f)
+                if isinstance(loaded, dict):
+                    self._entries = loaded
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def get(self, file: Path) -> _Fingerprint:
+        st = file.stat()
+        key = str(file.resolve())
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry.get("mtime_ns") == st.st_mtime_ns and entry.get("size") == st.st_size:
+            return _Fingerprint(bytes=int(entry["bytes"]), lines=int(entry["lines"]), sha256=str(entry["sha256"]))
+        fp = _fingerprint(file)
+        with self._lock:
+            self._entries[key] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, **asdict(fp)}
+            self._dirty = True
+        return fp
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with tmp.open("w", encoding="utf-8") as out:
+                json.dump(self._entries, out, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+
+class _ManifestUploads:
+    """The "uploads" section of build_manifest.json.
+
+    Entries are keyed by "<experiment_id>/<dataset_name>" and record the
+    dataset_id and file sha256 of completed registrations, so an unchanged
+    file is skipped on the next run. The generator's sections of the file
+    are left as they are.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, object]] = dict(self._read().get("uploads", {}))
+
+    def _read(self) -> Dict[str, object]:
+        if not self.path.exists():
+            return {}
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                loaded = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return loaded if isinstance(loaded, dict) else {}
+
+    def get(self, key: str) -> Optional[Dict[str, object]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            return dict(entry) if entry is not None else None
+
+    def record(self, key: str, **entry: object) -> None:
+        with self._lock:
+            self._entries[key] = dict(entry)
+            data = self._read()
+            data["uploads"] = self._entries
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with tmp.open("w", encoding="utf-8") as out:
+                json.dump(data, out, ensure_ascii=False, indent=2)
+                out.write("\n")
+            os.replace(tmp, self.path)
+
+
+class _UploadCheckpoint:
+    """Per-dataset progress of interrupted registrations, persisted after every batch.
+
+    Entries are keyed by "<experiment_id>/<dataset_name>" and hold the
+    dataset_id, the file sha256 and the number of leading records already
+    committed. An entry is removed once its file finishes uploading.
+    """
+
+    def __init__(self, path: Optional[Path]) -> None:
+        self.path = path
+        self._entries: Dict[str, Dict[str, object]] = {}
+        self._lock = threading.Lock()
+        if path is not None and path.exists():
+            try:
+                with path.open("r", encoding="utf-8") as f:
+                    loaded = json.load(f)
+                if isinstance(loaded, dict):
+                    self._entries = loaded
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def get(self, key: str) -> Optional[Dict[str, object]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            return dict(entry) if entry is not None else None
+
+    def update(self, key: str, **entry: object) -> None:
+        with self._lock:
+            self._entries[key] = dict(entry)
+            self._save()
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._save()
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        if not self._entries:
+            if self.path.exists():
+                self.path.unlink()
+            return
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as out:
+            json.dump(self._entries, out, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
 
 
 def _format_compact_count(n: int) -> str:
@@ -42,13 +306,29 @@ def _discover_dataset_files(dataset_dir: Path) -> List[Path]:
 
 def _discover_dataset_files_with_options(dataset_dir: Path, *, include_json: bool) -> List[Path]:
     files: List[Path] = []
-    files.extend(sorted(dataset_dir.glob("*.jsonl")))
+    for suffix in JSONL_SUFFIXES:
+        files.extend(sorted(dataset_dir.glob(f"*{suffix}")))
     if include_json:
-        files.extend(sorted(dataset_dir.glob("*.json")))
-    return sorted(set(files))
+        files.extend(p for p in sorted(dataset_dir.glob("*.json")) if p.name not in SIDECAR_FILES and not p.name.endswith(STATS_SUFFIX))
+    files = sorted(set(files))
+    # train.jsonl and train.jsonl.gz would register as the same dataset name
+    by_split: Dict[str, List[Path]] = {}
+    for path in files:
+        by_split.setdefault(split_name(path), []).append(path)
+    for split, paths in by_split.items():
+        if len(paths) > 1:
+            raise ValueError(
+                f"{', '.join(p.name for p in paths)} in {dataset_dir} are all split '{split}'; "
+                "remove the stale ones (e.g. left over from a different --compress)"
+            )
+    return files
 
 
-def _split_name(path: Path) -> str:
+def split_name(path: Path) -> str:
+    name = path.name
+    for suffix in JSONL_SUFFIXES:
+        if name.lower().endswith(suffix):
+            return name[: -len(suffix)]
     return path.stem
 
 
@@ -58,22 +338,342 @@ def _build_run_name(name_prefix: str, split: str, line_count: Optional[int]) ->
     return f"{name_prefix}_{split}_{_format_compact_count(line_count)}"
 
 
-def _read_jsonl_records(path: Path) -> Iterable[Dict[str, object]]:
-    with path.open("r", encoding="utf-8") as f:
+def _index_path(path: Path) -> Path:
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+
+def _build_line_index(path: Path) -> Path:
+    """Write path's .idx in generate_dataset.py's format by scanning the decoded file once.
+
+    Entries are 0 followed by the end offset of every non-empty line, so record
+    k spans [offsets[k], offsets[k + 1]) and record numbers match skip/resume
+    counting. Blank lines fall into the record after them (or the last one).
+    """
+    ends = array("Q", [0])
+    pos = 0
+    with open_decoded(path) as f:
+        for line in f:
+            pos += len(line)
+            if line.strip():
+                ends.append(pos)
+    if len(ends) > 1:
+        ends[-1] = pos
+    if sys.byteorder == "big":
+        ends.byteswap()
+    index_path = _index_path(path)
+    tmp = index_path.with_name(index_path.name + ".tmp")
+    tmp.write_bytes(ends.tobytes())
+    os.replace(tmp, index_path)
+    return index_path
+
+
+class LineIndex:
+    """Random access to the records of a JSONL file through its .idx offsets.
+
+    The offsets are mmapped, so opening is O(1) whatever the file size. Plain
+    .jsonl data is mmapped too and line()/lines() are O(1) slices; compressed
+    files only offer offset(), a position in the decoded stream to seek to.
+    """
+
+    def __init__(self, path: Path, index_path: Path) -> None:
+        self.path = path
+        self._maps: List[mmap.mmap] = []
+        index_map = self._map(index_path)
+        self._offsets: Any
+        if sys.byteorder == "little":
+            self._offsets = memoryview(index_map).cast("Q")
+        else:
+            self._offsets = array("Q", index_map[:])
+            self._offsets.byteswap()
+        self._data: Optional[mmap.mmap] = None
+        if compression_of(path) is None and self._offsets[-1] > 0:
+            self._data = self._map(path)
+
+    @classmethod
+    def open(cls, path: Path, *, build: bool = False) -> Optional["LineIndex"]:
+        """path's index, or None when it has no current one (build=True writes it first)."""
+        index_path = _index_path(path)
+        if not cls._is_current(path, index_path):
+            if not build:
+                return None
+            _build_line_index(path)
+        return cls(path, index_path)
+
+    @staticmethod
+    def _is_current(path: Path, index_path: Path) -> bool:
+        try:
+            index_stat = index_path.stat()
+            data_stat = path.stat()
+        except FileNotFoundError:
+            return False
+        if index_stat.st_size < 8 or index_stat.st_size % 8 or index_stat.st_mtime_ns < data_stat.st_mtime_ns:
+            return False
+        if compression_of(path) is not None:
+            return True
+        # for plain files the last offset is the file size
+        with index_path.open("rb") as f:
+            f.seek(-8, os.SEEK_END)
+            return int.from_bytes(f.read(8), "little") == data_stat.st_size
+
+    def _map(self, path: Path) -> mmap.mmap:
+        with path.open("rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return mapped
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def offset(self, i: int) -> int:
+        """Decoded byte offset where record i starts (len(self) gives the end of the data)."""
+        return self._offsets[i]
+
+    def boundary(self, pos: int) -> int:
+        """The first record start (or the end of the data) at or after byte pos."""
+        offsets = self._offsets
+        return offsets[min(bisect.bisect_left(offsets, pos), len(offsets) - 1)]
+
+    def line(self, i: int) -> bytes:
+        return self.lines(i, i + 1)
+
+    def lines(self, start: int, stop: int) -> bytes:
+        """Records [start, stop) as one block of JSONL bytes."""
+        if self._data is None:
+            raise ValueError(f"{self.path} is compressed; its index only has offsets")
+        return self._data[self._offsets[start] : self._offsets[stop]]
+
+    def close(self) -> None:
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        for mapped in self._maps:
+            mapped.close()
+
+    def __enter__(self) -> "LineIndex":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def _read_jsonl_records(path: Path, *, skip: int = 0, index: Optional[LineIndex] = None) -> Iterable[Dict[str, object]]:
+    """Yield parsed records; the first `skip` non-empty lines are passed over unparsed.
+
+    With an index, the skipped lines are not read at all (compressed files
+    still decode up to the resume point).
+    """
+    with open_decoded(path) as raw:
+        if index is not None and skip:
+            raw.seek(index.offset(skip))
+            skip = 0
+        with io.TextIOWrapper(raw, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                yield json_loads(line)
+
+
+def _sample_record_numbers(records: int, n: int, seed: int) -> List[int]:
+    """n distinct record numbers drawn uniformly from range(records), in file order."""
+    return sorted(random.Random(seed).sample(range(records), min(n, records)))
+
+
+def read_sampled_lines(path: Path, numbers: List[int], index: Optional[LineIndex]) -> Iterator[bytes]:
+    """Yield the raw lines with the given ascending record numbers, without parsing any line."""
+    if index is not None and compression_of(path) is None:
+        for i in numbers:
+            yield index.line(i)
+        return
+    with open_decoded(path) as f:
+        if index is not None:
+            # compressed: forward seeks decode without splitting lines
+            for i in numbers:
+                f.seek(index.offset(i))
+                yield f.read(index.offset(i + 1) - index.offset(i))
+            return
+        wanted = iter(numbers)
+        target = next(wanted, None)
+        n = 0
         for line in f:
-            line = line.strip()
-            if not line:
+            if target is None:
+                return
+            if not line.strip():
                 continue
-            yield json.loads(line)
+            if n == target:
+                yield line
+                target = next(wanted, None)
+            n += 1
+
+
+def _read_sampled_records(path: Path, numbers: List[int], index: Optional[LineIndex]) -> Iterator[object]:
+    """Yield the parsed records with the given ascending record numbers."""
+    return map(json_loads, read_sampled_lines(path, numbers, index))
+
+
+RecordTransform = Optional[Callable[[Any], object]]
+
+
+def _parse_block(data: bytes, transform: RecordTransform) -> List[object]:
+    records: List[object] = []
+    tools: object = None
+    for line in data.split(b"\n"):
+        if not line.strip():
+            continue
+        sample = json_loads(line)
+        # equal inline tools payloads become one shared object, which pickle sends once per chunk
+        if isinstance(sample, dict) and "tools" in sample:
+            if sample["tools"] == tools:
+                sample["tools"] = tools
+            else:
+                tools = sample["tools"]
+        records.append(sample if transform is None else transform(sample))
+    return records
+
+
+def _parse_range(path: str, start: int, end: int, transform: RecordTransform) -> List[object]:
+    """Parse the non-empty lines of a newline-aligned byte range (runs in a parse worker)."""
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = mm[start:end]
+    return _parse_block(data, transform)
+
+
+class _ParallelJsonlReader:
+    """Parse JSONL files in worker processes, yielding records in file order.
+
+    Plain files are mmapped and cut into newline-aligned byte ranges that
+    workers parse independently; compressed files are decoded here and sent
+    to the workers as line-aligned blocks. At most 2 x workers parsed chunks
+    are held, so memory stays bounded however far the workers run ahead of
+    the consumer.
+
+    A picklable transform runs on each record inside the worker. Shipping the
+    built (smaller) record back is much cheaper than unpickling the whole
+    parsed sample in this process.
+    """
+
+    def __init__(self, workers: int, chunk_bytes: int = PARSE_CHUNK_BYTES) -> None:
+        self.workers = workers
+        self.chunk_bytes = chunk_bytes
+        self._pool = ProcessPoolExecutor(max_workers=workers)
+
+    def close(self) -> None:
+        self._pool.shutdown()
+
+    def read(
+        self, path: Path, *, skip: int = 0, transform: RecordTransform = None, index: Optional[LineIndex] = None
+    ) -> Iterator[object]:
+        """Yield parsed (and transformed) records; the first `skip` non-empty lines are passed over unparsed.
+
+        With an index, resuming seeks straight to the first wanted record and
+        plain files are cut into ranges at indexed record boundaries.
+        """
+        if compression_of(path) is None:
+            jobs = self._range_jobs(path, skip, index)
+        else:
+            jobs = self._block_jobs(path, skip, index)
+        # futures complete in any order; popping them in submission order is the reorder buffer
+        pending: Deque["Future[List[object]]"] = deque()
+        for fn, *job_args in jobs:
+            pending.append(self._pool.submit(fn, *job_args, transform))
+            if len(pending) >= 2 * self.workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+    def _range_jobs(self, path: Path, skip: int, index: Optional[LineIndex]) -> Iterator[Tuple[Any, ...]]:
+        if index is not None:
+            pos = index.offset(min(skip, len(index)))
+            size = index.offset(len(index))
+            while pos < size:
+                end = index.boundary(pos + self.chunk_bytes)
+                yield (_parse_range, str(path), pos, end)
+                pos = end
+            return
+        with path.open("rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = 0
+                # resume: step over the first `skip` non-empty lines without parsing them
+                while skip and pos < size:
+                    nl = mm.find(b"\n", pos)
+                    end = size if nl < 0 else nl + 1
+                    if mm[pos:end].strip():
+                        skip -= 1
+                    pos = end
+                while pos < size:
+                    nl = mm.find(b"\n", min(pos + self.chunk_bytes, size) - 1)
+                    end = size if nl < 0 else nl + 1
+                    yield (_parse_range, str(path), pos, end)
+                    pos = end
+
+    def _block_jobs(self, path: Path, skip: int, index: Optional[LineIndex]) -> Iterator[Tuple[Any, ...]]:
+        with open_decoded(path) as f:
+            if index is not None and skip:
+                f.seek(index.offset(min(skip, len(index))))
+                skip = 0
+            while skip:
+                line = f.readline()
+                if not line:
+                    return
+                if line.strip():
+                    skip -= 1
+            carry = b""
+            while True:
+                data = f.read(self.chunk_bytes)
+                if not data:
+                    break
+                data = carry + data
+                cut = data.rfind(b"\n") + 1
+                carry = data[cut:]
+                if cut:
+                    yield (_parse_block, data[:cut])
+            if carry.strip():
+                yield (_parse_block, carry)
+
+
+class ToolsDictionary:
+    """Lazily loaded tools.json sidecar used to expand samples' tools_ref."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._tools: Optional[Dict[str, object]] = None
+
+    def resolve(self, ref: str) -> object:
+        if self._tools is None:
+            if not self.path.exists():
+                raise ValueError(f"Sample has tools_ref but {self.path} does not exist")
+            with self.path.open("r", encoding="utf-8") as f:
+                self._tools = json.load(f)
+        if ref not in self._tools:
+            raise ValueError(f"Unknown tools_ref {ref!r} (not in {self.path})")
+        return self._tools[ref]
+
+
+def tools_dictionary_for(dataset_file: Path) -> ToolsDictionary:
+    return ToolsDictionary(dataset_file.parent / TOOLS_DICTIONARY_FILE)
 
 
 def _escape_filter_string_value(value: str) -> str:
     return value.replace("'", "\\'")
 
 
-def _build_dataset_record(sample: Dict[str, object], *, include_tools: bool) -> Dict[str, object]:
+def build_dataset_record(
+    sample: Dict[str, object],
+    *,
+    include_tools: bool,
+    tools_dictionary: Optional[ToolsDictionary] = None,
+) -> Dict[str, object]:
     messages = sample.get("messages")
     tools = sample.get("tools")
+    tools_ref = sample.get("tools_ref")
+    if include_tools and tools is None and isinstance(tools_ref, str) and tools_dictionary is not None:
+        tools = tools_dictionary.resolve(tools_ref)
 
     if not isinstance(messages, list) or len(messages) < 2:
         raise ValueError("Invalid sample: missing messages")
@@ -106,12 +706,34 @@ def _build_dataset_record(sample: Dict[str, object], *, include_tools: bool) ->
         "inputs": inputs,
     }
 
+    expectations: Dict[str, object] = {}
     if expected_response:
-        record["expectations"] = {"expected_response": expected_response}
+        expectations["expected_response"] = expected_response
 
+    tags: Dict[str, str] = {}
     md = sample.get("metadata")
     if isinstance(md, str):
-        record["tags"] = {"sample_metadata": md}
+        tags["sample_metadata"] = md
+
+    # forwarded as-is, so evaluators read the sensor context and expected risk without re-parsing the user message
+    structured = sample.get(STRUCTURED_FIELD)
+    if isinstance(structured, dict):
+        sensor_context = structured.get("sensor_context")
+        if isinstance(sensor_context, dict):
+            inputs["sensor_context"] = sensor_context
+        bucket = structured.get("bucket")
+        if isinstance(bucket, str):
+            tags["bucket"] = bucket
+        decision = structured.get("risk_decision")
+        if isinstance(decision, dict):
+            expectations["risk_decision"] = decision
+            tags["risk_type"] = str(decision.get("risk_type"))
+            tags["risk_tier"] = str(decision.get("tier"))
+
+    if expectations:
+        record["expectations"] = expectations
+    if tags:
+        record["tags"] = tags
 
     return record
 
@@ -124,14 +746,16 @@ def _upload_one_run(
     artifact_root: str,
     name_prefix: str,
     dataset_file: Path,
+    fingerprints: FingerprintCache,
 ) -> Tuple[str, str]:
     mlflow.set_tracking_uri(tracking_uri)
     mlflow.set_experiment(experiment_name)
 
-    split = _split_name(dataset_file)
+    split = split_name(dataset_file)
+    fp = fingerprints.get(dataset_file)
     line_count: Optional[int] = None
-    if dataset_file.suffix.lower() == ".jsonl":
-        line_count = _count_lines(dataset_file)
+    if _is_jsonl(dataset_file):
+        line_count = fp.lines
 
     run_name = _build_run_name(name_prefix, split, line_count)
 
@@ -140,8 +764,8 @@ def _upload_one_run(
         "split": split,
         "file_name": dataset_file.name,
         "relative_path": str(dataset_file.as_posix()),
-        "bytes": dataset_file.stat().st_size,
-        "sha256": _sha256(dataset_file),
+        "bytes": fp.bytes,
+        "sha256": fp.sha256,
         "created_at": datetime.now().isoformat(timespec="seconds"),
     }
     if line_count is not None:
@@ -154,6 +778,10 @@ def _upload_one_run(
 
         artifact_path = f"{artifact_root}/{run_name}"
         mlflow.log_artifact(str(dataset_file), artifact_path=artifact_path)
+        tools_file = dataset_file.parent / TOOLS_DICTIONARY_FILE
+        if tools_file.exists():
+            # samples written with --tools-format ref only resolve next to their tools.json
+            mlflow.log_artifact(str(tools_file), artifact_path=artifact_path)
         mlflow.log_dict(meta, f"{artifact_path}/metadata.json")
 
     return run_id, run_name
@@ -186,77 +814,348 @@ def _find_existing_dataset_id(*, client, experiment_id: str, dataset_name: str)
     return None
 
 
-def _register_evaluation_dataset(
+class _AdaptiveBatcher:
+    """AIMD batch sizing for merge_records, measured in serialized request bytes.
+
+    The byte target grows additively while merge_records answers within
+    target_latency and halves when it is slower or fails. A failed batch is
+    split in two and each half retried, so batches over a server request
+    limit shrink until they fit; a single record that still fails re-raises.
+    """
+
+    def __init__(
+        self,
+        merge_records: Callable[[List[Dict[str, object]]], None],
+        *,
+        initial_bytes: int,
+        max_bytes: int,
+        target_latency: float,
+    ) -> None:
+        self._merge_records = merge_records
+        self._lock = threading.Lock()
+        self.min_bytes = min(initial_bytes, 16 * 1024)
+        self.max_bytes = max(max_bytes, initial_bytes)
+        self.step = max(self.min_bytes, initial_bytes // 8)
+        self.target_latency = target_latency
+        self.target_bytes = initial_bytes
+        self.bytes_built = 0
+        self.splits = 0
+
+    @staticmethod
+    def record_size(record: Dict[str, object]) -> int:
+        # ASCII-escaped compact JSON: one byte per character, as sent on the wire
+        return len(json.dumps(record, separators=(",", ":")))
+
+    def merge(self, batch: List[Dict[str, object]]) -> None:
+        started = time.monotonic()
+        try:
+            self._merge_records(batch)
+        except Exception:
+            self._decrease()
+            if len(batch) <= 1:
+                raise
+            with self._lock:
+                self.splits += 1
+            mid = len(batch) // 2
+            self.merge(batch[:mid])
+            self.merge(batch[mid:])
+            return
+        if time.monotonic() - started > self.target_latency:
+            self._decrease()
+        else:
+            with self._lock:
+                self.target_bytes = min(self.max_bytes, self.target_bytes + self.step)
+
+    def _decrease(self) -> None:
+        with self._lock:
+            self.target_bytes = max(self.min_bytes, self.target_bytes // 2)
+
+
+def _iter_record_batches(
+    dataset_file: Path,
     *,
-    tracking_uri: str,
-    experiment_name: str,
+    batch_size: int,
+    include_tools: bool,
+    skip: int = 0,
+    batcher: Optional[_AdaptiveBatcher] = None,
+    reader: Optional[_ParallelJsonlReader] = None,
+    index: Optional[LineIndex] = None,
+    sample: Optional[List[int]] = None,
+) -> Iterator[List[Dict[str, object]]]:
+    """Yield lists of dataset records.
+
+    Batches hold at most batch_size records; with a batcher they are also cut
+    once their serialized size reaches its current byte target. With a reader,
+    JSONL parsing runs in its worker processes. With sample, only those record
+    numbers are read (skip then counts sampled records).
+    """
+    build = functools.partial(
+        build_dataset_record, include_tools=include_tools, tools_dictionary=tools_dictionary_for(dataset_file)
+    )
+    records: Iterable[Dict[str, object]]
+    if sample is not None:
+        records = map(build, _read_sampled_records(dataset_file, sample[skip:], index))
+    elif reader is not None and _is_jsonl(dataset_file):
+        records = reader.read(dataset_file, skip=skip, transform=build, index=index)
+    else:
+        records = map(build, _read_jsonl_records(dataset_file, skip=skip, index=index))
+    batch: List[Dict[str, object]] = []
+    batch_bytes = 0
+    for record in records:
+        batch.append(record)
+        if batcher is not None:
+            size = batcher.record_size(record)
+            batcher.bytes_built += size
+            batch_bytes += size
+            if batch_bytes >= batcher.target_bytes:
+                yield batch
+                batch = []
+                batch_bytes = 0
+                continue
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+            batch_bytes = 0
+    if batch:
+        yield batch
+
+
+def _send_batches(
+    merge_records: Callable[[List[Dict[str, object]]], None],
+    batches: Iterable[List[Dict[str, object]]],
+    *,
+    sender_threads: int,
+    queue_depth: int,
+    on_commit: Optional[Callable[[int], None]] = None,
+) -> int:
+    """Call merge_records for each batch from a pool of sender threads.
+
+    The calling thread keeps reading and building records while senders wait on
+    the tracking server. The queue is bounded, so the reader blocks once it is
+    queue_depth batches ahead. The first sender error is re-raised.
+
+    on_commit receives the number of records in the longest prefix of batches
+    that have all been merged, whenever that prefix grows.
+    """
+    pending: "queue.Queue[Optional[Tuple[int, List[Dict[str, object]]]]]" = queue.Queue(maxsize=max(1, queue_depth))
+    errors: List[BaseException] = []
+    lock = threading.Lock()
+    sent = 0
+    committed = 0
+    next_seq = 0
+    finished: Dict[int, int] = {}
+
+    def sender() -> None:
+        nonlocal sent, committed, next_seq
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            if errors:
+                # keep draining so the reader never blocks on a dead pipeline
+                continue
+            seq, batch = item
+            try:
+                merge_records(batch)
+            except BaseException as e:
+                errors.append(e)
+                continue
+            with lock:
+                sent += len(batch)
+                finished[seq] = len(batch)
+                if next_seq not in finished:
+                    continue
+                while next_seq in finished:
+                    committed += finished.pop(next_seq)
+                    next_seq += 1
+                if on_commit is not None:
+                    on_commit(committed)
+
+    threads = [threading.Thread(target=sender, name=f"merge-records-{i}", daemon=True) for i in range(max(1, sender_threads))]
+    for t in threads:
+        t.start()
+    try:
+        for seq, batch in enumerate(batches):
+            if errors:
+                break
+            pending.put((seq, batch))
+    finally:
+        for _ in threads:
+            pending.put(None)
+        for t in threads:
+            t.join()
+    if errors:
+        raise errors[0]
+    return sent
+
+
+def register_evaluation_dataset(
+    *,
+    client,
+    experiment_id: str,
     name_prefix: str,
     dataset_file: Path,
     batch_size: int,
     include_tools: bool,
     if_exists: str,
+    fingerprints: FingerprintCache,
+    sender_threads: int = 1,
+    queue_depth: int = 2,
+    checkpoint: Optional[_UploadCheckpoint] = None,
+    batch_bytes: int = 0,
+    max_batch_bytes: int = 0,
+    target_latency: float = 2.0,
+    reader: Optional[_ParallelJsonlReader] = None,
+    manifest: Optional[_ManifestUploads] = None,
+    build_index: bool = False,
+    sample: int = 0,
+    sample_seed: int = 0,
 ) -> Dict[str, str]:
-    import mlflow
-    from mlflow.tracking import MlflowClient
-
-    mlflow.set_tracking_uri(tracking_uri)
-
-    client = MlflowClient()
-    experiment_id = _get_or_create_experiment_id(client=client, experiment_name=experiment_name)
-
-    split = _split_name(dataset_file)
+    split = split_name(dataset_file)
+    fp = fingerprints.get(dataset_file)
     line_count: Optional[int] = None
-    if dataset_file.suffix.lower() == ".jsonl":
-        line_count = _count_lines(dataset_file)
-
-    dataset_name = _build_run_name(name_prefix, split, line_count)
+    index: Optional[LineIndex] = None
+    if _is_jsonl(dataset_file):
+        line_count = fp.lines
+        index = LineIndex.open(dataset_file, build=build_index)
+    try:
+        sample_numbers: Optional[List[int]] = None
+        if sample > 0 and line_count is not None:
+            # a sample is its own dataset, named after the seed it was drawn with
+            sample_numbers = _sample_record_numbers(len(index) if index is not None else line_count, sample, sample_seed)
+            split = f"{split}_sample{sample_seed}"
+        dataset_name = _build_run_name(
+            name_prefix, split, len(sample_numbers) if sample_numbers is not None else line_count
+        )
 
-    existing_id = _find_existing_dataset_id(client=client, experiment_id=experiment_id, dataset_name=dataset_name)
-    if existing_id is not None:
-        if if_exists == "skip":
-            return {"dataset_id": existing_id, "dataset_name": dataset_name, "status": "skipped"}
-        if if_exists == "merge":
+        existing_id = _find_existing_dataset_id(client=client, experiment_id=experiment_id, dataset_name=dataset_name)
+        checkpoint_key = f"{experiment_id}/{dataset_name}"
+        uploaded = manifest.get(checkpoint_key) if manifest is not None else None
+        if (
+            # an explicit skip/replace wins over the manifest, as it does over a checkpoint
+            if_exists in ("error", "merge")
+            and uploaded is not None
+            and existing_id is not None
+            and uploaded.get("dataset_id") == existing_id
+            and uploaded.get("sha256") == fp.sha256
+        ):
+            return {"dataset_id": existing_id, "dataset_name": dataset_name, "status": "unchanged"}
+        resume = checkpoint.get(checkpoint_key) if checkpoint is not None else None
+        if resume is not None and (resume.get("dataset_id") != existing_id or resume.get("sha256") != fp.sha256):
+            # dataset was removed or the file changed since the interrupted run
+            resume = None
+        if resume is not None and if_exists in ("skip", "replace"):
+            # an explicit skip/replace wins over finishing the interrupted upload
+            assert checkpoint is not None
+            checkpoint.clear(checkpoint_key)
+            resume = None
+
+        skip = 0
+        if resume is not None:
             dataset = client.get_dataset(existing_id)
-        elif if_exists == "replace":
-            client.delete_dataset(dataset_id=existing_id)
-            dataset = None
+            skip = int(resume.get("records", 0))
+        elif existing_id is not None:
+            if if_exists == "skip":
+                return {"dataset_id": existing_id, "dataset_name": dataset_name, "status": "skipped"}
+            if if_exists == "merge":
+                dataset = client.get_dataset(existing_id)
+            elif if_exists == "replace":
+                client.delete_dataset(dataset_id=existing_id)
+                dataset = None
+            else:
+                raise RuntimeError(
+                    f"Dataset already exists: {dataset_name} (dataset_id={existing_id}). "
+                    f"Use --if-exists merge/replace/skip"
+                )
         else:
-            raise RuntimeError(
-                f"Dataset already exists: {dataset_name} (dataset_id={existing_id}). "
-                f"Use --if-exists merge/replace/skip"
-            )
-    else:
-        dataset = None
-
-    tags: Dict[str, object] = {
-        "name_prefix": name_prefix,
-        "split": split,
-        "file_name": dataset_file.name,
-        "bytes": dataset_file.stat().st_size,
-        "sha256": _sha256(dataset_file),
-        "created_at": datetime.now().isoformat(timespec="seconds"),
-    }
-    if line_count is not None:
-        tags["lines"] = line_count
-
-    if dataset is None:
-        dataset = client.create_dataset(name=dataset_name, experiment_id=experiment_id, tags=tags)
-
-    batch: List[Dict[str, object]] = []
-    total = 0
-    for sample in _read_jsonl_records(dataset_file):
-        record = _build_dataset_record(sample, include_tools=include_tools)
-        batch.append(record)
-        if len(batch) >= batch_size:
-            dataset.merge_records(batch)
-            total += len(batch)
-            batch.clear()
+            dataset = None
 
-    if batch:
-        dataset.merge_records(batch)
-        total += len(batch)
+        tags: Dict[str, object] = {
+            "name_prefix": name_prefix,
+            "split": split,
+            "file_name": dataset_file.name,
+            "bytes": fp.bytes,
+            "sha256": fp.sha256,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        if line_count is not None:
+            tags["lines"] = line_count
+        if sample_numbers is not None:
+            tags["lines"] = len(sample_numbers)
+            tags["sampled_from"] = line_count
+            tags["sample_seed"] = sample_seed
+
+        if dataset is None:
+            dataset = client.create_dataset(name=dataset_name, experiment_id=experiment_id, tags=tags)
+
+        on_commit: Optional[Callable[[int], None]] = None
+        if checkpoint is not None:
+            dataset_id = dataset.dataset_id
+
+            def on_commit(records: int) -> None:
+                checkpoint.update(
+                    checkpoint_key,
+                    dataset_id=dataset_id,
+                    file=str(dataset_file),
+                    sha256=fp.sha256,
+                    records=skip + records,
+                )
+
+            on_commit(0)
+
+        batcher: Optional[_AdaptiveBatcher] = None
+        merge_records = dataset.merge_records
+        if batch_bytes > 0:
+            batcher = _AdaptiveBatcher(
+                dataset.merge_records,
+                initial_bytes=batch_bytes,
+                max_bytes=max_batch_bytes or 8 * batch_bytes,
+                target_latency=target_latency,
+            )
+            merge_records = batcher.merge
+
+        started = time.monotonic()
+        sent = _send_batches(
+            merge_records,
+            _iter_record_batches(
+                dataset_file,
+                batch_size=batch_size,
+                include_tools=include_tools,
+                skip=skip,
+                batcher=batcher,
+                reader=reader,
+                index=index,
+                sample=sample_numbers,
+            ),
+            sender_threads=sender_threads,
+            queue_depth=queue_depth,
+            on_commit=on_commit,
+        )
+        elapsed = max(time.monotonic() - started, 1e-9)
+        if checkpoint is not None:
+            checkpoint.clear(checkpoint_key)
+        if manifest is not None:
+            manifest.record(
+                checkpoint_key, dataset_id=dataset.dataset_id, file=dataset_file.name, sha256=fp.sha256, records=skip + sent
+            )
 
-    return {"dataset_id": dataset.dataset_id, "dataset_name": dataset_name, "status": "created", "records": str(total)}
+        info = {
+            "dataset_id": dataset.dataset_id,
+            "dataset_name": dataset_name,
+            "status": "resumed" if resume is not None else "created",
+            "records": str(skip + sent),
+        }
+        if resume is not None:
+            info["resumed_from"] = str(skip)
+        info["records_per_s"] = f"{sent / elapsed:.1f}"
+        if batcher is not None:
+            info["mb_per_s"] = f"{batcher.bytes_built / elapsed / 1_000_000:.2f}"
+            info["final_batch_bytes"] = str(batcher.target_bytes)
+            info["batch_splits"] = str(batcher.splits)
+        return info
+    finally:
+        if index is not None:
+            index.close()
 
 
 def main() -> int:
@@ -266,28 +1165,107 @@ def main() -> int:
     p.add_argument("--dataset-dir", default="DataSet")
     p.add_argument("--name-prefix", default="aegis_fc240m_toolcall_policyV1")
     p.add_argument("--mode", choices=["datasets", "artifacts"], default="datasets")
-    p.add_argument("--batch-size", type=int, default=200)
+    p.add_argument("--batch-size", type=int, default=200, help="Max records per merge_records call")
+    p.add_argument(
+        "--batch-bytes",
+        type=int,
+        default=0,
+        help="Adaptive mode: initial serialized bytes per merge_records call, tuned by latency/errors (0 = fixed --batch-size)",
+    )
+    p.add_argument("--max-batch-bytes", type=int, default=0, help="Adaptive mode ceiling (default: 8 x --batch-bytes)")
+    p.add_argument(
+        "--target-latency",
+        type=float,
+        default=2.0,
+        help="Adaptive mode: merge_records latency in seconds above which batches shrink",
+    )
     p.add_argument("--include-tools", action="store_true", default=False)
     p.add_argument("--if-exists", choices=["error", "skip", "merge", "replace"], default="error")
     p.add_argument("--artifact-root", default="datasets")
     p.add_argument("--include-json", action="store_true", default=False)
     p.add_argument("--per-split", action="store_true", default=True)
+    p.add_argument(
+        "--no-fingerprint-cache",
+        action="store_true",
+        default=False,
+        help=f"Do not read or write {FINGERPRINT_CACHE_FILE} (always rescan files for size/lines/sha256)",
+    )
+    p.add_argument("--concurrency", type=int, default=1, help="Dataset files registered in parallel (datasets mode)")
+    p.add_argument("--sender-threads", type=int, default=1, help="Threads calling merge_records per dataset file")
+    p.add_argument(
+        "--queue-depth",
+        type=int,
+        default=0,
+        help="Max parsed batches buffered ahead of the senders per file (default: 2 x --sender-threads)",
+    )
+    p.add_argument(
+        "--no-resume",
+        action="store_true",
+        default=False,
+        help=f"Ignore and do not write {CHECKPOINT_FILE}; interrupted uploads then need --if-exists merge/replace",
+    )
+    p.add_argument(
+        "--no-manifest",
+        action="store_true",
+        default=False,
+        help=f"Do not read or update the uploads section of {BUILD_MANIFEST_FILE} (unchanged files are then re-registered)",
+    )
+    p.add_argument(
+        "--build-index",
+        action="store_true",
+        default=False,
+        help=f"Write a {INDEX_SUFFIX} line index for JSONL files without a current one (used for resume, "
+        "parse ranges and --sample)",
+    )
+    p.add_argument(
+        "--sample",
+        type=int,
+        default=0,
+        help="Datasets mode: register N records drawn uniformly from each file instead of all of them, "
+        "as a separate <split>_sample<seed> dataset (0 = whole file)",
+    )
+    p.add_argument("--sample-seed", type=int, default=0, help="Seed for --sample")
+    p.add_argument(
+        "--parse-workers",
+        type=int,
+        default=1,
+        help=f"Processes parsing JSONL in parallel, shared by all files (1 = parse inline; JSON backend: {JSON_BACKEND})",
+    )
     args = p.parse_args()
 
     if not args.tracking_uri:
         print("ERROR: --tracking-uri is required (or set MLFLOW_TRACKING_URI)", file=sys.stderr)
         return 2
 
+    if (
+        args.concurrency < 1
+        or args.sender_threads < 1
+        or args.parse_workers < 1
+        or args.queue_depth < 0
+        or args.sample < 0
+    ):
+        print(
+            "ERROR: --concurrency, --sender-threads and --parse-workers must be >= 1, --queue-depth and --sample >= 0",
+            file=sys.stderr,
+        )
+        return 2
+
     dataset_dir = Path(args.dataset_dir)
     if not dataset_dir.exists() or not dataset_dir.is_dir():
         print(f"ERROR: dataset dir not found: {dataset_dir}", file=sys.stderr)
         return 2
 
-    files = _discover_dataset_files_with_options(dataset_dir, include_json=args.include_json)
+    try:
+        files = _discover_dataset_files_with_options(dataset_dir, include_json=args.include_json)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
     if not files:
         print(f"ERROR: no dataset files found under {dataset_dir}", file=sys.stderr)
         return 2
 
+    fingerprints = FingerprintCache(None if args.no_fingerprint_cache else dataset_dir / FINGERPRINT_CACHE_FILE)
+
     if args.mode == "artifacts":
         try:
             import mlflow  # type: ignore
@@ -305,28 +1283,74 @@ def main() -> int:
                 artifact_root=args.artifact_root,
                 name_prefix=args.name_prefix,
                 dataset_file=f,
+                fingerprints=fingerprints,
             )
             uploaded.append({"file": str(f), "run_id": run_id, "run_name": run_name})
+            fingerprints.save()
             print(json.dumps(uploaded[-1], ensure_ascii=False))
     else:
-        created: List[Dict[str, str]] = []
-        for f in files:
-            info = _register_evaluation_dataset(
-                tracking_uri=args.tracking_uri,
-                experiment_name=args.experiment,
+        try:
+            import mlflow  # type: ignore
+            from mlflow.tracking import MlflowClient  # type: ignore
+        except Exception as e:
+            print("ERROR: failed to import mlflow. Install first: pip install mlflow", file=sys.stderr)
+            print(f"DETAIL: {e}", file=sys.stderr)
+            return 2
+
+        mlflow.set_tracking_uri(args.tracking_uri)
+        client = MlflowClient()
+        experiment_id = _get_or_create_experiment_id(client=client, experiment_name=args.experiment)
+        checkpoint = None if args.no_resume else _UploadCheckpoint(dataset_dir / CHECKPOINT_FILE)
+        manifest = None if args.no_manifest else _ManifestUploads(dataset_dir / BUILD_MANIFEST_FILE)
+
+        def register(f: Path) -> Dict[str, str]:
+            info = register_evaluation_dataset(
+                client=client,
+                experiment_id=experiment_id,
                 name_prefix=args.name_prefix,
                 dataset_file=f,
                 batch_size=args.batch_size,
                 include_tools=args.include_tools,
                 if_exists=args.if_exists,
+                fingerprints=fingerprints,
+                sender_threads=args.sender_threads,
+                queue_depth=args.queue_depth or 2 * args.sender_threads,
+                checkpoint=checkpoint,
+                batch_bytes=args.batch_bytes,
+                max_batch_bytes=args.max_batch_bytes,
+                target_latency=args.target_latency,
+                reader=reader,
+                manifest=manifest,
+                build_index=args.build_index,
+                sample=args.sample,
+                sample_seed=args.sample_seed,
             )
             info["file"] = str(f)
-            created.append(info)
-            print(json.dumps(info, ensure_ascii=False))
+            return info
 
-    summary_path = dataset_dir / "mlflow_upload_summary.json"
+        reader = _ParallelJsonlReader(args.parse_workers) if args.parse_workers > 1 else None
+        created: List[Dict[str, str]] = []
+        try:
+            # results are consumed in file order, so output and summary do not
+            # depend on which file finishes first
+            with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="register") as pool:
+                for info in pool.map(register, files):
+                    created.append(info)
+                    fingerprints.save()
+                    print(json.dumps(info, ensure_ascii=False))
+        finally:
+            if reader is not None:
+                reader.close()
+
+    summary_path = dataset_dir / SUMMARY_FILE
     with summary_path.open("w", encoding="utf-8") as out:
-        json.dump({"mode": args.mode, "files": [str(f) for f in files]}, out, ensure_ascii=False, indent=2)
+        results = uploaded if args.mode == "artifacts" else created
+        json.dump(
+            {"mode": args.mode, "files": [str(f) for f in files], "results": results},
+            out,
+            ensure_ascii=False,
+            indent=2,
+        )
 
     return 0
 
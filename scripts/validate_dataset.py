@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""Validate JSONL datasets against ToolSchema before upload.
+
+Every line must be a JSON object whose messages carry a SENSOR_CONTEXT that
+matches the context tool schemas and whose assistant tool_calls match the
+action tool schemas. Plain .jsonl files are split into byte ranges at line
+boundaries and validated in a process pool; .jsonl.gz / .jsonl.zst files are
+decoded once in this process and handed to the pool in line-aligned blocks.
+
+    python scripts/validate_dataset.py DataSet/train.jsonl DataSet/eval_a.jsonl.gz
+
+Prints a JSON report with per-error-class counts and example line numbers,
+and exits 1 if any line is invalid.
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import generate_dataset as gen
+import upload_mlflow_datasets as up
+
+
+CHUNK_BYTES = 8 * 1024 * 1024
+MAX_EXAMPLES = 20
+
+_decoder = json.JSONDecoder()
+
+
+@dataclass
+class ChunkReport:
+    lines: int = 0  # non-empty lines seen
+    invalid: int = 0
+    # error class -> count, and up to MAX_EXAMPLES (line number, message) pairs
+    counts: Dict[str, int] = field(default_factory=dict)
+    examples: Dict[str, List[Tuple[int, str]]] = field(default_factory=dict)
+    newlines: int = 0  # physical lines in the chunk, for numbering the next chunk
+
+    def add_error(self, error_class: str, line_no: int, message: str, max_examples: int) -> None:
+        self.counts[error_class] = self.counts.get(error_class, 0) + 1
+        examples = self.examples.setdefault(error_class, [])
+        if len(examples) < max_examples:
+            examples.append((line_no, message))
+
+    def merge(self, other: "ChunkReport", line_offset: int, max_examples: int) -> None:
+        self.lines += other.lines
+        self.invalid += other.invalid
+        self.newlines += other.newlines
+        for error_class, n in other.counts.items():
+            self.counts[error_class] = self.counts.get(error_class, 0) + n
+            examples = self.examples.setdefault(error_class, [])
+            for line_no, message in other.examples[error_class][: max_examples - len(examples)]:
+                examples.append((line_no + line_offset, message))
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "lines": self.lines,
+            "valid": self.lines - self.invalid,
+            "invalid": self.invalid,
+            "errors": {
+                error_class: {
+                    "count": self.counts[error_class],
+                    "examples": [{"line": line_no, "message": message} for line_no, message in self.examples[error_class]],
+                }
+                for error_class in sorted(self.counts, key=lambda c: -self.counts[c])
+            },
+        }
+
+
+class _LineError(Exception):
+    def __init__(self, error_class: str, message: str) -> None:
+        super().__init__(message)
+        self.error_class = error_class
+
+
+def _validate_sensor_context(schemas: gen.ToolSchemaSet, content: str) -> None:
+    start = content.find(gen.SENSOR_CONTEXT_MARKER)
+    if start < 0:
+        return
+    try:
+        sensor_context, _ = _decoder.raw_decode(content, start + len(gen.SENSOR_CONTEXT_MARKER))
+    except json.JSONDecodeError as e:
+        raise _LineError("sensor_context_json", f"SENSOR_CONTEXT is not valid JSON: {e.msg}") from None
+    if not isinstance(sensor_context, dict):
+        raise _LineError("sensor_context_json", "SENSOR_CONTEXT is not an object")
+    for tool_name, params in sensor_context.items():
+        validate = schemas.context_validators.get(tool_name)
+        if validate is None:
+            raise _LineError("unknown_context_tool", f"unknown context tool '{tool_name}'")
+        try:
+            validate(params, "context:" + tool_name)
+        except gen.SchemaError as e:
+            raise _LineError("context_schema", str(e)) from None
+
+
+def _validate_tool_calls(schemas: gen.ToolSchemaSet, tool_calls: Any) -> None:
+    if not isinstance(tool_calls, list):
+        raise _LineError("tool_call_shape", "tool_calls is not a list")
+    for call in tool_calls:
+        fn = call.get("function") if isinstance(call, dict) else None
+        if not isinstance(fn, dict) or not isinstance(fn.get("name"), str):
+            raise _LineError("tool_call_shape", "tool call without function.name")
+        name = fn["name"]
+        validate = schemas.action_validators.get(name)
+        if validate is None:
+            raise _LineError("unknown_action_tool", f"unknown action tool '{name}'")
+        args = fn.get("arguments", {})
+        if isinstance(args, str):
+            # OpenAI-style payloads carry arguments as a JSON string
+            try:
+                args = json.loads(args)
+            except json.JSONDecodeError as e:
+                raise _LineError("tool_call_shape", f"{name}: arguments are not valid JSON: {e.msg}") from None
+        try:
+            validate(args, "action:" + name)
+        except gen.SchemaError as e:
+            raise _LineError("action_schema", str(e)) from None
+
+
+def validate_record(schemas: gen.ToolSchemaSet, line: bytes) -> None:
+    """Raise _LineError if one JSONL line does not match the tool schemas."""
+    try:
+        sample = json.loads(line)
+    except ValueError as e:
+        raise _LineError("invalid_json", str(e)) from None
+    messages = sample.get("messages") if isinstance(sample, dict) else None
+    if not isinstance(messages, list):
+        raise _LineError("missing_messages", "record has no messages list")
+    for message in messages:
+        if not isinstance(message, dict):
+            raise _LineError("missing_messages", "message is not an object")
+        content = message.get("content")
+        if message.get("role") == "user" and isinstance(content, str):
+            _validate_sensor_context(schemas, content)
+        if "tool_calls" in message:
+            _validate_tool_calls(schemas, message["tool_calls"])
+
+
+def validate_lines(schemas: gen.ToolSchemaSet, data: bytes, max_examples: int) -> ChunkReport:
+    """Validate a block of whole lines; line numbers in the report are 1-based within the block."""
+    report = ChunkReport()
+    lines = data.split(b"\n")
+    if lines and lines[-1] == b"":
+        lines.pop()
+    report.newlines = len(lines)
+    for i, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        report.lines += 1
+        try:
+            validate_record(schemas, line)
+        except _LineError as e:
+            report.invalid += 1
+            report.add_error(e.error_class, i, str(e), max_examples)
+    return report
+
+
+_WORKER_SCHEMAS: Optional[gen.ToolSchemaSet] = None
+
+
+def _init_worker(tool_schema_dir: str) -> None:
+    global _WORKER_SCHEMAS
+    _WORKER_SCHEMAS = gen.load_tool_schema_set(tool_schema_dir)
+
+
+def _validate_range(path: str, start: int, end: int, max_examples: int) -> ChunkReport:
+    assert _WORKER_SCHEMAS is not None
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return validate_lines(_WORKER_SCHEMAS, data, max_examples)
+
+
+def _validate_block(data: bytes, max_examples: int) -> ChunkReport:
+    assert _WORKER_SCHEMAS is not None
+    return validate_lines(_WORKER_SCHEMAS, data, max_examples)
+
+
+def line_aligned_ranges(path: Path, chunk_bytes: int) -> List[Tuple[int, int]]:
+    """Split a file into [start, end) byte ranges that each end just after a newline (or at EOF)."""
+    size = path.stat().st_size
+    ranges: List[Tuple[int, int]] = []
+    start = 0
+    with path.open("rb") as f:
+        while start < size:
+            end = min(start + chunk_bytes, size)
+            if end < size:
+                f.seek(end)
+                rest = f.readline()
+                end += len(rest)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def iter_line_blocks(path: Path, chunk_bytes: int) -> Iterator[bytes]:
+    """Yield decoded, line-aligned blocks of roughly chunk_bytes from a (possibly compressed) file."""
+    with up.open_decoded(path) as f:
+        carry = b""
+        while True:
+            data = f.read(chunk_bytes)
+            if not data:
+                break
+            data = carry + data
+            cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                carry = data
+                continue
+            carry = data[cut:]
+            yield data[:cut]
+        if carry:
+            yield carry
+
+
+def _ordered_results(pool: ProcessPoolExecutor, jobs: Iterator[Tuple[Any, ...]], window: int) -> Iterator[ChunkReport]:
+    """Submit jobs with at most `window` in flight and yield their results in submission order."""
+    pending: Deque["Future[ChunkReport]"] = deque()
+    for job in jobs:
+        pending.append(pool.submit(*job))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def validate_file(
+    pool: ProcessPoolExecutor, path: Path, *, workers: int, chunk_bytes: int, max_examples: int
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    jobs: Iterator[Tuple[Any, ...]]
+    if up.compression_of(path) is None:
+        jobs = ((_validate_range, str(path), s, e, max_examples) for s, e in line_aligned_ranges(path, chunk_bytes))
+    else:
+        # compressed streams cannot be split by offset; decode here, validate in the pool
+        jobs = ((_validate_block, block, max_examples) for block in iter_line_blocks(path, chunk_bytes))
+
+    report = ChunkReport()
+    for chunk in _ordered_results(pool, jobs, window=workers * 2):
+        report.merge(chunk, report.newlines, max_examples)
+    elapsed = time.perf_counter() - started
+    size = path.stat().st_size  # on-disk bytes, so compressed files report compressed throughput
+
+    result: Dict[str, Any] = {"file": str(path), "bytes": size}
+    result.update(report.to_json())
+    result["elapsed_s"] = round(elapsed, 3)
+    result["mb_per_s"] = round(size / 1e6 / elapsed, 2) if elapsed > 0 else 0.0
+    return result
+
+
+def main() -> int:
+    repo_root = Path(__file__).resolve().parent.parent
+    p = argparse.ArgumentParser()
+    p.add_argument("files", nargs="+", help="JSONL files to validate (.jsonl, .jsonl.gz, .jsonl.zst)")
+    p.add_argument("--tool-schema-dir", default=str(repo_root / "ToolSchema"))
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Validation processes")
+    p.add_argument("--chunk-bytes", type=int, default=CHUNK_BYTES, help="Bytes of lines per validation task")
+    p.add_argument("--max-examples", type=int, default=MAX_EXAMPLES, help="Line numbers kept per error class")
+    args = p.parse_args()
+
+    if args.workers < 1:
+        p.error("--workers must be >= 1")
+    if args.chunk_bytes < 1:
+        p.error("--chunk-bytes must be >= 1")
+    paths = [Path(f) for f in args.files]
+    for path in paths:
+        if not path.is_file():
+            p.error(f"not a file: {path}")
+        if up.compression_of(path) == "zstd":
+            try:
+                gen.require_zstandard()
+            except RuntimeError as e:
+                p.error(str(e))
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.tool_schema_dir,)) as pool:
+        results = [
+            validate_file(pool, path, workers=args.workers, chunk_bytes=args.chunk_bytes, max_examples=args.max_examples)
+            for path in paths
+        ]
+
+    print(json.dumps({"results": results}, ensure_ascii=False, indent=2))
+    return 1 if any(r["invalid"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())